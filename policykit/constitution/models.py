@@ -489,6 +489,9 @@ class EditorModel(ConstitutionAction):
         policy.notify = self.notify
         policy.success = self.success
         policy.fail = self.fail
+        # give the new version of the policy a fresh time budget
+        policy.budget_violations = 0
+        policy.is_degraded = False
         policy.save()
         policy.action_types.set(self.action_types.all())
         self.parse_policy_variables(save=True)
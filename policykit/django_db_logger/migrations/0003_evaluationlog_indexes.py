@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_db_logger', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evaluationlog',
+            index=models.Index(fields=['community', 'create_datetime'], name='django_db_l_communi_bfed20_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evaluationlog',
+            index=models.Index(fields=['create_datetime'], name='django_db_l_create__422d6b_idx'),
+        ),
+    ]
@@ -33,6 +33,11 @@ class EvaluationLog(models.Model):
     class Meta:
         ordering = ("-create_datetime",)
         verbose_name_plural = verbose_name = "Logging"
+        # for the logs of a community, and for pruning them (see policyengine/retention.py)
+        indexes = [
+            models.Index(fields=["community", "create_datetime"]),
+            models.Index(fields=["create_datetime"]),
+        ]
 
     def action(self):
         if self.proposal and self.proposal.action:
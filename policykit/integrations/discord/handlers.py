@@ -4,17 +4,14 @@ from django.dispatch import receiver
 from integrations.discord.models import (
     DiscordCommunity,
     DiscordSlashCommand,
+    DiscordUser,
     DISCORD_SLASH_COMMAND_NAME,
     DISCORD_SLASH_COMMAND_OPTION,
 )
 from metagov.core.signals import governance_process_updated, platform_event_created
 from metagov.plugins.discord.models import Discord, DiscordVote
-from policyengine.models import (
-    BooleanVote,
-    NumberVote,
-    Proposal,
-    ChoiceVote,
-)
+from policyengine import vote_sync
+from policyengine.models import Proposal
 
 logger = logging.getLogger(__name__)
 
@@ -130,33 +127,10 @@ def discord_vote_updated_receiver(sender, instance, status, outcome, errors, **k
         logger.warn(f"No DiscordCommunity matches {instance}")
         return
 
-    votes = outcome["votes"]
-    is_boolean_vote = set(votes.keys()) == {"yes", "no"}
-
-    ### 1) Count boolean vote
-    if is_boolean_vote:
-        for (vote_option, result) in votes.items():
-            boolean_value = True if vote_option == "yes" else False
-            for u in result["users"]:
-                user, _ = discord_community._get_or_create_user(user_id=u)
-                existing_vote = BooleanVote.objects.filter(proposal=proposal, user=user).first()
-                if existing_vote is None:
-                    logger.debug(f"Counting boolean vote {boolean_value} by {user}")
-                    BooleanVote.objects.create(proposal=proposal, user=user, boolean_value=boolean_value)
-                elif existing_vote.boolean_value != boolean_value:
-                    logger.debug(f"Counting boolean vote {boolean_value} by {user} (vote changed)")
-                    existing_vote.boolean_value = boolean_value
-                    existing_vote.save()
-    ### 2) Count choice vote
-    else:
-        for (vote_option, result) in votes.items():
-            for u in result["users"]:
-                user, _ = discord_community._get_or_create_user(user_id=u)
-                existing_vote = ChoiceVote.objects.filter(proposal=proposal, user=user).first()
-                if existing_vote is None:
-                    logger.debug(f"Counting vote for {vote_option} by {user} for proposal {proposal}")
-                    ChoiceVote.objects.create(proposal=proposal, user=user, value=vote_option)
-                elif existing_vote.value != vote_option:
-                    logger.debug(f"Counting vote for {vote_option} by {user} for proposal {proposal} (vote changed)")
-                    existing_vote.value = vote_option
-                    existing_vote.save()
+    vote_sync.sync_option_votes(
+        proposal,
+        outcome["votes"],
+        lambda user_ids: vote_sync.get_or_create_users(
+            DiscordUser, discord_community, user_ids, to_username=lambda user_id: f"{user_id}:{discord_community.team_id}"
+        ),
+    )
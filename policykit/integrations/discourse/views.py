@@ -148,9 +148,7 @@ def initiate_action_vote(proposal, users=None, text=None, topic_id=None):
 
     res = policy.community.make_call(call, values=data)
     data['id'] = res['id']
-    _ = LogAPICall.objects.create(community=policy.community,
-                                  call_type=call,
-                                  extra_info=json.dumps(data))
+    LogAPICall.log_call(policy.community, call, data)
 
     if action.kind == BaseAction.PLATFORM:
         proposal.vote_post_id = res['id']
@@ -4,7 +4,8 @@ from django.dispatch import receiver
 from integrations.github.models import GithubCommunity, GithubUser
 from metagov.core.signals import governance_process_updated, platform_event_created
 from metagov.plugins.github.models import Github, GithubIssueReactVote
-from policyengine.models import BooleanVote, Proposal
+from policyengine import vote_sync
+from policyengine.models import Proposal
 
 logger = logging.getLogger(__name__)
 
@@ -42,16 +43,12 @@ def github_vote_updated_receiver(sender, instance, status, outcome, errors, **kw
     votes = outcome["votes"]
 
     # Expect this process to be a boolean vote
-    for (k, v) in votes.items():
-        assert k == "yes" or k == "no"
-        reaction_bool = True if k == "yes" else False
-        for u in v["users"]:
-            user, _ = GithubUser.objects.get_or_create(username=u, readable_name=u, community=github_community)
-            existing_vote = BooleanVote.objects.filter(proposal=proposal, user=user).first()
-            if existing_vote is None:
-                logger.debug(f"Casting boolean vote {reaction_bool} by {user} for {proposal.action}")
-                BooleanVote.objects.create(proposal=proposal, user=user, boolean_value=reaction_bool)
-            elif existing_vote.boolean_value != reaction_bool:
-                logger.debug(f"Casting boolean vote {reaction_bool} by {user} for {proposal.action} (vote changed)")
-                existing_vote.boolean_value = reaction_bool
-                existing_vote.save()
+    assert set(votes.keys()) <= {"yes", "no"}
+    vote_sync.sync_option_votes(
+        proposal,
+        votes,
+        lambda user_ids: vote_sync.get_or_create_users(
+            GithubUser, github_community, user_ids, defaults=lambda username: {"readable_name": username}
+        ),
+        boolean=True,
+    )
@@ -4,7 +4,8 @@ from django.dispatch import receiver
 from integrations.loomio.models import LoomioCommunity, LoomioUser
 from metagov.core.signals import governance_process_updated
 from metagov.plugins.loomio.models import LoomioPoll
-from policyengine.models import ChoiceVote, Proposal
+from policyengine import vote_sync
+from policyengine.models import Proposal
 
 logger = logging.getLogger(__name__)
 
@@ -33,16 +34,11 @@ def loomio_vote_updated_receiver(sender, instance, status, outcome, errors, **kw
         logger.warn(f"No LoomioCommunity matches {instance}")
         return
 
-    votes = outcome["votes"]
-
-    for (vote_option, result) in votes.items():
-        for u in result["users"]:
-            user, _ = LoomioUser.objects.get_or_create(username=u, readable_name=u, community=loomio_community)
-            existing_vote = ChoiceVote.objects.filter(proposal=proposal, user=user).first()
-            if existing_vote is None:
-                logger.debug(f"Casting vote for {vote_option} by {user} for proposal {proposal}")
-                ChoiceVote.objects.create(proposal=proposal, user=user, value=vote_option)
-            elif existing_vote.value != vote_option:
-                logger.debug(f"Casting vote for {vote_option} by {user} for proposal {proposal} (vote changed)")
-                existing_vote.value = vote_option
-                existing_vote.save()
+    vote_sync.sync_option_votes(
+        proposal,
+        outcome["votes"],
+        lambda user_ids: vote_sync.get_or_create_users(
+            LoomioUser, loomio_community, user_ids, defaults=lambda username: {"readable_name": username}
+        ),
+        boolean=False,
+    )
@@ -4,9 +4,7 @@ from __future__ import absolute_import, unicode_literals
 from celery import shared_task
 from policyengine.models import Proposal, LogAPICall, Proposal, BooleanVote
 from integrations.reddit.models import RedditCommunity, RedditUser, RedditMakePost
-import datetime
 import logging
-import json
 
 logger = logging.getLogger(__name__)
 
@@ -16,17 +14,9 @@ def is_policykit_action(community, name, call_type, test_a, test_b):
         logger.info('approve PolicyKit post')
         community.make_call('api/approve', {'id': name})
         return True
-    else:
-        current_time_minus = datetime.datetime.now() - datetime.timedelta(minutes=2)
-        logs = LogAPICall.objects.filter(proposal_time__gte=current_time_minus,
-                                                call_type=call_type)
-        if logs.exists():
-            logger.info("checking API logging")
-            for log in logs:
-                j_info = json.loads(log.extra_info)
-                if test_a == j_info[test_b]:
-                    logger.info("checking API logging FOUND")
-                    return True
+    elif LogAPICall.was_recently_made(community, call_type, test_b, test_a, seconds=120):
+        logger.info("checking API logging FOUND")
+        return True
     return False
 
 @shared_task
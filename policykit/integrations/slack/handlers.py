@@ -5,12 +5,8 @@ from django.dispatch import receiver
 from integrations.slack.models import SlackCommunity, SlackUser
 from metagov.core.signals import governance_process_updated, platform_event_created
 from metagov.plugins.slack.models import Slack, SlackEmojiVote, SlackAdvancedVote
-from policyengine.models import (
-    BooleanVote,
-    Proposal,
-    ChoiceVote,
-    SelectVote,
-)
+from policyengine import tracing, vote_sync
+from policyengine.models import Proposal
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +16,7 @@ Django signal handlers
 
 
 @receiver(platform_event_created, sender=Slack)
+@tracing.traced("slack_event_receiver")
 def slack_event_receiver(sender, instance, event_type, data, initiator, **kwargs):
     logger.debug("slack_event_reciever", extra={"slack_event_reciever.event_type": event_type, "slack_event_reciever.initiator": initiator, "slack_event_reciever.data": data})
     # logger.debug(f"Received {event_type} event from {instance}")
@@ -71,36 +68,11 @@ def slack_vote_updated_receiver(sender, instance, status, outcome, errors, **kwa
         logger.warning(f"No SlackCommunity matches {instance}")
         return
 
-    votes = outcome["votes"]
-    is_boolean_vote = set(votes.keys()) == {"yes", "no"}
-
-    ### Count boolean vote
-    if is_boolean_vote:
-        for (vote_option, result) in votes.items():
-            boolean_value = True if vote_option == "yes" else False
-            for u in result["users"]:
-                user, _ = SlackUser.objects.get_or_create(username=u, community=slack_community)
-                existing_vote = BooleanVote.objects.filter(proposal=proposal, user=user).first()
-                if existing_vote is None:
-                    logger.debug(f"Counting boolean vote {boolean_value} by {user}")
-                    BooleanVote.objects.create(proposal=proposal, user=user, boolean_value=boolean_value)
-                elif existing_vote.boolean_value != boolean_value:
-                    logger.debug(f"Counting boolean vote {boolean_value} by {user} (vote changed)")
-                    existing_vote.boolean_value = boolean_value
-                    existing_vote.save()
-    ### Count choice vote
-    else:
-        for (vote_option, result) in votes.items():
-            for u in result["users"]:
-                user, _ = SlackUser.objects.get_or_create(username=u, community=slack_community)
-                existing_vote = ChoiceVote.objects.filter(proposal=proposal, user=user).first()
-                if existing_vote is None:
-                    logger.debug(f"Counting vote for {vote_option} by {user} for proposal {proposal}")
-                    ChoiceVote.objects.create(proposal=proposal, user=user, value=vote_option)
-                elif existing_vote.value != vote_option:
-                    logger.debug(f"Counting vote for {vote_option} by {user} for proposal {proposal} (vote changed)")
-                    existing_vote.value = vote_option
-                    existing_vote.save()
+    vote_sync.sync_option_votes(
+        proposal,
+        outcome["votes"],
+        lambda user_ids: vote_sync.get_or_create_users(SlackUser, slack_community, user_ids),
+    )
 
 
 @receiver(governance_process_updated, sender=SlackAdvancedVote)
@@ -131,18 +103,8 @@ def slack_advanced_vote_updated_receiver(sender, instance, status, outcome, erro
         return
 
     # SlackAdvancedVote outcome structure: {"votes": {user_id: {candidate: option}}}
-    votes = outcome.get("votes", {})
-
-    for user_id, user_votes in votes.items():
-        user, _ = SlackUser.objects.get_or_create(username=user_id, community=slack_community)
-
-        for candidate, option in user_votes.items():
-            existing_vote = SelectVote.objects.filter(proposal=proposal, user=user, candidate=candidate).first()
-            if existing_vote is None:
-                logger.debug(f"Counting select vote {option} for {candidate} by {user}")
-                SelectVote.objects.create(proposal=proposal, user=user, candidate=candidate, option=option)
-            elif existing_vote.option != option:
-                logger.debug(f"Counting select vote {option} for {candidate} by {user} (vote changed)")
-                existing_vote.option = option
-                existing_vote.save()
-
+    vote_sync.sync_select_votes(
+        proposal,
+        outcome.get("votes", {}),
+        lambda user_ids: vote_sync.get_or_create_users(SlackUser, slack_community, user_ids),
+    )
@@ -1,8 +1,5 @@
-import datetime
-import json
 import logging
 
-from django.db.models import Q
 from policyengine.models import LogAPICall, PolicyActionKind
 from policyengine.utils import default_boolean_vote_message
 
@@ -23,28 +20,9 @@ def get_slack_user_fields(user_info):
 
 
 def is_policykit_action(community, value_to_match, key_to_match, api_name):
-    # logger.debug("is_policykit_action", extra={"is_policykit_action.value_to_match": value_to_match, "is_policykit_action.key_to_match": key_to_match, "is_policykit_action.api_name": api_name})
-    current_time_minus = datetime.datetime.now() - datetime.timedelta(seconds=2)
-
-    logs = LogAPICall.objects.filter(community=community, proposal_time__gte=current_time_minus).filter(
-        Q(call_type=api_name) | Q(call_type="slack.method")
-    )
-    # logger.debug(f">is_policykit_action: {logs.count()} possible matches for {api_name} with key '{key_to_match}' equal to '{value_to_match}'")
-    # logger.debug(f"{list(logs.values_list('extra_info', flat=True))}")
-    if logs.exists():
-        # logger.debug(f"Made {logs.count()} calls to {api_name} in the last 2 seconds")
-        for log in logs:
-            j_info = json.loads(log.extra_info)
-            if log.call_type == "slack.method" and j_info.get("method_name") != api_name:
-                # if this was a generic API call, the method_name must match the provided api_name
-                continue
-            if value_to_match == j_info[key_to_match]:
-                # logger.debug(f">found matching log {log.pk}")
-                # logger.debug("is_policykit_action -> True")
-                return True
-    # logger.debug(f">no match")
-    # logger.debug("is_policykit_action -> False")
-    return False
+    """True if PolicyKit called ``api_name`` in the last 2 seconds with ``key_to_match`` equal to ``value_to_match``"""
+    # a generic "slack.method" call is also matched by its method_name (see policyengine/api_call_keys.py)
+    return LogAPICall.was_recently_made(community, api_name, key_to_match, value_to_match, seconds=2)
 
 
 def get_admin_user_token(community):
@@ -0,0 +1,73 @@
+"""
+Match keys of the API calls that PolicyKit makes, used to recognize the platform events that echo them.
+
+When PolicyKit makes a call, like posting a Slack message, the platform soon sends an event about it, and that
+event must not be governed as if a user did it. ``LogAPICall.log_call`` stores a ``LogAPICallKey`` for each
+top-level scalar value of the call: the community, the call type, the key and a hash of the value. Checking an
+event is then a single indexed existence query (``LogAPICall.was_recently_made``), instead of parsing every
+recent call.
+
+The keys of calls made by this process are also kept in memory for LOG_API_CALL_RECENT_KEYS_TTL seconds (at most
+LOG_API_CALL_RECENT_KEYS_MAX of them), which catches the events that arrive right after the call without a query.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# the value of this key is the name of the method that a generic call made, like the Slack "slack.method" call
+METHOD_NAME_KEY = "method_name"
+
+_lock = threading.Lock()
+# (community id, call type, key, value hash) -> time the call was made, oldest first
+_recent = OrderedDict()
+
+
+def hash_value(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def match_keys(call, values):
+    """The ``(call type, key, value hash)`` of each top-level scalar value of a call"""
+    call_types = {call}
+    if isinstance(values.get(METHOD_NAME_KEY), str):
+        call_types.add(values[METHOD_NAME_KEY])
+    return [
+        (call_type, key, hash_value(value))
+        for key, value in values.items()
+        if key != METHOD_NAME_KEY and isinstance(value, (str, int, float, bool))
+        for call_type in sorted(call_types)
+    ]
+
+
+def remember(community_id, keys):
+    ttl = settings.LOG_API_CALL_RECENT_KEYS_TTL
+    if not ttl:
+        return
+    now = time.monotonic()
+    with _lock:
+        for key in keys:
+            _recent.pop((community_id, *key), None)
+            _recent[(community_id, *key)] = now
+        while _recent:
+            oldest = next(iter(_recent.values()))
+            if len(_recent) <= settings.LOG_API_CALL_RECENT_KEYS_MAX and now - oldest <= ttl:
+                break
+            _recent.popitem(last=False)
+
+
+def seen_recently(community_id, call_type, key, value_hash, seconds):
+    """True if this process made a matching call in the last ``seconds`` seconds"""
+    if not settings.LOG_API_CALL_RECENT_KEYS_TTL:
+        return False
+    with _lock:
+        made_at = _recent.get((community_id, call_type, key, value_hash))
+    return made_at is not None and time.monotonic() - made_at <= seconds
+
+
+def clear():
+    with _lock:
+        _recent.clear()
@@ -5,7 +5,7 @@ from rest_framework.exceptions import NotFound
 from django.contrib.auth import get_user
 from django.db import transaction
 from silk.profiling.profiler import silk_profile
-from policyengine.serializers import MembersSerializer, PutMembersRequestSerializer, CommunityDashboardSerializer, LogsSerializer
+from policyengine.serializers import MembersSerializer, PutMembersRequestSerializer, CommunityDashboardSerializer, LogsSerializer, PolicyStatsSerializer, EvaluationTraceSerializer
 
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
@@ -38,6 +38,35 @@ def logs(request):
     user = get_user(request)
     return Response(LogsSerializer(user.community.community).data)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def evaluation_trace(request, action_id):
+    """
+    Explain traces of the evaluations of an action in the user's community, latest first.
+    Traces are only recorded when explaining is on for the community (see policyengine/explain.py).
+    """
+    from policyengine.models import BaseAction, EvaluationTrace
+    user = get_user(request)
+    action = BaseAction.objects.filter(pk=action_id, community__community=user.community.community).first()
+    if action is None:
+        raise NotFound(f"Action {action_id} not found")
+    traces = EvaluationTrace.objects.filter(action=action)
+    return Response({"action": action.pk, "traces": EvaluationTraceSerializer(traces, many=True).data})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def policy_stats(request):
+    """
+    Cost of running each step of the community's policies over the last `hours` hours (default 24, up to a week),
+    most expensive first.
+    """
+    user = get_user(request)
+    try:
+        hours = min(max(int(request.GET.get("hours", 24)), 1), 24 * 7)
+    except ValueError:
+        hours = 24
+    return Response(PolicyStatsSerializer(user.community.community, context={"hours": hours}).data)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def settings(request):
@@ -0,0 +1,289 @@
+"""
+Micro-benchmarks for the policy engine. Run them with ``python manage.py benchmark_engine``.
+
+Each benchmark returns a dict of {name: seconds per call}. ``run_benchmarks`` runs a selection of them, and the
+results can be saved as a JSON baseline with ``write_baseline`` and compared with a later run with ``compare``,
+which flags the benchmarks that got slower than the baseline by more than a threshold.
+
+The "evaluation" benchmarks need a database. They create a community with N platforms and M policies in a
+transaction that is rolled back, with Metagov replaced by the stand-ins in ``fakes.py``.
+"""
+import json
+import platform
+import sys
+import timeit
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from policyengine.safe_exec_code import (
+    STATIC_GLOBAL_VARIABLES,
+    _guarded_import,
+    _hook_writable,
+    compile_user_code,
+    default_guarded_getitem,
+    default_guarded_getiter,
+    execute_compiled_code,
+    execute_user_code,
+    guarded_iter_unpack_sequence,
+    guarded_unpack_sequence,
+    policykit_builtins,
+    safer_getattr,
+    sandbox_runtime,
+)
+
+SAMPLE_STEP = """
+def check(proposal, variables):
+    yes_votes = len([v for v in proposal if v])
+    if yes_votes >= variables["yes_votes_to_pass"]:
+        return PASSED
+    return PROPOSED
+"""
+
+
+def time_per_call(func, iterations=10000, repeat=5):
+    """Best-of-`repeat` time for a single call of `func`, in seconds"""
+    return min(timeit.repeat(func, number=iterations, repeat=repeat)) / iterations
+
+
+def _per_call_globals():
+    """The restricted globals, built the way execute_user_code used to build them on every call"""
+
+    def _apply(f, *a, **kw):
+        return f(*a, **kw)
+
+    return {
+        "__builtins__": {
+            **policykit_builtins,
+            "__import__": _guarded_import,
+        },
+        "_getitem_": default_guarded_getitem,
+        "_getiter_": default_guarded_getiter,
+        "_unpack_sequence_": guarded_unpack_sequence,
+        "_iter_unpack_sequence_": guarded_iter_unpack_sequence,
+        "_getattr_": safer_getattr,
+        "_inplacevar_": lambda op, val, expr: val + expr,
+        "_write_": _hook_writable,
+        "_apply_": _apply,
+        "hasattr": lambda obj, attr: hasattr(obj, attr),
+        **STATIC_GLOBAL_VARIABLES,
+    }
+
+
+def benchmark_sandbox_globals(iterations=10000):
+    """
+    Compare building the restricted globals per call against copying the prebuilt SandboxRuntime template,
+    both on their own and when running a small compiled step.
+    """
+    byte_code = compile_user_code(SAMPLE_STEP, "check")
+    args = ([True, False, True], {"yes_votes_to_pass": 2})
+
+    def run_with_per_call_globals():
+        restricted_locals = {"result": None, "args": args, "kwargs": {}}
+        exec(byte_code, _per_call_globals(), restricted_locals)
+
+    return {
+        "globals.per_call": time_per_call(_per_call_globals, iterations),
+        "globals.runtime_template": time_per_call(sandbox_runtime.new_globals, iterations),
+        "execute.per_call_globals": time_per_call(run_with_per_call_globals, iterations),
+        "execute.runtime_template": time_per_call(lambda: sandbox_runtime.execute(byte_code, args, {}), iterations),
+    }
+
+
+def benchmark_executor(iterations=10000):
+    """
+    Compare running a small step with plain ``exec`` against the restricted executor, with code compiled
+    once (``execute_compiled_code``) and compiled on every call (``execute_user_code``).
+    """
+    args = ([True, False, True], {"yes_votes_to_pass": 2})
+    plain_code = compile(SAMPLE_STEP + "\nresult = check(*args)", "<benchmark>", "exec")
+    byte_code = compile_user_code(SAMPLE_STEP, "check")
+
+    def run_plain_exec():
+        restricted_locals = {"result": None, "args": args}
+        exec(plain_code, dict(STATIC_GLOBAL_VARIABLES), restricted_locals)
+
+    return {
+        "executor.plain_exec": time_per_call(run_plain_exec, iterations),
+        "executor.execute_compiled_code": time_per_call(lambda: execute_compiled_code(byte_code, *args), iterations),
+        "executor.execute_user_code": time_per_call(
+            lambda: execute_user_code(SAMPLE_STEP, "check", *args), max(1, iterations // 100)
+        ),
+    }
+
+
+def benchmark_step_wrapper(iterations=10000):
+    """
+    The overhead that ``exec_code_block`` adds around running a step: wrapping and compiling the step code
+    (on a cache miss), building the cache key and the budget, and the instrumentation around the run.
+    """
+    from policyengine.code_cache import make_cache_key
+    from policyengine.engine import _instrumented_step, compile_step_code, context_argument_names
+    from policyengine.watchdog import StepBudget
+
+    arg_names = context_argument_names(["slack"])
+    code_string = "return PASSED"
+    # an unsaved policy, so that no step stats are recorded
+    policy = SimpleNamespace(pk=None, community_id=None, modified_at=None)
+
+    def run_instrumented():
+        with _instrumented_step(policy, "check", StepBudget("check")):
+            pass
+
+    return {
+        "step.compile_step_code": time_per_call(
+            lambda: compile_step_code(code_string, "check", arg_names), max(1, iterations // 100)
+        ),
+        "step.make_cache_key": time_per_call(lambda: make_cache_key(policy, "check", arg_names, code_string), iterations),
+        "step.budget": time_per_call(lambda: StepBudget("check"), iterations),
+        "step.instrumented": time_per_call(run_instrumented, iterations),
+    }
+
+
+@contextmanager
+def benchmark_community(platforms=1, policies=10):
+    """
+    Create a community with the given number of platforms and policies, in a transaction that is rolled back
+    when the body is done. All policies but the oldest one reject every action in their filter, so the oldest
+    one, which keeps actions pending, is evaluated last. Yields (slack community, user, policies).
+    """
+    from django.contrib.auth.models import Permission
+    from django.db import transaction
+    from integrations.discord.models import DiscordCommunity
+    from integrations.slack.models import SlackCommunity, SlackUser
+    from policyengine.fakes import fake_metagov
+    from policyengine.models import CommunityRole, Policy
+
+    code = {"initialize": "pass", "notify": "pass", "success": "pass", "fail": "pass"}
+    with fake_metagov(), transaction.atomic():
+        try:
+            slack_community = SlackCommunity.objects.create(community_name="benchmark community", team_id="BENCHMARK")
+            community = slack_community.community
+            for index in range(platforms - 1):
+                DiscordCommunity.objects.create(
+                    community_name=f"benchmark platform {index}", community=community, team_id=f"BENCHMARK{index}"
+                )
+            role = CommunityRole.objects.create(role_name="benchmark role", community=community, is_base_role=True)
+            role.permissions.add(*Permission.objects.filter(name__startswith="Can add"))
+            user = SlackUser.objects.create(username="benchmark user", community=slack_community)
+
+            created = [
+                Policy.objects.create(
+                    **code,
+                    name="benchmark pending policy",
+                    kind=Policy.PLATFORM,
+                    community=community,
+                    filter="return True",
+                    check="return PROPOSED",
+                )
+            ]
+            for index in range(policies - 1):
+                created.append(
+                    Policy.objects.create(
+                        **code,
+                        name=f"benchmark policy {index}",
+                        kind=Policy.PLATFORM,
+                        community=community,
+                        filter="return action.action_type == 'nothing'",
+                        check="return PASSED",
+                    )
+                )
+            yield slack_community, user, created
+        finally:
+            transaction.set_rollback(True)
+
+
+def benchmark_evaluation(platforms=1, policies=10, iterations=100):
+    """
+    Time the stages of evaluating an action in a community with N platforms and M policies: building an
+    EvaluationContext (with and without a factory that loads the platforms once), looking up the eligible
+    policies, running all the filters, and the whole evaluation of a new action and of a pending proposal.
+    """
+    from integrations.slack.models import SlackPinMessage
+    from policyengine import engine
+    from policyengine.models import Proposal
+
+    with benchmark_community(platforms, policies) as (slack_community, user, created):
+        community = slack_community.community
+        action = SlackPinMessage(initiator=user, community=slack_community, community_origin=True)
+        proposal = Proposal(policy=created[0], action=action, status=Proposal.PROPOSED)
+        factory = engine.EvaluationContextFactory(community)
+        eligible_policies = engine.get_eligible_policies(action)
+
+        def run_filters():
+            for _ in engine._run_filters(action, eligible_policies, factory):
+                pass
+
+        pending = SlackPinMessage.objects.create(initiator=user, community=slack_community, community_origin=True)
+        pending_proposal = Proposal.objects.get(action=pending)
+
+        return {
+            "evaluation.context": time_per_call(
+                lambda: engine.EvaluationContext(proposal, is_first_evaluation=True), iterations
+            ),
+            "evaluation.context_with_factory": time_per_call(
+                lambda: engine.EvaluationContext(proposal, is_first_evaluation=True, factory=factory), iterations
+            ),
+            "evaluation.get_eligible_policies": time_per_call(lambda: engine.get_eligible_policies(action), iterations),
+            "evaluation.filters": time_per_call(run_filters, iterations),
+            "evaluation.new_action": time_per_call(
+                lambda: SlackPinMessage.objects.create(initiator=user, community=slack_community, community_origin=True),
+                iterations,
+            ),
+            "evaluation.pending_proposal": time_per_call(
+                lambda: engine.evaluate_proposal(pending_proposal), iterations
+            ),
+        }
+
+
+BENCHMARKS = {
+    "sandbox_globals": benchmark_sandbox_globals,
+    "executor": benchmark_executor,
+    "step": benchmark_step_wrapper,
+    "evaluation": benchmark_evaluation,
+}
+
+
+def run_benchmarks(names=None, iterations=10000, db_iterations=100, platforms=1, policies=10):
+    """Run the named benchmarks (all by default), and return all their results in one dict"""
+    results = {}
+    for name in names or BENCHMARKS:
+        if name == "evaluation":
+            results.update(benchmark_evaluation(platforms=platforms, policies=policies, iterations=db_iterations))
+        else:
+            results.update(BENCHMARKS[name](iterations=iterations))
+    return results
+
+
+def write_baseline(path, results, **parameters):
+    """Save results as a JSON baseline, with the parameters and environment they were measured with"""
+    baseline = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def read_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compare results with a baseline. Returns a list of (name, baseline seconds, seconds, ratio, regressed) for
+    the benchmarks in both, where regressed is True if the benchmark got slower by more than ``threshold``
+    (a fraction of the baseline time).
+    """
+    comparison = []
+    for name, seconds in sorted(results.items()):
+        baseline_seconds = baseline["results"].get(name)
+        if not baseline_seconds:
+            continue
+        ratio = seconds / baseline_seconds
+        comparison.append((name, baseline_seconds, seconds, ratio, ratio > 1 + threshold))
+    return comparison
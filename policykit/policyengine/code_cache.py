@@ -0,0 +1,185 @@
+"""
+Cache for compiled policy code.
+
+Every policy step is wrapped in a function and compiled with RestrictedPython before it runs
+(see ``exec_code_block`` in engine.py). Compiling is much slower than running a typical step, and
+the same code is compiled for every pending proposal on every beat tick, so compiled code objects
+are cached here.
+
+Entries are keyed by (policy pk, step, ``Policy.modified_at``, context argument names, code), so
+editing a policy naturally stops matching old entries. There are two tiers:
+
+- an in-process LRU, always on
+- an optional on-disk tier shared by all processes on a host (``POLICY_CODE_CACHE_DIR``). Celery
+  workers populate it at boot for all active policies, see ``warm_cache``.
+"""
+import hashlib
+import logging
+import marshal
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the wrapper code or the RestrictedPython policy changes, so on-disk entries are not reused.
+CACHE_FORMAT_VERSION = 3
+
+
+class CompiledCodeCache:
+    """
+    Thread-safe LRU of compiled policy code, with an optional on-disk tier.
+    """
+
+    def __init__(self, max_size=1024, directory=None):
+        self.max_size = max_size
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compile(self, key, compile_func):
+        """
+        Return the compiled code object for `key`, calling `compile_func` if it is not cached yet.
+        SyntaxErrors raised by `compile_func` are not cached.
+        """
+        with self._lock:
+            byte_code = self._entries.get(key)
+            if byte_code is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return byte_code
+
+        byte_code = self._read_from_disk(key)
+        if byte_code is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            byte_code = compile_func()
+            with self._lock:
+                self.misses += 1
+            self._write_to_disk(key, byte_code)
+
+        self._store(key, byte_code)
+        return byte_code
+
+    def invalidate_policy(self, policy_pk):
+        """
+        Remove all entries for the given policy. Called when the policy is saved.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == policy_pk]:
+                del self._entries[key]
+
+        policy_directory = self._policy_directory(policy_pk)
+        if policy_directory:
+            shutil.rmtree(policy_directory, ignore_errors=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Hit and miss counters. A "miss" means the code had to be compiled.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _store(self, key, byte_code):
+        with self._lock:
+            self._entries[key] = byte_code
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _policy_directory(self, policy_pk):
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, str(policy_pk))
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(repr((CACHE_FORMAT_VERSION, sys.implementation.cache_tag, key)).encode()).hexdigest()
+        return os.path.join(self._policy_directory(key[0]), f"{digest}.marshal")
+
+    def _read_from_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return marshal.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Ignoring unreadable compiled code cache entry: {repr(e)}")
+            return None
+
+    def _write_to_disk(self, key, byte_code):
+        if not self.directory:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temp file and rename, so other processes never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                marshal.dump(byte_code, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug(f"Failed to write compiled code cache entry: {repr(e)}")
+
+
+compiled_code_cache = CompiledCodeCache(
+    max_size=getattr(settings, "POLICY_CODE_CACHE_SIZE", 1024),
+    directory=getattr(settings, "POLICY_CODE_CACHE_DIR", None),
+)
+
+
+def make_cache_key(policy, step_name, arg_names, code_string):
+    modified_at = policy.modified_at.isoformat() if policy and policy.modified_at else None
+    return (policy.pk if policy else None, step_name, modified_at, tuple(arg_names), code_string)
+
+
+def warm_cache():
+    """
+    Compile every step of every active policy, so that evaluations don't need to compile anything.
+    Returns the number of compiled steps.
+    """
+    from policyengine.engine import compile_step_code, context_argument_names
+    from policyengine.models import CommunityPlatform, Policy
+
+    platform_names = {}
+    for platform in CommunityPlatform.objects.order_by("pk"):
+        platform_names.setdefault(platform.community_id, []).append(platform.platform)
+
+    count = 0
+    for policy in Policy.objects.filter(is_active=True):
+        arg_names = context_argument_names(platform_names.get(policy.community_id, []))
+        for step_name in [Policy.FILTER, Policy.INITIALIZE, Policy.CHECK, Policy.NOTIFY, Policy.SUCCESS, Policy.FAIL]:
+            code_string = getattr(policy, step_name)
+            key = make_cache_key(policy, step_name, arg_names, code_string)
+            try:
+                compiled_code_cache.get_or_compile(key, lambda: compile_step_code(code_string, step_name, arg_names))
+            except SyntaxError:
+                # Will be reported to the policy author when the step is evaluated
+                continue
+            count += 1
+
+    logger.info(f"Warmed compiled policy code cache with {count} steps: {compiled_code_cache.stats()}")
+    return count
@@ -0,0 +1,178 @@
+"""
+Writes to DataStores: key-level atomic updates, and write-back sessions so that an evaluation reads and writes
+``proposal.data`` in memory.
+
+DataStores are stored in a JSON column, and writes only change the keys they're about: ``apply_changes`` sets,
+removes and increments keys in a single UPDATE, with ``jsonb_set`` and ``-`` on Postgres, so concurrent writers of
+different keys (or increments of the same key) don't overwrite each other and nothing is locked but the row for
+the duration of the statement. Other databases get the same result from a read-modify-write under a row lock.
+
+Outside a session, every ``DataStore.set``, ``remove`` and ``increment`` is written right away. During an
+evaluation, the engine opens a session: reads are served from memory, and writes only record which keys changed.
+When the evaluation finishes, the changes to each DataStore are applied with one ``apply_changes``. If the
+evaluation raises, the changes are discarded along with it.
+
+Sessions nest: a session opened inside another one (for example when a policy's code evaluates another action)
+is part of the outer one.
+"""
+import contextvars
+import json
+import logging
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_current_session = contextvars.ContextVar("policykit_data_store_session", default=None)
+
+SET = "set"
+REMOVE = "remove"
+INCREMENT = "increment"
+
+
+def _apply_in_python(data, changes):
+    for key, (op, value) in changes.items():
+        if op == SET:
+            data[key] = value
+        elif op == REMOVE:
+            data.pop(key, None)
+        elif op == INCREMENT:
+            data[key] = (data.get(key) or 0) + value
+    return data
+
+
+def _apply_in_postgres(pk, changes):
+    from policyengine.models import DataStore
+
+    quote = connection.ops.quote_name
+    column = quote(DataStore._meta.get_field("data_store").column)
+    expression = f"COALESCE({column}, '{{}}'::jsonb)"
+    params = []
+    for key, (op, value) in changes.items():
+        if op == SET:
+            expression = f"jsonb_set({expression}, ARRAY[%s], %s::jsonb, true)"
+            params += [key, json.dumps(value)]
+        elif op == REMOVE:
+            expression = f"({expression} - %s)"
+            params += [key]
+        elif op == INCREMENT:
+            # reads the value before this statement, which is the one to increment since each key changes once
+            expression = f"jsonb_set({expression}, ARRAY[%s], to_jsonb(COALESCE(({column} ->> %s)::numeric, 0) + %s), true)"
+            params += [key, key, value]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(DataStore._meta.db_table)} SET {column} = {expression} "
+            f"WHERE {quote(DataStore._meta.pk.column)} = %s RETURNING {column}",
+            params + [pk],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return json.loads(row[0]) if isinstance(row[0], str) else row[0]
+
+
+def apply_changes(pk, changes):
+    """
+    Apply ``changes``, a dict of ``key -> (SET, value)``, ``(REMOVE, None)`` or ``(INCREMENT, amount)``, to the
+    DataStore with this pk, atomically. Returns its data after the changes, or None if it doesn't exist.
+    """
+    from policyengine.models import DataStore
+
+    if connection.vendor == "postgresql":
+        return _apply_in_postgres(pk, changes)
+
+    with transaction.atomic():
+        data = DataStore.objects.select_for_update().filter(pk=pk).values_list("data_store", flat=True).first()
+        if data is None:
+            return None
+        data = _apply_in_python(dict(data), changes)
+        DataStore.objects.filter(pk=pk).update(data_store=data)
+    return data
+
+
+class _Entry:
+    def __init__(self, data):
+        self.data = data
+        # key -> (operation, value), like the argument of apply_changes
+        self.changes = {}
+        self.instances = []
+
+
+class DataStoreSession:
+    def __init__(self):
+        # DataStore pk -> _Entry
+        self._entries = {}
+
+    def _entry(self, data_store):
+        entry = self._entries.get(data_store.pk)
+        if entry is None:
+            entry = self._entries[data_store.pk] = _Entry(dict(data_store.data_store or {}))
+        if not any(instance is data_store for instance in entry.instances):
+            entry.instances.append(data_store)
+        return entry
+
+    def data(self, data_store):
+        """The data of the DataStore, including the changes made in this session. Don't mutate it."""
+        return self._entry(data_store).data
+
+    def set(self, data_store, key, value):
+        entry = self._entry(data_store)
+        entry.data[key] = value
+        entry.changes[key] = (SET, value)
+
+    def remove(self, data_store, key):
+        entry = self._entry(data_store)
+        value = entry.data.pop(key, None)
+        entry.changes[key] = (REMOVE, None)
+        return value
+
+    def increment(self, data_store, key, amount):
+        entry = self._entry(data_store)
+        entry.data[key] = (entry.data.get(key) or 0) + amount
+        op, value = entry.changes.get(key, (INCREMENT, 0))
+        # after a set or remove in this session, the key is set to the value it has here
+        entry.changes[key] = (INCREMENT, value + amount) if op == INCREMENT else (SET, entry.data[key])
+        return entry.data[key]
+
+    def flush(self):
+        """Write the changes to each DataStore"""
+        from policyengine import dirty_queue
+
+        for pk, entry in self._entries.items():
+            if not entry.changes:
+                continue
+            data = apply_changes(pk, entry.changes)
+            entry.changes = {}
+            if data is None:
+                # deleted during the evaluation, for example along with its proposal
+                continue
+            for instance in entry.instances:
+                instance.data_store = data
+            dirty_queue.data_store_changed(entry.instances[0])
+
+
+def current():
+    """The session that the current evaluation is in, or None"""
+    return _current_session.get()
+
+
+@contextmanager
+def session():
+    """
+    Buffer DataStore writes made in the body, and flush them when it finishes. If the body raises, they're
+    discarded. Yields the session.
+    """
+    outer = _current_session.get()
+    if outer is not None:
+        yield outer
+        return
+
+    data_session = DataStoreSession()
+    token = _current_session.set(data_session)
+    try:
+        yield data_session
+    finally:
+        _current_session.reset(token)
+    data_session.flush()
@@ -0,0 +1,126 @@
+"""
+Queue of pending proposals that need to be re-evaluated because something they depend on changed.
+
+Vote writes, DataStore changes and governance process updates mark the proposal as dirty by setting
+``Proposal.dirty_since``, and schedule ``evaluate_dirty_proposal`` to run DIRTY_PROPOSAL_DEBOUNCE_SECONDS later.
+Marking is a conditional UPDATE that only succeeds on a clean proposal, so a burst of votes schedules a single
+evaluation. The evaluation claims the proposal by clearing the flag, so changes made while it runs mark it
+dirty again.
+
+The periodic sweep skips dirty proposals, unless they've been dirty for longer than DIRTY_PROPOSAL_STALE_SECONDS
+(for example because the scheduled task was lost).
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def _evaluating():
+    """Maps the pk of each proposal being evaluated in this thread to the proposal"""
+    if not hasattr(_local, "evaluating"):
+        _local.evaluating = {}
+    return _local.evaluating
+
+
+@contextmanager
+def evaluating(proposal):
+    """
+    Marks the proposal as being evaluated in this thread. Changes that the proposal's own policy code makes to
+    its votes or DataStore don't make it dirty.
+    """
+    evaluating = _evaluating()
+    already_evaluating = proposal.pk in evaluating
+    evaluating[proposal.pk] = proposal
+    try:
+        yield
+    finally:
+        if not already_evaluating:
+            evaluating.pop(proposal.pk, None)
+
+
+def mark_proposal_dirty(proposal_id):
+    """
+    Mark a pending proposal as dirty, and schedule its evaluation if it wasn't dirty already.
+    Returns True if the evaluation was scheduled.
+    """
+    from policyengine.models import Proposal
+
+    if proposal_id in _evaluating():
+        return False
+
+    now = datetime.now(timezone.utc)
+    marked = Proposal.objects.filter(pk=proposal_id, status=Proposal.PROPOSED, dirty_since__isnull=True).update(
+        dirty_since=now
+    )
+    if not marked:
+        return False
+
+    transaction.on_commit(lambda: _schedule_evaluation(proposal_id))
+    return True
+
+
+def mark_proposals_dirty(proposals):
+    """
+    Mark all pending proposals in the queryset as dirty. Returns the pks of the proposals that were scheduled.
+    """
+    from policyengine.models import Proposal
+
+    candidates = proposals.filter(status=Proposal.PROPOSED, dirty_since__isnull=True).values_list("pk", flat=True)
+    return [pk for pk in candidates if mark_proposal_dirty(pk)]
+
+
+def data_store_changed(data_store):
+    """
+    Called when a DataStore is saved. Marks the proposal that owns it as dirty, unless that proposal is being
+    evaluated in this thread.
+    """
+    from policyengine.models import Proposal
+
+    if any(proposal.data_id == data_store.pk for proposal in _evaluating().values()):
+        return
+    mark_proposals_dirty(Proposal.objects.filter(data_id=data_store.pk))
+
+
+def claim_dirty_proposal(proposal):
+    """
+    Claim the proposal before evaluating it, with a single conditional UPDATE that clears the dirty flag if it's
+    still the one the proposal was loaded with. A dirty proposal is only claimed by one worker, and the sweep doesn't
+    claim a proposal that was marked dirty after the sweep loaded it, since its scheduled evaluation will.
+    Returns False if the proposal is no longer pending, or was claimed by another worker.
+    """
+    from policyengine.models import Proposal
+
+    # dirty_since=None matches clean proposals
+    claimed = Proposal.objects.filter(pk=proposal.pk, status=Proposal.PROPOSED, dirty_since=proposal.dirty_since).update(
+        dirty_since=None
+    )
+    proposal.dirty_since = None
+    return bool(claimed)
+
+
+def not_freshly_dirty():
+    """
+    Filter for proposals that the periodic sweep should evaluate: clean ones, and ones whose scheduled
+    evaluation seems to have been lost.
+    """
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=settings.DIRTY_PROPOSAL_STALE_SECONDS)
+    return Q(dirty_since__isnull=True) | Q(dirty_since__lt=stale_before)
+
+
+def _schedule_evaluation(proposal_id):
+    from policyengine.tasks import evaluate_dirty_proposal
+
+    try:
+        evaluate_dirty_proposal.apply_async((proposal_id,), countdown=settings.DIRTY_PROPOSAL_DEBOUNCE_SECONDS)
+    except Exception as e:
+        # The sweep will pick the proposal up once it's stale
+        logger.error(f"Failed to schedule evaluation of dirty proposal {proposal_id}: {repr(e)} {e}")
@@ -1,12 +1,24 @@
+import contextvars
+import copy
 import inspect
 import logging
 import sys
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 
 from actstream import action as actstream_action
+from django.conf import settings
+from django.db import connection
 
 import policyengine.generate_codes as CodeGenerator
-from policyengine.safe_exec_code import execute_user_code
+from policyengine import data_session, dirty_queue, metrics, routing, step_stats, tracing, watchdog
+from policyengine.code_cache import compiled_code_cache, make_cache_key
+from policyengine.safe_exec_code import compile_user_code, execute_compiled_code
+from policyengine.watchdog import BudgetInterrupt, StepBudget
+import policyengine.explain as Explain
 import policyengine.utils as Utils
 
 logger = logging.getLogger(__name__)
@@ -49,7 +61,7 @@ class EvaluationContext:
         variables (Policy.variables): Dict with policy variables keys and values
     """
 
-    def __init__(self, proposal, is_first_evaluation=False):
+    def __init__(self, proposal, is_first_evaluation=False, factory=None):
         from policyengine.metagov_client import Metagov
         from policyengine.models import ExecutedActionTriggerAction
 
@@ -68,18 +80,19 @@ class EvaluationContext:
             logger_context["proposal"] = proposal
         self.logger = EvaluationLogAdapter(db_logger, logger_context)
 
-        from policyengine.models import Community, CommunityPlatform
+        from policyengine.models import Community
 
         parent_community: Community = self.action.community.community
+        if factory is None or factory.community.pk != parent_community.pk:
+            factory = EvaluationContextFactory(parent_community)
 
-        for comm in CommunityPlatform.objects.filter(community=parent_community):
-            for function_name in Utils.SHIMMED_PROPOSAL_FUNCTIONS:
-                _shim_proposal_function(comm, proposal, function_name)
+        for comm in factory.platforms_for(proposal):
             # Make the CommunityPlatforms available in the evaluation context,
             # so policy author can access them as vars like "slack" and "opencollective"
             setattr(self, comm.platform, comm)
 
-        self.metagov = Metagov(proposal)
+        metagov_slug = factory.community.metagov_slug if proposal.policy.community_id == factory.community.pk else None
+        self.metagov = Metagov(proposal, metagov_slug=metagov_slug)
         # why we need to set this here?
         if not is_first_evaluation:
             self.initialize_variables(proposal.policy.initialize)
@@ -108,6 +121,37 @@ class EvaluationContext:
         logger.debug(f"All initialized variables: {self.variables}")
 
 
+class EvaluationContextFactory:
+    """
+    Creates EvaluationContexts for proposals in one community. The community's platforms are loaded once,
+    and every context gets its own copies of them with shims bound to its proposal, so that nothing one
+    evaluation does to its platforms can leak into another.
+    """
+
+    def __init__(self, community, platforms=None):
+        from policyengine.models import CommunityPlatform
+
+        self.community = community
+        if platforms is None:
+            platforms = CommunityPlatform.objects.filter(community=community).order_by("pk")
+        # private copies, never handed out to policy code
+        self._platforms = [copy.copy(platform) for platform in platforms]
+
+    def platforms_for(self, proposal):
+        """
+        Returns fresh copies of the community's platforms, ordered by pk, with the proposal functions shimmed.
+        """
+        community = copy.copy(self.community)
+        platforms = []
+        for template in self._platforms:
+            platform = copy.copy(template)
+            platform.community = community
+            for function_name in Utils.SHIMMED_PROPOSAL_FUNCTIONS:
+                _shim_proposal_function(platform, proposal, function_name)
+            platforms.append(platform)
+        return platforms
+
+
 class PolicyEngineError(Exception):
     """Base class for exceptions raised from the policy engine"""
 
@@ -123,6 +167,12 @@ class PolicyCodeError(PolicyEngineError):
         super().__init__(self.message)
 
 
+class PolicyStepBudgetExceeded(PolicyCodeError):
+    """Raised when a policy step runs for longer than its time or instruction budget"""
+
+    pass
+
+
 class PolicyDoesNotExist(PolicyEngineError):
     """Raised when trying to evaluate a Proposal where the policy has been deleted"""
 
@@ -142,27 +192,39 @@ class PolicyDoesNotPassFilter(PolicyEngineError):
 
 
 def get_eligible_policies(action):
-    from django.db.models import Q
-
+    """
+    Returns the list of active policies that may govern the action, ordered by -modified_at.
+    Candidate policies are looked up in the community's routing table (see routing.py).
+    """
     from policyengine.models import ExecutedActionTriggerAction, PolicyActionKind
 
     if action.kind == PolicyActionKind.TRIGGER:
         # Trigger policies MUST match the trigger action. There is no "base policy" concept for triggers.
         if isinstance(action, ExecutedActionTriggerAction):
-            action_type_match = Q(action_types__codename=action.action.action_type)
+            action_type = action.action.action_type
         else:
-            action_type_match = Q(action_types__codename=action.action_type)
+            action_type = action.action_type
+        include_base = False
     else:
         # Governing policies can match if they have NO action_types specified (meaning its the "base policy")
-        action_type_match = Q(action_types=None) | Q(action_types__codename=action.action_type)
+        action_type = action.action_type
+        include_base = True
 
-    eligible_policies = action.community.community.get_policies().filter(Q(kind=action.kind) & action_type_match)
+    # The policies themselves are loaded, so we always evaluate their latest code
+    eligible_policies = routing.get_candidate_policies(
+        action.community.community_id, action.kind, action_type, include_base
+    )
 
-    logger.debug(f"{action.kind} action '{action}' found {eligible_policies.count()} eligible policies")
+    logger.debug(f"{action.kind} action '{action}' found {len(eligible_policies)} eligible policies")
+    if Explain.is_recording():
+        Explain.record(
+            "candidates", action_type=action_type, policies=[{"id": p.pk, "name": p.name} for p in eligible_policies]
+        )
     return eligible_policies
 
 
-def evaluate_action(action):
+@tracing.traced("evaluate_action")
+def evaluate_action(action, explain=None):
     """
     Called the FIRST TIME that an action is evaluated.
 
@@ -174,27 +236,40 @@ def evaluate_action(action):
     For trigger actions:
     - Evaluate against all eligible policies
     - Save the Proposal for each evaluation, which will be re-evaluated from the celery task if it is pending
+
+    Pass explain=True to record an explain trace of the evaluation (see explain.py). By default, traces are
+    recorded if EVALUATION_EXPLAIN is set or the community is in EVALUATION_EXPLAIN_COMMUNITIES.
     """
+    with Explain.recording(action, explain):
+        return _evaluate_action(action)
+
+
+def _evaluate_action(action):
     from policyengine.models import PolicyActionKind
 
     # logger.debug("evaluate_action", extra={"evaluate_action.action": action})
 
     eligible_policies = get_eligible_policies(action)
-    if not eligible_policies.exists():
+    if not eligible_policies:
         # logger.debug("evaluate_action -> None (no eligble policies)")
         if action.kind != PolicyActionKind.TRIGGER:
             raise Exception(f"no eligible policies found for governable action '{action}'")
         else:
             return None
 
+    # Load the community's platforms once, for all the policies that we try
+    context_factory = EvaluationContextFactory(action.community.community)
+
     # If this is a trigger action, evaluate ALL eligible policies
     if action.kind == PolicyActionKind.TRIGGER:
         proposals = []
-        matching_policies_proposals = create_prefiltered_proposals(action, eligible_policies, allow_multiple=True)
+        matching_policies_proposals = create_prefiltered_proposals(
+            action, eligible_policies, allow_multiple=True, context_factory=context_factory
+        )
         logger.debug("evaluate_action:trigger", extra={"evaluate_action.len(trigger_proposals)": len(matching_policies_proposals)})
         for proposal in matching_policies_proposals:
             try:
-                evaluate_proposal(proposal, is_first_evaluation=True)
+                evaluate_proposal(proposal, is_first_evaluation=True, context_factory=context_factory)
             except Exception as e:
                 logger.debug(f"{proposal} raised exception {type(e).__name__} {e}")
                 proposal.delete()
@@ -205,8 +280,8 @@ def evaluate_action(action):
     # If this is a governable action, choose ONE policy to evaluate
     else:
         # logger.debug("evaluate_action:governable")
-        while eligible_policies.exists():
-            proposal = create_prefiltered_proposals(action, eligible_policies)
+        while eligible_policies:
+            proposal = create_prefiltered_proposals(action, eligible_policies, context_factory=context_factory)
             # logger.debug("evaluate_action:governable evaluating proposal", extra={"evaluate_action.proposal": proposal})
             if not proposal:
                 # This means that the action didn't pass the filter for ANY policies.
@@ -215,9 +290,9 @@ def evaluate_action(action):
 
             # Run the proposal
             try:
-                evaluate_proposal(proposal, is_first_evaluation=True)
+                evaluate_proposal(proposal, is_first_evaluation=True, context_factory=context_factory)
             except Exception as e:
-                eligible_policies = eligible_policies.exclude(pk=proposal.policy.pk)
+                eligible_policies = [p for p in eligible_policies if p.pk != proposal.policy.pk]
                 logger.debug(f"{proposal} raised exception {type(e).__name__} {e}, choosing a different policy...")
                 proposal.delete()
                 pass
@@ -225,40 +300,38 @@ def evaluate_action(action):
                 return proposal
 
 
-def create_prefiltered_proposals(action, policies, allow_multiple=False):
+def create_prefiltered_proposals(action, policies, allow_multiple=False, context_factory=None):
     """
     Evaluate action against the Filter step in all provided policies, and return the Proposal
     for the first Policy where the aciton passed the Filter.
 
     If allow_multiple is true, returns a *list* of all Proposals where the action passed the filter (used for Triggers).
-    """
-    from policyengine.models import Policy, Proposal
 
+    If POLICY_FILTER_CONCURRENCY is greater than 1, the filters run concurrently in a thread pool, but the result
+    is the same as running them one at a time in order.
+    """
     # logger.debug("create_prefiltered_proposals", extra={"create_prefiltered_proposals.action": action, "create_prefiltered_proposals.policies": policies})
+    if context_factory is None and policies:
+        context_factory = EvaluationContextFactory(action.community.community)
+
     proposals = []
-    for policy in policies:
-        # logger.debug("create_prefiltered_proposals:policy", extra={"create_prefiltered_proposals.policy": policy})
-        proposal = Proposal(policy=policy, action=action, status=Proposal.PROPOSED)
-        context = EvaluationContext(proposal, is_first_evaluation=True)
-        try:
-            passed_filter = exec_code_block(policy.filter, context, Policy.FILTER)
-        except Exception as e:
-            # Log unhandled exception to the db, so policy author can view it in the UI.
-            context.logger.error(f"Exception in 'filter': {str(e)}")
-            # If there was an exception raised in 'filter', treat it as if the action didn't pass this policy's filter.
-            continue
-
-        # logger.debug("create_prefiltered_proposals:policy exec filter", extra={"create_prefiltered_proposals.policy.filter": policy.filter, "create_prefiltered_proposals.passed_filter": passed_filter})
-        if passed_filter:
-            # Defer saving trigger actions and proposals until we need to, so we don't bloat the database
-            if not action.pk:
-                action.save()
-            proposal.save()
-            if allow_multiple:
-                proposals.append(proposal)
-            else:
-                logger.debug(f"For action '{action}', choosing policy '{policy}'")
-                return proposal
+    results = _run_filters(action, policies, context_factory)
+    try:
+        for proposal, passed_filter in results:
+            # logger.debug("create_prefiltered_proposals:policy exec filter", extra={"create_prefiltered_proposals.policy.filter": policy.filter, "create_prefiltered_proposals.passed_filter": passed_filter})
+            if passed_filter:
+                # Defer saving trigger actions and proposals until we need to, so we don't bloat the database
+                if not action.pk:
+                    action.save()
+                proposal.save()
+                if allow_multiple:
+                    proposals.append(proposal)
+                else:
+                    logger.debug(f"For action '{action}', choosing policy '{proposal.policy}'")
+                    return proposal
+    finally:
+        # stop any filters that are still pending
+        results.close()
 
     if allow_multiple:
         return proposals
@@ -267,6 +340,77 @@ def create_prefiltered_proposals(action, policies, allow_multiple=False):
         return None
 
 
+def _run_filter(action, policy, context_factory):
+    """
+    Run the policy's Filter step for the action. Returns the unsaved Proposal and whether the action passed.
+    """
+    from policyengine.models import Policy, Proposal
+
+    # logger.debug("create_prefiltered_proposals:policy", extra={"create_prefiltered_proposals.policy": policy})
+    proposal = Proposal(policy=policy, action=action, status=Proposal.PROPOSED)
+    context = EvaluationContext(proposal, is_first_evaluation=True, factory=context_factory)
+    try:
+        passed_filter = exec_code_block(policy.filter, context, Policy.FILTER)
+    except Exception as e:
+        # Log unhandled exception to the db, so policy author can view it in the UI.
+        context.logger.error(f"Exception in 'filter': {str(e)}")
+        # If there was an exception raised in 'filter', treat it as if the action didn't pass this policy's filter.
+        passed_filter = False
+    return proposal, passed_filter
+
+
+def _run_filter_in_thread(action, policy, context_factory):
+    from django.db import connections
+
+    try:
+        return _run_filter(action, policy, context_factory)
+    finally:
+        # Don't leave database connections open in pool threads
+        connections.close_all()
+
+
+_filter_executor = None
+_filter_executor_lock = threading.Lock()
+
+
+def _get_filter_executor():
+    global _filter_executor
+    with _filter_executor_lock:
+        if _filter_executor is None:
+            _filter_executor = ThreadPoolExecutor(
+                max_workers=settings.POLICY_FILTER_CONCURRENCY, thread_name_prefix="policy-filter"
+            )
+        return _filter_executor
+
+
+def _run_filters(action, policies, context_factory):
+    """
+    Yields (proposal, passed_filter) for each policy, in order. With POLICY_FILTER_CONCURRENCY > 1, all filters
+    are submitted to the thread pool up front. Filters that haven't started yet are cancelled once the caller
+    stops consuming results, and the results of ones that are already running are ignored.
+
+    Pool threads have their own database connections, which can't see the rows of an uncommitted transaction, so
+    inside an atomic block (like a webhook request with ATOMIC_REQUESTS) the filters run one at a time.
+    """
+    if settings.POLICY_FILTER_CONCURRENCY <= 1 or len(policies) <= 1 or connection.in_atomic_block:
+        for policy in policies:
+            yield _run_filter(action, policy, context_factory)
+        return
+
+    executor = _get_filter_executor()
+    # run each filter in a copy of the current context, so that it's part of the current trace
+    futures = [
+        executor.submit(contextvars.copy_context().run, _run_filter_in_thread, action, policy, context_factory)
+        for policy in policies
+    ]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
 def delete_and_rerun(proposal):
     """
     Delete the proposal and re-run evaluate_action for the relevant action.
@@ -278,10 +422,19 @@ def delete_and_rerun(proposal):
     return new_evaluation
 
 
-def evaluate_proposal(proposal, is_first_evaluation=False):
+def evaluate_proposal(proposal, is_first_evaluation=False, context_factory=None, explain=None):
     """
     Evaluate policy for given action. This can be run repeatedly to check proposed actions.
+    Pass an EvaluationContextFactory to reuse the community's platforms across evaluations.
+    Pass explain=True to record an explain trace of the evaluation (see evaluate_action).
     """
+    with Explain.recording(proposal.action, explain):
+        result = _evaluate_proposal(proposal, is_first_evaluation, context_factory)
+        Explain.record("decision", proposal=proposal.pk, policy=proposal.policy_id, status=proposal.status)
+        return result
+
+
+def _evaluate_proposal(proposal, is_first_evaluation, context_factory):
 
     if not proposal.policy:
         # This could happen if the Policy has been deleted since the first proposal.
@@ -290,22 +443,30 @@ def evaluate_proposal(proposal, is_first_evaluation=False):
     if not proposal.policy.is_active:
         raise PolicyIsNotActive
 
-    context = EvaluationContext(proposal, is_first_evaluation=is_first_evaluation)
+    # Changes that the policy makes to its own proposal don't need to trigger another evaluation. DataStore writes
+    # are kept in memory and written once the evaluation finishes, or discarded if it raises.
+    with dirty_queue.evaluating(proposal), data_session.session():
+        context = EvaluationContext(proposal, is_first_evaluation=is_first_evaluation, factory=context_factory)
 
-    try:
-        return evaluate_proposal_inner(context, is_first_evaluation)
-    except PolicyDoesNotPassFilter:
-        # The policy changed so that the action no longer passes the 'filter' step
-        raise
-    except PolicyCodeError as e:
-        # Log policy code exception to the db, so policy author can view it in the UI.
-        logger.debug(str(e))
-        context.logger.error(str(e))
-        raise
-    except Exception as e:
-        # Log unhandled exception to the db, so policy author can view it in the UI.
-        context.logger.error(f"Unhandled exception: {repr(e)} {e}")
-        raise
+        outcome = "error"
+        try:
+            result = evaluate_proposal_inner(context, is_first_evaluation)
+            outcome = proposal.status
+            return result
+        except PolicyDoesNotPassFilter:
+            # The policy changed so that the action no longer passes the 'filter' step
+            raise
+        except PolicyCodeError as e:
+            # Log policy code exception to the db, so policy author can view it in the UI.
+            logger.debug(str(e))
+            context.logger.error(str(e))
+            raise
+        except Exception as e:
+            # Log unhandled exception to the db, so policy author can view it in the UI.
+            context.logger.error(f"Unhandled exception: {repr(e)} {e}")
+            raise
+        finally:
+            metrics.proposal_evaluations.inc(outcome=outcome)
 
 
 def evaluate_proposal_inner(context: EvaluationContext, is_first_evaluation: bool):
@@ -330,31 +491,48 @@ def evaluate_proposal_inner(context: EvaluationContext, is_first_evaluation: boo
         context.initialize_variables(policy.initialize)
         # exec_code_block(policy.initialize, context, Policy.INITIALIZE)
 
-    # Run "check" block of policy
+    # Run "check" block of policy. It may declare when it next needs to run, using proposal.check_again_at
+    previous_next_evaluation_at = proposal.next_evaluation_at
+    proposal.next_evaluation_at = None
     check_result = exec_code_block(policy.check, context, Policy.CHECK)
     check_result = sanitize_check_result(check_result) # sanitize so None becomes PROPOSED
 
+    if check_result == Proposal.PROPOSED and policy.is_degraded:
+        # policies that keep exceeding their budget are checked less often, until they're edited
+        earliest = datetime.now(timezone.utc) + timedelta(seconds=settings.POLICY_DEGRADED_CHECK_INTERVAL)
+        if proposal.next_evaluation_at is None or proposal.next_evaluation_at < earliest:
+            proposal.next_evaluation_at = earliest
+
+    if check_result == Proposal.PROPOSED and proposal.next_evaluation_at != previous_next_evaluation_at:
+        Proposal.objects.filter(pk=proposal.pk).update(next_evaluation_at=proposal.next_evaluation_at)
+
     if is_first_evaluation or check_result != Proposal.PROPOSED:
         # log the check result for first evaluation, or if the proposal is newly completed
         context.logger.debug(f"Evaluating Proposal {proposal.pk}, check returned {check_result.upper()}")
 
+    # Mark the proposal as completed before running the pass or fail block, so that if another worker is
+    # evaluating it at the same time, only one of them runs the block and executes the action
     if check_result == Proposal.PASSED:
         logger.debug('Met PASS conditions!')
-        # run "pass" block of policy
-        exec_code_block(policy.success, context, Policy.SUCCESS)
         # mark proposal as 'passed'
-        proposal._pass_evaluation()
+        if not proposal._pass_evaluation():
+            logger.debug(f"Proposal {proposal.pk} was already completed by another evaluation")
+            return True
         assert proposal.status == Proposal.PASSED
+        # run "pass" block of policy
+        exec_code_block(policy.success, context, Policy.SUCCESS)
 
         if action._is_executable:
             action.execute()
 
     if check_result == Proposal.FAILED:
-        # run "fail" block of policy
-        exec_code_block(policy.fail, context, Policy.FAIL)
         # mark proposal as 'failed'
-        proposal._fail_evaluation()
+        if not proposal._fail_evaluation():
+            logger.debug(f"Proposal {proposal.pk} was already completed by another evaluation")
+            return True
         assert proposal.status == Proposal.FAILED
+        # run "fail" block of policy
+        exec_code_block(policy.fail, context, Policy.FAIL)
 
     # Revert the action if necessary
     should_revert = (
@@ -376,19 +554,58 @@ def evaluate_proposal_inner(context: EvaluationContext, is_first_evaluation: boo
     return True
 
 
+def context_argument_names(platform_names):
+    """
+    Names of the EvaluationContext attributes, in the order that they are passed to policy code.
+    Must match the order that attributes are set in EvaluationContext.__init__.
+    """
+    return ("action", "policy", "variables", "proposal", "logger", *platform_names, "metagov")
+
+
+def compile_step_code(code_string: str, step_name, arg_names):
+    """
+    Wrap the code for a policy step in a function that takes all the context arguments, and compile it.
+    """
+    wrapper_start = f"def {step_name}({', '.join(arg_names)}):\r\n"
+    lines = ["  " + item for item in code_string.splitlines()]
+    return compile_user_code(wrapper_start + "\r\n".join(lines), step_name)
+
+
+@contextmanager
+def _instrumented_step(policy, step_name, budget):
+    """
+    Trace, time and measure a run of a policy step, and enforce its budget.
+    Yields the step's entry in the explain trace, if one is being recorded.
+    """
+    with tracing.span(f"policy.{step_name}", policy=policy.pk), Explain.step(policy, step_name) as explain_entry:
+        with metrics.policy_step_seconds.time(step=step_name), step_stats.measure_step(policy, step_name):
+            with watchdog.enforce(budget):
+                yield explain_entry
+
+
 def exec_code_block(code_string: str, context: EvaluationContext, step_name="unknown"):
     """
     Execute a policy step with all the available context. Uses restricted safe execution
     to limit available modules.
     """
     # Each item on the EvaluationContext gets passed to the funciton as a keyword argument
-    args = ", ".join(context.__dict__.keys())
-    wrapper_start = f"def {step_name}({args}):\r\n"
-    lines = ["  " + item for item in code_string.splitlines()]
-    code = wrapper_start + "\r\n".join(lines)
+    arg_names = context.__dict__.keys()
+    key = make_cache_key(context.policy, step_name, arg_names, code_string)
+    budget = StepBudget(step_name)
 
     try:
-        return execute_user_code(code, step_name, **context.__dict__)
+        byte_code = compiled_code_cache.get_or_compile(
+            key, lambda: compile_step_code(code_string, step_name, arg_names)
+        )
+        with _instrumented_step(context.policy, step_name, budget) as explain_entry:
+            result = execute_compiled_code(byte_code, **context.__dict__)
+            if explain_entry is not None:
+                explain_entry["result"] = repr(result)[:200]
+    except BudgetInterrupt:
+        context.policy.record_budget_violation()
+        raise PolicyStepBudgetExceeded(
+            step=step_name, message=f"{step_name} was stopped after exceeding its {budget.describe()}"
+        )
     except SyntaxError as err:
         error_class = err.__class__.__name__
         detail = err.args[0]
@@ -399,7 +616,13 @@ def exec_code_block(code_string: str, context: EvaluationContext, step_name="unk
         _, _, tb = sys.exc_info()
         line_number = traceback.extract_tb(tb)[-1][1]
     else:
-        return
+        if budget.exceeded is not None:
+            # the step finished over budget without reaching a checkpoint, its result stands
+            context.policy.record_budget_violation()
+            context.logger.warning(f"{step_name} finished after exceeding its {budget.describe()}")
+        else:
+            context.policy.record_budget_success()
+        return result
     if line_number is None:
         raise PolicyCodeError(step=step_name, message="%s in %s: %s" % (error_class, step_name, detail))
     else:
@@ -416,6 +639,27 @@ def sanitize_check_result(res):
     return Proposal.PROPOSED
 
 
+_shimmable_functions = {}
+
+
+def _is_shimmable(community_platform, function_name):
+    """
+    Whether the platform's function should be shimmed by _shim_proposal_function.
+    The signature analysis is done once per platform class and cached.
+    """
+    key = (type(community_platform), function_name)
+    if key not in _shimmable_functions:
+        # skip if this community doesn't have this function defined
+        if not hasattr(community_platform, function_name):
+            shimmable = False
+        else:
+            # skip if this function doesn't expect 'parameter' as the first arg
+            function_parameters = list(inspect.signature(getattr(community_platform, function_name)).parameters.values())
+            shimmable = not (not len(function_parameters) > 1 and function_parameters[1].name == "proposal")
+        _shimmable_functions[key] = shimmable
+    return _shimmable_functions[key]
+
+
 def _shim_proposal_function(community_platform, proposal, function_name):
     """
     Shim functions that receive the proposal as the first argument.
@@ -429,18 +673,12 @@ def _shim_proposal_function(community_platform, proposal, function_name):
     """
     from policyengine.models import Proposal
 
-    # skip if this community doesn't have this function defined
-    if not hasattr(community_platform, function_name):
+    if not _is_shimmable(community_platform, function_name):
         return
 
     # store the original function that we will shim
     old_function = getattr(community_platform, function_name)
 
-    # skip if this function doesn't expect 'parameter' as the first arg
-    function_parameters = list(inspect.signature(old_function).parameters.values())
-    if not len(function_parameters) > 1 and function_parameters[1].name == "proposal":
-        return
-
     # create a shim function that passes the proposal
     def shim_function(*args, **kwargs):
         # If proposal was passed in by the policy author, remove it
@@ -0,0 +1,141 @@
+"""
+Explain traces: an ordered record of how an action was evaluated.
+
+When explaining is on, ``evaluate_action`` and ``evaluate_proposal`` record the candidate policies from routing,
+each policy step that ran (with its result, duration, database queries and platform API calls), and the final
+decision. The trace is saved as an ``EvaluationTrace`` for the action, and served by ``api/evaluation_trace``.
+
+Explaining is on for the communities in EVALUATION_EXPLAIN_COMMUNITIES, for all communities if EVALUATION_EXPLAIN
+is set, or when ``explain=True`` is passed to ``evaluate_action``. When it's off, the hooks in the engine only
+check a context variable. Traces are capped at EVALUATION_EXPLAIN_MAX_ENTRIES entries.
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar("policykit_explain_trace", default=None)
+_current_step = contextvars.ContextVar("policykit_explain_step", default=None)
+
+
+class ExplainTrace:
+    def __init__(self, action):
+        self.action = action
+        self.entries = []
+        self.truncated = False
+        self._started = time.perf_counter()
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 3)
+
+    def add(self, event, **data):
+        """Append an entry to the trace. Returns the entry, or None if the trace is full."""
+        if len(self.entries) >= settings.EVALUATION_EXPLAIN_MAX_ENTRIES:
+            self.truncated = True
+            return None
+        entry = {"event": event, "at_ms": self.elapsed_ms(), **data}
+        self.entries.append(entry)
+        return entry
+
+    def save(self):
+        if not self.action.pk:
+            # the action didn't pass any filter, so it was never saved
+            return None
+
+        from policyengine.models import EvaluationTrace
+
+        try:
+            return EvaluationTrace.record(self.action, self.entries, self.truncated, self.elapsed_ms())
+        except DatabaseError as e:
+            logger.warning(f"Failed to save explain trace for action {self.action.pk}: {repr(e)} {e}")
+            return None
+
+
+def is_recording():
+    return _current_trace.get() is not None
+
+
+def is_enabled_for(action):
+    if settings.EVALUATION_EXPLAIN:
+        return True
+    if not settings.EVALUATION_EXPLAIN_COMMUNITIES:
+        return False
+    return action.community.community_id in settings.EVALUATION_EXPLAIN_COMMUNITIES
+
+
+@contextmanager
+def recording(action, enabled=None):
+    """
+    Record an explain trace of the body, and save it for the action when done. Yields the trace, or None if
+    explaining is off. If a trace is already being recorded, the body is recorded as part of that trace.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+    if enabled is None:
+        enabled = is_enabled_for(action)
+    if not enabled:
+        yield None
+        return
+
+    trace = ExplainTrace(action)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.add("error", error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace.save()
+
+
+def record(event, **data):
+    """Add an entry to the current trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(event, **data)
+
+
+@contextmanager
+def step(policy, step_name):
+    """
+    Record a run of a policy step in the current trace, if any. Yields the trace entry, so that the caller
+    can add the step's result, or None.
+    """
+    trace = _current_trace.get()
+    entry = trace.add("step", policy=policy.pk, step=step_name) if trace is not None else None
+    if entry is None:
+        yield None
+        return
+
+    entry.update(queries=0, api_calls=[])
+
+    def count_query(execute, sql, params, many, context):
+        entry["queries"] += 1
+        return execute(sql, params, many, context)
+
+    token = _current_step.set(entry)
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count_query):
+            yield entry
+    except BaseException as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        _current_step.reset(token)
+
+
+def api_call(name):
+    """Record an outbound platform call made by the policy step that is running, if any"""
+    entry = _current_step.get()
+    if entry is not None and len(entry["api_calls"]) < settings.EVALUATION_EXPLAIN_MAX_ENTRIES:
+        entry["api_calls"].append(name)
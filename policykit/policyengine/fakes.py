@@ -0,0 +1,130 @@
+"""
+Local stand-ins for Metagov and the platforms behind it, for replaying and load testing the engine without
+calling live platforms.
+
+``fake_metagov()`` swaps the ``MetagovApp`` that PolicyKit talks to for a ``FakeMetagov``, in every module that
+imported it. Plugin methods and actions are recorded and return made-up responses, and governance processes
+are created as real ``GovernanceProcess`` rows (so that proposals can reference them and their receivers run),
+but never reach the platform.
+"""
+import itertools
+import sys
+from contextlib import contextmanager
+
+from policyengine.metagov_app import metagov as real_metagov
+
+
+class FakeResponse(dict):
+    """A platform response, with a made-up value for any key that's looked up"""
+
+    def __init__(self, call_id, **kwargs):
+        super().__init__(ok=True, **kwargs)
+        self.call_id = call_id
+
+    def __missing__(self, key):
+        return f"fake-{key}-{self.call_id}"
+
+
+class FakePlugin:
+    def __init__(self, fake, community_slug, name, community_platform_id=None):
+        self.fake = fake
+        self.community_slug = community_slug
+        self.name = name
+        self.community_platform_id = community_platform_id
+
+    def _plugin_model(self):
+        from metagov.core.models import Plugin
+
+        plugins = Plugin.objects.filter(community__slug=self.community_slug, name=self.name)
+        if self.community_platform_id:
+            plugins = plugins.filter(community_platform_id=self.community_platform_id)
+        return plugins.first()
+
+    def start_process(self, process_name, **kwargs):
+        from metagov.core.models import GovernanceProcess
+
+        response = self.fake.record(f"{self.name}.{process_name}", kwargs)
+        process = GovernanceProcess.objects.create(name=process_name, plugin=self._plugin_model(), status="pending")
+        # callers may read platform ids, like the vote message ts, from the outcome
+        process.outcome = response
+        self.fake.processes.append(process)
+        return process
+
+    def __getattr__(self, method_name):
+        if method_name.startswith("_"):
+            raise AttributeError(method_name)
+
+        def call(*args, **kwargs):
+            return self.fake.record(f"{self.name}.{method_name}", kwargs)
+
+        return call
+
+
+class FakeMetagovCommunity:
+    def __init__(self, fake, slug):
+        self.fake = fake
+        self.slug = slug
+
+    def get_plugin(self, plugin_name, community_platform_id=None):
+        return FakePlugin(self.fake, self.slug, plugin_name, community_platform_id)
+
+    def perform_action(self, plugin_name, action_id, parameters=None, community_platform_id=None):
+        return self.fake.record(f"{plugin_name}.{action_id}", parameters or {})
+
+    def delete(self):
+        real_metagov.get_community(self.slug).delete()
+
+
+class FakeMetagov:
+    """Stands in for ``MetagovApp``, and records every call made to a platform"""
+
+    def __init__(self):
+        self.calls = []
+        self.processes = []
+        self._call_ids = itertools.count(1)
+
+    def get_community(self, slug):
+        return FakeMetagovCommunity(self, slug)
+
+    def create_community(self, *args, **kwargs):
+        # Metagov communities only exist in the database, so create real ones
+        return real_metagov.create_community(*args, **kwargs)
+
+    def record(self, name, parameters):
+        call_id = next(self._call_ids)
+        self.calls.append((name, parameters))
+        return FakeResponse(call_id)
+
+    def close_process(self, process):
+        self.record(f"{process.name}.close", {"process": process.pk})
+        process.status = "completed"
+        process.save()
+        return process
+
+
+@contextmanager
+def fake_metagov():
+    """Replace Metagov with a ``FakeMetagov`` for the duration of the body. Yields the fake."""
+    from policyengine.metagov_client import Metagov
+
+    fake = FakeMetagov()
+    patched = [
+        module
+        for module in list(sys.modules.values())
+        if module is not None and getattr(module, "metagov", None) is real_metagov
+    ]
+    original_close_process = Metagov.close_process
+
+    def close_process(self):
+        process = self.proposal.governance_process
+        return fake.close_process(process) if process is not None else None
+
+    for module in patched:
+        module.metagov = fake
+    Metagov.close_process = close_process
+    try:
+        yield fake
+    finally:
+        Metagov.close_process = original_close_process
+        for module in patched:
+            module.metagov = real_metagov
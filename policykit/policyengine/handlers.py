@@ -1,14 +1,45 @@
 import logging
 
+from celery.signals import task_postrun
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from metagov.core.signals import platform_event_created
+from metagov.core.signals import governance_process_updated, platform_event_created
 from metagov.core.models import Plugin
-from policyengine.models import WebhookTriggerAction, Community
+from policyengine import dirty_queue, metrics, replay, routing, step_stats, tracing
+from policyengine.models import (
+    ActionType,
+    BooleanVote,
+    ChoiceVote,
+    Community,
+    NumberVote,
+    Policy,
+    Proposal,
+    SelectVote,
+    VoteTally,
+    WebhookTriggerAction,
+)
 
 logger = logging.getLogger(__name__)
 
 
 @receiver(platform_event_created)
+def capture_platform_event_receiver(sender, instance, event_type, data, initiator, **kwargs):
+    """Append the event to the replay capture file, if REPLAY_CAPTURE_PATH is set (see replay.py)."""
+    if settings.REPLAY_CAPTURE_PATH and issubclass(sender, Plugin):
+        replay.capture_platform_event(sender, instance, event_type, data, initiator)
+
+
+@receiver(governance_process_updated)
+def capture_process_update_receiver(sender, instance, status=None, outcome=None, errors=None, **kwargs):
+    """Append the process outcome to the replay capture file, if REPLAY_CAPTURE_PATH is set (see replay.py)."""
+    if settings.REPLAY_CAPTURE_PATH:
+        replay.capture_process_update(sender, instance, status, outcome, errors)
+
+
+@receiver(platform_event_created)
+@tracing.traced("metagov_event_receiver")
 def metagov_event_receiver(sender, instance, event_type, data, initiator, **kwargs):
     # Need to check if this is a Plugin using subclass
     # instead of using `sender` because these are Proxy models.
@@ -34,3 +65,75 @@ def metagov_event_receiver(sender, instance, event_type, data, initiator, **kwar
 
     trigger = WebhookTriggerAction(event_type=prefixed_event_type, data=data, community=community_platform)
     trigger.evaluate()
+
+
+@receiver(post_save, sender=BooleanVote)
+@receiver(post_save, sender=ChoiceVote)
+@receiver(post_save, sender=NumberVote)
+@receiver(post_save, sender=SelectVote)
+@receiver(post_delete, sender=BooleanVote)
+@receiver(post_delete, sender=ChoiceVote)
+@receiver(post_delete, sender=NumberVote)
+@receiver(post_delete, sender=SelectVote)
+def vote_changed_receiver(sender, instance, signal, created=False, **kwargs):
+    """Update the proposal's vote tally, and re-evaluate it soon after a vote on it is cast, changed or removed."""
+    event = "deleted" if signal is post_delete else "created" if created else "updated"
+    if signal is post_delete:
+        VoteTally.vote_deleted(instance)
+    else:
+        VoteTally.votes_saved([instance], created)
+    metrics.votes.inc(vote_type=sender.__name__, event=event)
+    dirty_queue.mark_proposal_dirty(instance.proposal_id)
+
+
+@receiver(governance_process_updated)
+def governance_process_updated_receiver(sender, instance, **kwargs):
+    """Re-evaluate the proposal soon after its Metagov GovernanceProcess is updated."""
+    dirty_queue.mark_proposals_dirty(Proposal.objects.filter(governance_process=instance))
+
+
+@receiver(post_save, sender=Policy)
+@receiver(post_delete, sender=Policy)
+def policy_changed_receiver(sender, instance, **kwargs):
+    """Rebuild the community's policy routing table after a policy is created, changed or deleted."""
+    _invalidate_policy_community(instance)
+
+
+def _invalidate_policy_community(policy):
+    if policy.community_id:
+        # also update the version of the policy's Community, if it's loaded, so saving it doesn't revert the version
+        community = policy.community if Policy.community.is_cached(policy) else None
+        routing.invalidate_community(policy.community_id, community)
+
+
+@receiver(m2m_changed, sender=Policy.action_types.through)
+def policy_action_types_changed_receiver(sender, instance, action, reverse, pk_set, **kwargs):
+    """Rebuild the policy routing table after a policy's action_types change."""
+    if not reverse:
+        if action.startswith("post_"):
+            _invalidate_policy_community(instance)
+        return
+
+    # policies were added to or removed from an ActionType, rebuild the tables of their communities
+    if action == "pre_clear":
+        # the policies are only known before they're removed
+        instance._cleared_policy_community_ids = list(
+            Policy.objects.filter(action_types=instance).values_list("community_id", flat=True)
+        )
+    elif action == "post_clear":
+        routing.invalidate_communities(getattr(instance, "_cleared_policy_community_ids", []))
+    elif action.startswith("post_"):
+        routing.invalidate_communities(Policy.objects.filter(pk__in=pk_set).values_list("community_id", flat=True))
+
+
+@receiver(pre_delete, sender=ActionType)
+def action_type_deleted_receiver(sender, instance, **kwargs):
+    """Rebuild the routing tables of the communities whose policies govern a deleted ActionType."""
+    routing.invalidate_communities(Policy.objects.filter(action_types=instance).values_list("community_id", flat=True))
+
+
+@receiver(request_finished)
+@receiver(task_postrun)
+def flush_step_stats_receiver(sender, **kwargs):
+    """Write the buffered policy step stats after a request or celery task, outside of its transaction."""
+    step_stats.flush_if_due()
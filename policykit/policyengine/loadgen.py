@@ -0,0 +1,236 @@
+"""
+Synthetic load for sizing workers. Run it with ``python manage.py generate_load``.
+
+For each scale, ``LoadGenerator`` creates N Slack communities, each set up with one of the starter kits in
+``starterkits/`` and M platform policies, and K pending proposals per community with a history of votes. Then it
+runs a number of beat ticks. Before each tick, a stream of new actions goes through the ingestion path
+(``GovernableAction.save``) and new votes are cast on pending proposals. Each tick evaluates the proposals made
+dirty by the votes, like ``evaluate_dirty_proposal`` would, and runs the real ``evaluate_pending_proposals``
+with celery tasks run inline.
+
+Everything runs against the fake Metagov in ``fakes.py``, in a transaction that is rolled back, so nothing is
+left in the database and no platform is called.
+"""
+import json
+import os
+import random
+import resource
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+# A majority vote, like the starter kits' vote policies, without starting a vote on the platform
+VOTE_POLICY = {
+    "name": "load test majority vote",
+    "description": "Passes once enough members voted yes, fails once enough voted no",
+    "filter": "return action.action_type == 'slackpinmessage'",
+    "initialize": "pass",
+    "notify": "pass",
+    "check": """
+yes_votes = proposal.get_yes_vote_count()
+no_votes = proposal.get_no_vote_count()
+if yes_votes >= {votes_to_close}:
+    return PASSED
+if no_votes >= {votes_to_close}:
+    return FAILED
+return PROPOSED
+""",
+    "success": "pass",
+    "fail": "pass",
+}
+
+# Policies for other kinds of actions, that are tried and rejected for every action
+OTHER_POLICY = {
+    "name": "load test policy {index}",
+    "description": "Governs actions that the load test doesn't generate",
+    "filter": "return action.action_type == 'slackrenameconversation'",
+    "initialize": "pass",
+    "notify": "pass",
+    "check": "return PASSED",
+    "success": "pass",
+    "fail": "pass",
+}
+
+
+def load_starterkits():
+    """The enabled starter kits, as dicts"""
+    import policyengine.utils as Utils
+
+    kits_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../starterkits")
+    kits = []
+    for info in Utils.get_starterkits_info():
+        with open(os.path.join(kits_dir, f"{info['id']}.json")) as f:
+            kits.append(json.load(f))
+    return kits
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def celery_tasks_inline():
+    """Run celery tasks inline while the body runs, so that the shards dispatched by a tick are evaluated"""
+    from policykit.celery import app
+
+    always_eager = app.conf.task_always_eager
+    app.conf.task_always_eager = True
+    try:
+        yield
+    finally:
+        app.conf.task_always_eager = always_eager
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class LoadGenerator:
+    def __init__(
+        self,
+        communities=10,
+        policies=5,
+        proposals=20,
+        members=20,
+        votes_to_close=10,
+        actions_per_tick=2,
+        votes_per_tick=10,
+        seed=0,
+    ):
+        self.communities = communities
+        self.policies = policies
+        self.proposals = proposals
+        self.members = members
+        self.votes_to_close = votes_to_close
+        self.actions_per_tick = actions_per_tick
+        self.votes_per_tick = votes_per_tick
+        self.random = random.Random(seed)
+        self.kits = load_starterkits()
+        # (slack community, members) for each community
+        self._communities = []
+
+    def run(self, ticks=5):
+        """Set up the communities, run the ticks, and return a report of each tick"""
+        from policyengine.fakes import fake_metagov
+
+        with fake_metagov(), celery_tasks_inline(), transaction.atomic():
+            try:
+                started = time.perf_counter()
+                self.set_up()
+                setup_seconds = time.perf_counter() - started
+                return {"setup_seconds": round(setup_seconds, 3), "ticks": [self.tick() for _ in range(ticks)]}
+            finally:
+                transaction.set_rollback(True)
+
+    def set_up(self):
+        import policyengine.utils as Utils
+        from django.contrib.auth.models import Permission
+        from integrations.slack.models import SlackCommunity, SlackPinMessage, SlackUser
+        from policyengine.models import BooleanVote, CommunityRole, Policy, Proposal, VoteTally
+
+        propose_permissions = list(Permission.objects.filter(name__startswith="Can add"))
+        for index in range(self.communities):
+            slack_community = SlackCommunity.objects.create(community_name=f"load test {index}", team_id=f"LOAD{index}")
+            community = slack_community.community
+            members = [
+                SlackUser.objects.create(username=f"load-{index}-{number}", community=slack_community)
+                for number in range(self.members)
+            ]
+            kit = self.kits[index % len(self.kits)]
+            Utils.initialize_starterkit_inner(community, kit, creator_username=members[0].username)
+            # let every member propose actions, so that they are governed by the vote policy
+            for role in CommunityRole.objects.filter(community=community, is_base_role=True):
+                role.permissions.add(*propose_permissions)
+
+            for number in range(self.policies - 1):
+                Policy.objects.create(
+                    **{**OTHER_POLICY, "name": OTHER_POLICY["name"].format(index=number)},
+                    kind=Policy.PLATFORM,
+                    community=community,
+                )
+            Policy.objects.create(
+                **{**VOTE_POLICY, "check": VOTE_POLICY["check"].format(votes_to_close=self.votes_to_close)},
+                kind=Policy.PLATFORM,
+                community=community,
+            )
+            self._communities.append((slack_community, members))
+
+            # pending proposals with a history of votes that doesn't decide them yet
+            for _ in range(self.proposals):
+                action = SlackPinMessage.objects.create(
+                    initiator=self.random.choice(members), community=slack_community, community_origin=True
+                )
+                proposal = Proposal.objects.filter(action=action, status=Proposal.PROPOSED).first()
+                if proposal is None:
+                    continue
+                voters = self.random.sample(members, min(len(members), 2 * (self.votes_to_close - 1)))
+                BooleanVote.objects.bulk_create(
+                    BooleanVote(proposal=proposal, user=voter, boolean_value=number % 2 == 0)
+                    for number, voter in enumerate(voters)
+                )
+                # bulk_create doesn't send the signals that keep the tally up to date
+                VoteTally.rebuild(proposal.pk)
+
+    def ingest(self):
+        """The stream of incoming actions and votes before a tick"""
+        from integrations.slack.models import SlackPinMessage
+        from policyengine.models import BooleanVote, Proposal
+
+        for slack_community, members in self._communities:
+            for _ in range(self.actions_per_tick):
+                SlackPinMessage.objects.create(
+                    initiator=self.random.choice(members), community=slack_community, community_origin=True
+                )
+            pending = list(
+                Proposal.objects.filter(
+                    status=Proposal.PROPOSED, action__community=slack_community
+                ).values_list("pk", flat=True)
+            )
+            for _ in range(min(self.votes_per_tick, len(pending))):
+                proposal_id = self.random.choice(pending)
+                voter = self.random.choice(members)
+                if not BooleanVote.objects.filter(proposal_id=proposal_id, user=voter).exists():
+                    BooleanVote.objects.create(
+                        proposal_id=proposal_id, user=voter, boolean_value=self.random.random() < 0.5
+                    )
+
+    def tick(self):
+        from policyengine import metrics
+        from policyengine.models import Proposal
+        from policyengine.tasks import evaluate_dirty_proposal, evaluate_pending_proposals
+
+        ingest_started = time.perf_counter()
+        ingest_queries = QueryCounter()
+        with connection.execute_wrapper(ingest_queries):
+            self.ingest()
+        ingest_seconds = time.perf_counter() - ingest_started
+
+        evaluations_before = metrics.proposal_evaluations.total()
+        tick_queries = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(tick_queries):
+            for proposal_id in Proposal.objects.filter(
+                status=Proposal.PROPOSED, dirty_since__isnull=False
+            ).values_list("pk", flat=True):
+                evaluate_dirty_proposal(proposal_id)
+            evaluate_pending_proposals()
+        tick_seconds = time.perf_counter() - started
+        evaluations = metrics.proposal_evaluations.total() - evaluations_before
+
+        return {
+            "ingest_seconds": round(ingest_seconds, 3),
+            "ingest_queries": ingest_queries.count,
+            "tick_seconds": round(tick_seconds, 3),
+            "evaluations": evaluations,
+            "evaluations_per_second": round(evaluations / tick_seconds, 1) if tick_seconds else None,
+            "queries_per_proposal": round(tick_queries.count / evaluations, 1) if evaluations else None,
+            "pending_proposals": Proposal.objects.filter(status=Proposal.PROPOSED).count(),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
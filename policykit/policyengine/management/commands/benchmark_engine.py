@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from policyengine import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs micro-benchmarks for the policy engine and prints the time per call. Results can be saved as a JSON "
+        "baseline, and compared with a baseline to find regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000, help="Number of calls per measurement")
+        parser.add_argument(
+            "--db-iterations", type=int, default=100, help="Number of calls per measurement for evaluation benchmarks"
+        )
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            choices=list(benchmarks.BENCHMARKS),
+            help="Only run these benchmarks (default: all of them)",
+        )
+        parser.add_argument("--platforms", type=int, default=1, help="Number of platforms for evaluation benchmarks")
+        parser.add_argument("--policies", type=int, default=10, help="Number of policies for evaluation benchmarks")
+        parser.add_argument("--output", help="Save the results as a JSON baseline to this path")
+        parser.add_argument("--compare", help="Compare the results with the JSON baseline at this path")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="With --compare, fail if a benchmark is slower than the baseline by more than this fraction",
+        )
+
+    def handle(self, *args, **options):
+        parameters = {
+            "iterations": options["iterations"],
+            "db_iterations": options["db_iterations"],
+            "platforms": options["platforms"],
+            "policies": options["policies"],
+        }
+        results = benchmarks.run_benchmarks(names=options["only"], **parameters)
+
+        if not options["compare"]:
+            for name, seconds in results.items():
+                self.stdout.write(f"{name:<40} {seconds * 1e6:10.2f} us")
+        else:
+            baseline = benchmarks.read_baseline(options["compare"])
+            if baseline.get("parameters") != parameters:
+                self.stderr.write(f"Warning: the baseline was measured with different parameters: {baseline.get('parameters')}")
+            comparison = benchmarks.compare(results, baseline, threshold=options["threshold"])
+            for name, baseline_seconds, seconds, ratio, regressed in comparison:
+                flag = "  REGRESSION" if regressed else ""
+                self.stdout.write(
+                    f"{name:<40} {baseline_seconds * 1e6:10.2f} us -> {seconds * 1e6:10.2f} us  {ratio:5.2f}x{flag}"
+                )
+
+        if options["output"]:
+            benchmarks.write_baseline(options["output"], results, **parameters)
+            self.stdout.write(f"Saved baseline to {options['output']}")
+
+        if options["compare"]:
+            regressions = [name for name, _, _, _, regressed in comparison if regressed]
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} benchmarks regressed by more than {options['threshold']:.0%}: "
+                    + ", ".join(regressions)
+                )
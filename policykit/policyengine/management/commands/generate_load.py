@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from policyengine.loadgen import LoadGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic communities, policies, pending proposals and incoming actions against a fake Metagov, "
+        "runs beat ticks, and reports tick duration, queries per proposal, peak RSS and evaluations per second "
+        "at each scale. Nothing is saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--communities", type=int, nargs="+", default=[1, 10], help="Numbers of communities to try, in order"
+        )
+        parser.add_argument("--policies", type=int, default=5, help="Platform policies per community")
+        parser.add_argument("--proposals", type=int, default=20, help="Pending proposals per community")
+        parser.add_argument("--members", type=int, default=20, help="Members per community")
+        parser.add_argument("--votes-to-close", type=int, default=10, help="Votes needed to pass or fail a proposal")
+        parser.add_argument("--actions-per-tick", type=int, default=2, help="New actions per community before each tick")
+        parser.add_argument("--votes-per-tick", type=int, default=10, help="New votes per community before each tick")
+        parser.add_argument("--ticks", type=int, default=5, help="Beat ticks to run at each scale")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", action="store_true", help="Print the full reports as JSON")
+
+    def handle(self, *args, **options):
+        reports = []
+        if not options["json"]:
+            self.stdout.write(
+                f"{'communities':>11} {'tick s':>8} {'evals':>6} {'evals/s':>8} {'queries/prop':>12} "
+                f"{'ingest s':>9} {'pending':>8} {'peak RSS MB':>11}"
+            )
+        for communities in options["communities"]:
+            generator = LoadGenerator(
+                communities=communities,
+                policies=options["policies"],
+                proposals=options["proposals"],
+                members=options["members"],
+                votes_to_close=options["votes_to_close"],
+                actions_per_tick=options["actions_per_tick"],
+                votes_per_tick=options["votes_per_tick"],
+                seed=options["seed"],
+            )
+            report = generator.run(ticks=options["ticks"])
+            report["communities"] = communities
+            reports.append(report)
+            if not options["json"]:
+                for tick in report["ticks"]:
+                    self.stdout.write(
+                        f"{communities:>11} {tick['tick_seconds']:>8} {tick['evaluations']:>6} "
+                        f"{tick['evaluations_per_second'] or '-':>8} {tick['queries_per_proposal'] or '-':>12} "
+                        f"{tick['ingest_seconds']:>9} {tick['pending_proposals']:>8} {tick['peak_rss_mb']:>11}"
+                    )
+        if options["json"]:
+            self.stdout.write(json.dumps(reports, indent=2))
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from policyengine import replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays platform events and governance process outcomes captured with REPLAY_CAPTURE_PATH against a fake "
+        "Metagov, in a transaction that is rolled back, and reports the throughput, decision latency and final "
+        "proposal states"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Capture files, merged in the order they were captured")
+        parser.add_argument("--community", help="Only replay the records of the Metagov community with this slug")
+        parser.add_argument("--into", help="Replay the records into the community with this Metagov slug instead")
+        parser.add_argument(
+            "--sweep", action="store_true", help="Evaluate pending proposals once more at the end, like a beat tick"
+        )
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON, to compare runs")
+
+    def handle(self, *args, **options):
+        report = replay.replay(
+            options["paths"], community=options["community"], into=options["into"], sweep=options["sweep"]
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"Replayed {report['events']} events and {report['outcomes']} outcomes of {report['records']} records "
+            f"({report['skipped']} skipped, {report['errors']} errors) in {report['duration']:.2f}s"
+        )
+        self.stdout.write(f"throughput       {report['throughput']} records/s")
+        self.stdout.write(f"latency p50      {report['latency_p50_ms']} ms")
+        self.stdout.write(f"latency p99      {report['latency_p99_ms']} ms")
+        self.stdout.write(f"evaluations      {report['evaluations']}")
+        self.stdout.write(f"platform calls   {report['platform_calls']}")
+        for status, count in sorted(report["proposal_states"].items()):
+            self.stdout.write(f"proposals {status:<10} {count}")
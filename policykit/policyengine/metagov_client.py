@@ -2,6 +2,7 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+from policyengine import explain, replay, step_stats, tracing
 from policyengine.metagov_app import metagov
 
 
@@ -17,9 +18,9 @@ class Metagov:
     Metagov client library to be exposed to policy author
     """
 
-    def __init__(self, proposal):
+    def __init__(self, proposal, metagov_slug=None):
         self.proposal = proposal
-        self.metagov_slug = proposal.policy.community.metagov_slug
+        self.metagov_slug = metagov_slug or proposal.policy.community.metagov_slug
 
     def start_process(self, process_name, **kwargs) -> MetagovProcessData:
         """
@@ -30,6 +31,7 @@ class Metagov:
         plugin_name, process_name = process_name.split(".")
         plugin = community.get_plugin(plugin_name)
         process = plugin.start_process(process_name, **kwargs)
+        replay.capture_process_started(process)
 
         # store reference to process on the proposal
         self.proposal.governance_process = process
@@ -64,9 +66,12 @@ class Metagov:
         Perform an action through Metagov. If the requested action belongs to a plugin that is
         not active for the current community, this will throw an exception.
         """
-        community = metagov.get_community(self.metagov_slug)
-        plugin_name, action_id = name.split(".")
+        step_stats.count_api_call()
+        explain.api_call(name)
+        with tracing.span("Metagov.perform_action", action=name):
+            community = metagov.get_community(self.metagov_slug)
+            plugin_name, action_id = name.split(".")
 
-        return community.perform_action(
-            plugin_name, action_id, parameters=kwargs, community_platform_id=None  # FIXME pass team_id?
-        )
+            return community.perform_action(
+                plugin_name, action_id, parameters=kwargs, community_platform_id=None  # FIXME pass team_id?
+            )
@@ -0,0 +1,407 @@
+"""
+Engine metrics, served in the Prometheus text format by the ``/metrics`` view.
+
+Counters, gauges and histograms are kept in process memory, so updating them is cheap. With several processes
+(gunicorn and celery workers), set METRICS_MULTIPROCESS_DIR to a directory shared by all of them: each process
+then writes its values to its own file in that directory, at most every METRICS_WRITE_INTERVAL seconds, and a
+scrape adds up the files of all processes. Clear the directory when deploying, like prometheus_client's
+multiprocess mode.
+
+Metrics that come from the database or the broker, like the number of pending proposals, are collected when
+scraped, and cached in the process for METRICS_COLLECT_CACHE_SECONDS so that frequent scrapes don't load the database.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.RLock()
+_metrics = {}
+# metric name -> {label values: value}. For gauges the value is [value, timestamp],
+# for histograms it's [bucket counts..., sum, count].
+_values = {}
+_last_write = 0.0
+_collectors = []
+# time of the last beat tick in this process, without METRICS_MULTIPROCESS_DIR
+_last_beat_tick = None
+# key -> (expiry, value) of collected metrics
+_collected = {}
+
+
+class Metric:
+    def __init__(self, name, documentation, kind, labelnames=(), buckets=None):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+        with _lock:
+            _metrics[name] = self
+            _values.setdefault(name, {})
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+
+class Counter(Metric):
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, COUNTER, labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            values = _values[self.name]
+            values[key] = values.get(key, 0) + amount
+        _changed()
+
+    def total(self):
+        """Sum of the counter over all label values, in this process"""
+        with _lock:
+            return sum(_values[self.name].values())
+
+
+class Gauge(Metric):
+    """A gauge set by the process that measures it. With several processes, the most recently set value wins."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, GAUGE, labelnames)
+
+    def set(self, value, **labels):
+        with _lock:
+            _values[self.name][self._key(labels)] = [value, time.time()]
+        _changed()
+
+
+class Histogram(Metric):
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, HISTOGRAM, labelnames, buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            values = _values[self.name]
+            counts = values.get(key)
+            if counts is None:
+                counts = values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+        _changed()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the body, in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+def collector(func):
+    """
+    Register a function that is called when metrics are scraped, and returns a list of
+    (name, documentation, kind, [(labels dict, value)]) tuples.
+    """
+    _collectors.append(func)
+    return func
+
+
+def _process_file(directory, pid=None):
+    return os.path.join(directory, f"metrics_{pid or os.getpid()}.json")
+
+
+def _changed():
+    if settings.METRICS_MULTIPROCESS_DIR and time.monotonic() - _last_write >= settings.METRICS_WRITE_INTERVAL:
+        write_process_file()
+
+
+def write_process_file():
+    """Write this process's values to its file in METRICS_MULTIPROCESS_DIR"""
+    global _last_write
+    directory = settings.METRICS_MULTIPROCESS_DIR
+    if not directory:
+        return
+    with _lock:
+        _last_write = time.monotonic()
+        data = {name: [[list(key), value] for key, value in values.items()] for name, values in _values.items()}
+    path = _process_file(directory)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to write metrics to {path}: {repr(e)} {e}")
+
+
+@atexit.register
+def _write_on_exit():
+    try:
+        write_process_file()
+    except Exception:
+        pass
+
+
+def _merge(kind, total, value):
+    if total is None:
+        return list(value) if isinstance(value, list) else value
+    if kind == COUNTER:
+        return total + value
+    if kind == GAUGE:
+        return value if value[1] > total[1] else total
+    return [a + b for a, b in zip(total, value)]
+
+
+def _all_values():
+    """Values of all processes, merged"""
+    directory = settings.METRICS_MULTIPROCESS_DIR
+    if not directory:
+        with _lock:
+            return {
+                name: {key: list(value) if isinstance(value, list) else value for key, value in values.items()}
+                for name, values in _values.items()
+            }
+
+    write_process_file()
+    merged = {name: {} for name in _metrics}
+    try:
+        filenames = [name for name in os.listdir(directory) if name.startswith("metrics_") and name.endswith(".json")]
+    except OSError:
+        filenames = []
+    for filename in filenames:
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, items in data.items():
+            metric = _metrics.get(name)
+            if metric is None:
+                continue
+            for key, value in items:
+                key = tuple(key)
+                merged[name][key] = _merge(metric.kind, merged[name].get(key), value)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+def _format_bound(bound):
+    return _format_value(float(bound))
+
+
+def render():
+    """All metrics, in the Prometheus text exposition format"""
+    lines = []
+    all_values = _all_values()
+    for name, metric in sorted(_metrics.items()):
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(all_values.get(name, {}).items()):
+            labels = dict(zip(metric.labelnames, key))
+            if metric.kind == COUNTER:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            elif metric.kind == GAUGE:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value[0])}")
+            else:
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    bucket_labels = {**labels, "le": _format_bound(bound)}
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f'{name}_bucket{_format_labels({**labels, "le": "+Inf"})} {value[-1]}')
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+
+    for func in _collectors:
+        try:
+            collected = func()
+        except Exception as e:
+            logger.warning(f"Metrics collector {func.__name__} failed: {repr(e)} {e}")
+            continue
+        for name, documentation, kind, samples in collected:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+proposal_evaluations = Counter(
+    "policykit_proposal_evaluations_total",
+    "Proposal evaluations, by outcome (passed, failed, proposed or error)",
+    ["outcome"],
+)
+policy_step_seconds = Histogram(
+    "policykit_policy_step_seconds",
+    "Time spent running a policy step (exec_code_block)",
+    ["step"],
+)
+votes = Counter(
+    "policykit_votes_total",
+    "Votes cast, changed or removed, by vote type",
+    ["vote_type", "event"],
+)
+beat_tick_seconds = Histogram(
+    "policykit_beat_tick_seconds",
+    "Time spent dispatching the evaluation of pending proposals on a beat tick",
+)
+beat_tick_lag_seconds = Gauge(
+    "policykit_beat_tick_lag_seconds",
+    "How much later than CELERY_BEAT_FREQUENCY after the previous tick the last beat tick ran",
+)
+shard_seconds = Histogram(
+    "policykit_proposal_shard_seconds",
+    "Time spent evaluating a shard of pending proposals",
+)
+log_rows_pruned = Counter(
+    "policykit_log_rows_pruned_total",
+    "Log rows deleted by retention (see policyengine/retention.py), by table",
+    ["table"],
+)
+
+
+def _swap_last_beat_tick(now):
+    """
+    Set the time of the last beat tick, and return the time of the previous one. Ticks run in any celery process,
+    so with METRICS_MULTIPROCESS_DIR the time is kept in a file there, shared by all of them.
+    """
+    global _last_beat_tick
+    directory = settings.METRICS_MULTIPROCESS_DIR
+    if not directory:
+        with _lock:
+            previous, _last_beat_tick = _last_beat_tick, now
+        return previous
+
+    path = os.path.join(directory, "beat_tick.json")
+    try:
+        with open(path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(now, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to write the beat tick time to {path}: {repr(e)} {e}")
+    return previous
+
+
+def record_beat_tick():
+    """Track the lag of beat ticks, by comparing with the time of the previous tick in any process"""
+    now = time.time()
+    previous = _swap_last_beat_tick(now)
+    if previous is not None:
+        beat_tick_lag_seconds.set(max(0.0, now - previous - settings.CELERY_BEAT_FREQUENCY))
+
+
+def _cached(key, compute):
+    """The value of ``compute()``, computed at most once every METRICS_COLLECT_CACHE_SECONDS in this process"""
+    now = time.monotonic()
+    with _lock:
+        expiry, value = _collected.get(key, (0, None))
+    if now >= expiry:
+        value = compute()
+        with _lock:
+            _collected[key] = (now + settings.METRICS_COLLECT_CACHE_SECONDS, value)
+    return value
+
+
+@collector
+def collect_pending_proposals():
+    def compute():
+        from django.db.models import Count
+        from policyengine.models import Proposal
+
+        return list(
+            Proposal.objects.filter(status=Proposal.PROPOSED)
+            .values_list("action__community__community_id")
+            .annotate(count=Count("pk"))
+            .order_by()
+        )
+
+    samples = [({"community": community_id}, count) for community_id, count in _cached("metrics:pending", compute)]
+    return [("policykit_pending_proposals", "Pending proposals, by community", GAUGE, samples)]
+
+
+@collector
+def collect_log_api_calls():
+    def compute():
+        from policyengine.models import LogAPICall
+        from policyengine.retention import estimated_row_count
+
+        return estimated_row_count(LogAPICall)
+
+    rows = _cached("metrics:log_api_calls", compute)
+    return [("policykit_log_api_calls", "Number of rows in the LogAPICall table (estimated on postgres)", GAUGE, [({}, rows)])]
+
+
+@collector
+def collect_evaluation_logs():
+    def compute():
+        from django_db_logger.models import EvaluationLog
+        from policyengine.retention import estimated_row_count
+
+        return estimated_row_count(EvaluationLog)
+
+    rows = _cached("metrics:evaluation_logs", compute)
+    return [("policykit_evaluation_logs", "Number of rows in the EvaluationLog table (estimated on postgres)", GAUGE, [({}, rows)])]
+
+
+@collector
+def collect_celery_queue_length():
+    def compute():
+        from policykit.celery import app
+
+        lengths = []
+        queue_names = [queue.name for queue in app.amqp.queues.values()] or [app.conf.task_default_queue]
+        with app.connection_for_read() as conn:
+            channel = conn.default_channel
+            for queue_name in queue_names:
+                try:
+                    lengths.append((queue_name, channel.queue_declare(queue=queue_name, passive=True).message_count))
+                except Exception as e:
+                    logger.debug(f"Could not get length of celery queue {queue_name}: {repr(e)} {e}")
+        return lengths
+
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        return []
+    samples = [({"queue": queue_name}, length) for queue_name, length in _cached("metrics:celery_queues", compute)]
+    return [("policykit_celery_queue_length", "Messages waiting in each celery queue", GAUGE, samples)]
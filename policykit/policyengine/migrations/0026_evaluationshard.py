@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0025_alter_transformer_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvaluationShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_key', models.CharField(max_length=64, unique=True)),
+                ('lease_token', models.CharField(blank=True, max_length=36)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_result', models.JSONField(blank=True, default=dict)),
+            ],
+        ),
+    ]
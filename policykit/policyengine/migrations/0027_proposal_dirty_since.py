@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0026_evaluationshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proposal',
+            name='dirty_since',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0027_proposal_dirty_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proposal',
+            name='next_evaluation_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
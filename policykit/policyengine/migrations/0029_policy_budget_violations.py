@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0028_proposal_next_evaluation_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='policy',
+            name='budget_violations',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='policy',
+            name='is_degraded',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0029_policy_budget_violations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyStepStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(max_length=30)),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('wall_time', models.FloatField(default=0)),
+                ('cpu_time', models.FloatField(default=0)),
+                ('queries', models.PositiveIntegerField(default=0)),
+                ('api_calls', models.PositiveIntegerField(default=0)),
+                ('max_wall_time', models.FloatField(default=0)),
+                ('wall_time_histogram', models.JSONField(blank=True, default=list)),
+                ('queries_histogram', models.JSONField(blank=True, default=list)),
+                ('community', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='policyengine.community')),
+                ('policy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='policyengine.policy')),
+            ],
+            options={
+                'unique_together': {('policy', 'step', 'hour')},
+            },
+        ),
+    ]
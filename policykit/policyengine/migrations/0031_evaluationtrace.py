@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0030_policystepstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvaluationTrace',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('duration', models.FloatField(default=0)),
+                ('entries', models.JSONField(blank=True, default=list)),
+                ('truncated', models.BooleanField(default=False)),
+                ('action', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evaluation_traces', to='policyengine.baseaction')),
+            ],
+            options={
+                'ordering': ['-created_at', '-pk'],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def _boolean_key(boolean_value):
+    return ("yes" if boolean_value else "no",)
+
+
+# vote type -> (model name, fields counted, key of the counted values)
+VOTE_TYPES = {
+    "boolean": ("BooleanVote", ("boolean_value",), _boolean_key),
+    "choice": ("ChoiceVote", ("value",), lambda value: (str(value),)),
+    "number": ("NumberVote", ("number_value",), lambda number_value: (str(number_value),)),
+    "select": ("SelectVote", ("candidate", "option"), lambda candidate, option: (candidate, option)),
+}
+
+
+def count_existing_votes(apps, schema_editor):
+    VoteTally = apps.get_model("policyengine", "VoteTally")
+    tallies = {}
+    for vote_type, (model_name, fields, key_for) in VOTE_TYPES.items():
+        vote_model = apps.get_model("policyengine", model_name)
+        rows = (
+            vote_model.objects.exclude(**{f"{field}__isnull": True for field in fields})
+            .order_by()
+            .values_list("proposal_id", *fields)
+            .annotate(count=Count("pk"))
+        )
+        for proposal_id, *values, count in rows.iterator():
+            counts = tallies.setdefault(proposal_id, {}).setdefault(vote_type, {})
+            *parents, last = key_for(*values)
+            for part in parents:
+                counts = counts.setdefault(part, {})
+            counts[last] = counts.get(last, 0) + count
+
+    VoteTally.objects.bulk_create(
+        [VoteTally(proposal_id=proposal_id, counts=counts) for proposal_id, counts in tallies.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0031_evaluationtrace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteTally',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counts', models.JSONField(blank=True, default=dict)),
+                ('proposal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='vote_tally', to='policyengine.proposal')),
+            ],
+        ),
+        migrations.RunPython(count_existing_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:05
+
+import importlib
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+# vote model -> the fields that identify a voter's vote
+UNIQUE_VOTES = {
+    "BooleanVote": ("proposal", "user"),
+    "ChoiceVote": ("proposal", "user"),
+    "SelectVote": ("proposal", "user", "candidate"),
+}
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """Keep only the latest vote of each voter, and count the votes of the proposals that had duplicates again"""
+    VoteTally = apps.get_model("policyengine", "VoteTally")
+    recount = set()
+    for model_name, fields in UNIQUE_VOTES.items():
+        vote_model = apps.get_model("policyengine", model_name)
+        duplicates = (
+            vote_model.objects.order_by()
+            .values(*fields)
+            .annotate(latest=Max("pk"), votes=Count("pk"))
+            .filter(votes__gt=1)
+        )
+        for duplicate in duplicates.iterator():
+            latest = duplicate.pop("latest")
+            duplicate.pop("votes")
+            vote_model.objects.filter(**duplicate).exclude(pk=latest).delete()
+            recount.add(duplicate["proposal"])
+
+    if recount:
+        vote_tally_migration = importlib.import_module("policyengine.migrations.0032_votetally")
+        for proposal_id in recount:
+            counts = {}
+            for vote_type, (model_name, fields, key_for) in vote_tally_migration.VOTE_TYPES.items():
+                vote_model = apps.get_model("policyengine", model_name)
+                rows = (
+                    vote_model.objects.filter(proposal_id=proposal_id)
+                    .exclude(**{f"{field}__isnull": True for field in fields})
+                    .order_by()
+                    .values_list(*fields)
+                    .annotate(count=Count("pk"))
+                )
+                for *values, count in rows:
+                    type_counts = counts.setdefault(vote_type, {})
+                    *parents, last = key_for(*values)
+                    for part in parents:
+                        type_counts = type_counts.setdefault(part, {})
+                    type_counts[last] = type_counts.get(last, 0) + count
+            VoteTally.objects.update_or_create(proposal_id=proposal_id, defaults={"counts": counts})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0032_votetally'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+    ]
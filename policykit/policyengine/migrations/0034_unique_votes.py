@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0033_remove_duplicate_votes'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='booleanvote',
+            unique_together={('proposal', 'user')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='choicevote',
+            unique_together={('proposal', 'user')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='selectvote',
+            unique_together={('proposal', 'user', 'candidate')},
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_auto_20211101_2053'),
+        ('policyengine', '0034_unique_votes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteOutcomeSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('vote_type', models.CharField(max_length=30)),
+                ('votes', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('process', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.governanceprocess')),
+            ],
+        ),
+    ]
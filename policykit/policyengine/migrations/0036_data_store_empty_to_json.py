@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:30
+
+from django.db import migrations
+
+
+def empty_data_stores_to_json(apps, schema_editor):
+    """Empty DataStores were stored as '', which isn't valid JSON"""
+    DataStore = apps.get_model("policyengine", "DataStore")
+    DataStore.objects.filter(data_store="").update(data_store="{}")
+
+
+def json_to_empty_data_stores(apps, schema_editor):
+    DataStore = apps.get_model("policyengine", "DataStore")
+    DataStore.objects.filter(data_store="{}").update(data_store="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0035_voteoutcomesnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(empty_data_stores_to_json, json_to_empty_data_stores),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0036_data_store_empty_to_json'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='datastore',
+            name='data_store',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0037_alter_datastore_data_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogAPICallKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call_type', models.CharField(max_length=300)),
+                ('key', models.CharField(max_length=100)),
+                ('value_hash', models.CharField(max_length=32)),
+                ('created_at', models.DateTimeField()),
+                ('community', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='policyengine.communityplatform')),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keys', to='policyengine.logapicall')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='logapicallkey',
+            index=models.Index(fields=['community', 'call_type', 'key', 'value_hash', 'created_at'], name='policyengin_communi_8cd5dc_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0038_logapicallkey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logapicall',
+            index=models.Index(fields=['proposal_time'], name='policyengin_proposa_9e79c9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logapicall',
+            index=models.Index(fields=['call_type', 'proposal_time'], name='policyengin_call_ty_4636bc_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0039_logapicall_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='policy_routing_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
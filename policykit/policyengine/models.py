@@ -1,13 +1,16 @@
+import copy
 import json
 import logging
-from datetime import datetime, timezone
+import uuid
+from datetime import datetime, timedelta, timezone
 from operator import is_
 
 from actstream import action as actstream_action
+from django.conf import settings
 from django.contrib.auth.models import Group, User, UserManager
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Q
 from django.db.models.deletion import CASCADE
 from django.db.models.signals import post_delete, pre_delete
 from django.dispatch import receiver
@@ -16,7 +19,8 @@ from metagov.core.models import GovernanceProcess
 from polymorphic.models import PolymorphicManager, PolymorphicModel
 
 import policyengine.utils as Utils
-from policyengine import engine
+from policyengine import api_call_keys, data_session, dirty_queue, engine, explain, step_stats, tracing
+from policyengine.code_cache import compiled_code_cache
 from policyengine.metagov_app import metagov
 
 logger = logging.getLogger(__name__)
@@ -32,6 +36,8 @@ class Community(models.Model):
     """A Community represents a group of users. They may exist on one or more online platforms."""
 
     metagov_slug = models.SlugField(max_length=36, unique=True, null=True, blank=True)
+    policy_routing_version = models.PositiveIntegerField(default=0)
+    """Bumped when the community's policies change, so that routing tables are rebuilt (see policyengine/routing.py)"""
 
     def __str__(self):
         prefix = super().__str__()
@@ -407,17 +413,19 @@ class CommunityDoc(models.Model):
 class DataStore(models.Model):
     """DataStore used for persisting serializable data on a Proposal."""
 
-    data_store = models.TextField()
+    data_store = models.JSONField(default=dict, blank=True)
 
     def _get_data_store(self):
-        if self.data_store != '':
-            return json.loads(self.data_store)
-        else:
-            return {}
+        session = data_session.current()
+        if session is not None:
+            return session.data(self)
+        return self.data_store or {}
 
-    def _set_data_store(self, obj):
-        self.data_store = json.dumps(obj)
-        self.save()
+    def _apply(self, changes):
+        data = data_session.apply_changes(self.pk, changes)
+        if data is not None:
+            self.data_store = data
+        dirty_queue.data_store_changed(self)
 
     def get(self, key):
         """
@@ -428,12 +436,14 @@ class DataStore(models.Model):
         key
             The key associated with the value.
         """
-        obj = self._get_data_store()
-        return obj.get(key, None)
+        value = self._get_data_store().get(key, None)
+        # the data is shared by later reads, so return a copy that the caller can change
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
 
     def set(self, key, value):
         """
-        Stores the given value, referenced by the given key.
+        Stores the given value, referenced by the given key. Only this key is written, so values stored under
+        other keys at the same time aren't lost.
 
         Parameters
         -------
@@ -442,9 +452,13 @@ class DataStore(models.Model):
         value
             The value to store.
         """
-        obj = self._get_data_store()
-        obj[key] = value
-        self._set_data_store(obj)
+        # store the value as it will be read back, and fail now if it isn't serializable
+        value = json.loads(json.dumps(value))
+        session = data_session.current()
+        if session is not None:
+            session.set(self, key, value)
+        else:
+            self._apply({key: (data_session.SET, value)})
         return True # NOTE: Why does this line exist?
 
     def remove(self, key):
@@ -456,13 +470,37 @@ class DataStore(models.Model):
         key
             The key associated with the value to be removed.
         """
-        obj = self._get_data_store()
-        res = obj.pop(key, None)
-        self._set_data_store(obj)
+        session = data_session.current()
+        if session is not None:
+            res = session.remove(self, key)
+        else:
+            res = self._get_data_store().get(key, None)
+            self._apply({key: (data_session.REMOVE, None)})
         if not res:
             return False
         return True
 
+    def increment(self, key, amount=1):
+        """
+        Adds ``amount`` to the number stored under the given key (which counts as 0 if it isn't set), and returns the
+        new value. Increments made at the same time, for example by evaluations triggered by different votes, are
+        all counted.
+
+        Parameters
+        -------
+        key
+            The key of the number.
+        amount
+            The number to add. Default is 1.
+        """
+        if not isinstance(amount, (int, float)) or isinstance(amount, bool):
+            raise TypeError(f"Can't increment by {amount!r}")
+        session = data_session.current()
+        if session is not None:
+            return session.increment(self, key, amount)
+        self._apply({key: (data_session.INCREMENT, amount)})
+        return self.data_store.get(key)
+
 class LogAPICall(models.Model):
     """
     Stores a record of an API call being made, and calls on the CommunityPlatform to make the API call.
@@ -479,17 +517,84 @@ class LogAPICall(models.Model):
     # JSON blob of the request payload, which is used for matching the incoming event with recent requests.
     extra_info = models.TextField()
 
+    class Meta:
+        # for pruning expired calls (see policyengine/retention.py)
+        indexes = [
+            models.Index(fields=["proposal_time"]),
+            models.Index(fields=["call_type", "proposal_time"]),
+        ]
+
     def __str__(self):
         return f"LogAPICall {self.call_type} ({self.pk})"
 
     @classmethod
-    def make_api_call(cls, community, values, call, action=None, method=None):
-        LogAPICall.objects.create(
-            community=community,
-            call_type=call,
-            extra_info=json.dumps(values)
+    def log_call(cls, community, call, values):
+        """Record a call to the platform, with the keys that ``was_recently_made`` matches events with"""
+        log = cls.objects.create(community=community, call_type=call, extra_info=json.dumps(values))
+        keys = api_call_keys.match_keys(call, values)
+        LogAPICallKey.objects.bulk_create(
+            LogAPICallKey(
+                log=log,
+                community=community,
+                call_type=call_type,
+                key=key,
+                value_hash=value_hash,
+                created_at=log.proposal_time,
+            )
+            for call_type, key, value_hash in keys
         )
-        return community.make_call(call, values=values, action=action, method=method)
+        api_call_keys.remember(community.pk, keys)
+        return log
+
+    @classmethod
+    def was_recently_made(cls, community, call_type, key, value, seconds):
+        """
+        Returns True if PolicyKit made a ``call_type`` call for the community in the last ``seconds`` seconds with
+        ``key`` equal to ``value``, meaning that a platform event about that value was probably caused by PolicyKit.
+        """
+        value_hash = api_call_keys.hash_value(value)
+        if api_call_keys.seen_recently(community.pk, call_type, key, value_hash, seconds):
+            return True
+        return LogAPICallKey.objects.filter(
+            community=community,
+            call_type=call_type,
+            key=key,
+            value_hash=value_hash,
+            created_at__gte=datetime.now(timezone.utc) - timedelta(seconds=seconds),
+        ).exists()
+
+    @classmethod
+    def make_api_call(cls, community, values, call, action=None, method=None):
+        step_stats.count_api_call()
+        explain.api_call(call)
+        with tracing.span("LogAPICall.make_api_call", call=call, platform=community.platform):
+            cls.log_call(community, call, values)
+            return community.make_call(call, values=values, action=action, method=method)
+
+
+class LogAPICallKey(models.Model):
+    """
+    A top-level value of a ``LogAPICall``, hashed and indexed so that incoming events can be matched with recent
+    calls in one query (see ``policyengine/api_call_keys.py``).
+
+    :meta private:
+    """
+
+    log = models.ForeignKey(LogAPICall, models.CASCADE, related_name="keys")
+    community = models.ForeignKey(CommunityPlatform, models.CASCADE, related_name="+")
+    call_type = models.CharField(max_length=300)
+    key = models.CharField(max_length=100)
+    value_hash = models.CharField(max_length=32)
+    created_at = models.DateTimeField()
+    """Same as the ``proposal_time`` of the log"""
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["community", "call_type", "key", "value_hash", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"LogAPICallKey {self.call_type} {self.key} ({self.log_id})"
 
 class Proposal(models.Model):
     """The Proposal model represents the evaluation of a particular policy for a particular action.
@@ -525,6 +630,17 @@ class Proposal(models.Model):
     governance_process = models.ForeignKey(GovernanceProcess, on_delete=models.SET_NULL, blank=True, null=True)
     """The Metagov GovernanceProcess that is being used to make a decision about this Proposal, if any."""
 
+    next_evaluation_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    """When the pending proposal next needs to be checked, as declared by the policy with ``check_again_at``.
+    The periodic sweep skips the proposal until then, unless its votes or data change."""
+
+    dirty_since = models.DateTimeField(null=True, blank=True, db_index=True)
+    """When something the proposal depends on (votes, data, governance process) changed since it was last
+    evaluated. Set while an evaluation is scheduled. See ``policyengine/dirty_queue.py``.
+
+    :meta private:
+    """
+
     def __str__(self):
         return f"Proposal {self.pk}: {self.action} : {self.policy or 'POLICY_DELETED'} ({self.status})"
 
@@ -552,6 +668,24 @@ class Proposal(models.Model):
         """
         return datetime.now(timezone.utc) - self.proposal_time
 
+    def check_again_at(self, when):
+        """
+        Declare that the proposal doesn't need to be checked again before ``when`` (a timezone-aware datetime),
+        unless its votes or data change. Call this from ``check`` before returning ``PROPOSED``. It only applies to
+        the current evaluation; if it's called more than once, the earliest time is used.
+        """
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        if self.next_evaluation_at is None or when < self.next_evaluation_at:
+            self.next_evaluation_at = when
+
+    def check_again_after(self, delta):
+        """
+        Declare that the proposal doesn't need to be checked again for the given ``timedelta``, unless its votes
+        or data change. See ``check_again_at``.
+        """
+        self.check_again_at(datetime.now(timezone.utc) + delta)
+
     def get_all_boolean_votes(self, users=None):
         """
         For Boolean voting. Returns all boolean votes as a QuerySet. Can specify a subset of users to count votes of. If no subset is specified, then votes from all users will be counted.
@@ -568,13 +702,12 @@ class Proposal(models.Model):
 
     def get_select_votes_by_users(self):
         """ Returns all select votes by a given user """
-        select_votes = SelectVote.objects.filter(proposal=self)
+        select_votes = SelectVote.objects.filter(proposal=self).values_list("user__username", "candidate", "option")
         outcomes = {}
-        for vote in select_votes:
-            username = vote.user.username
+        for username, candidate, option in select_votes:
             if username not in outcomes:
                 outcomes[username] = {}
-            outcomes[username][vote.candidate] = vote.option
+            outcomes[username][candidate] = option
         return outcomes
 
     def get_select_votes_by_candidates(self, users=None):
@@ -583,12 +716,12 @@ class Proposal(models.Model):
         else:
             select_votes = SelectVote.objects.filter(proposal=self)
         outcomes = {}
-        for vote in select_votes:
-            if vote.candidate not in outcomes:
-                outcomes[vote.candidate] = {}
-            if vote.option not in outcomes[vote.candidate]:
-                outcomes[vote.candidate][vote.option] = []
-            outcomes[vote.candidate][vote.option].append(vote.user.username)
+        for candidate, option, username in select_votes.values_list("candidate", "option", "user__username"):
+            if candidate not in outcomes:
+                outcomes[candidate] = {}
+            if option not in outcomes[candidate]:
+                outcomes[candidate][option] = []
+            outcomes[candidate][option].append(username)
         return outcomes
 
     def get_select_voters(self):
@@ -647,6 +780,62 @@ class Proposal(models.Model):
             return NumberVote.objects.filter(number_value=value, proposal=self, user__in=users)
         return NumberVote.objects.filter(number_value=value, proposal=self)
 
+    def get_vote_counts(self):
+        """
+        Returns the number of votes cast on this proposal, by vote type and value, for example
+        ``{"boolean": {"yes": 3, "no": 1}, "select": {"candidate": {"option": 2}}}``. The counts are kept up to date
+        as votes are cast, changed and removed, so this is a single query however many users voted.
+        """
+        counts = VoteTally.objects.filter(proposal_id=self.pk).values_list("counts", flat=True).first()
+        return counts or {}
+
+    def get_yes_vote_count(self):
+        """
+        For Boolean voting. Returns the number of yes votes, in a single query. To only count the votes of some
+        users, use ``get_yes_votes(users).count()``.
+        """
+        return self.get_vote_counts().get(BooleanVote.TALLY_TYPE, {}).get("yes", 0)
+
+    def get_no_vote_count(self):
+        """
+        For Boolean voting. Returns the number of no votes, in a single query. To only count the votes of some
+        users, use ``get_no_votes(users).count()``.
+        """
+        return self.get_vote_counts().get(BooleanVote.TALLY_TYPE, {}).get("no", 0)
+
+    def get_choice_vote_counts(self):
+        """
+        For Choice voting. Returns a dict of the number of votes for each value that received votes, in a single query.
+        """
+        return self.get_vote_counts().get(ChoiceVote.TALLY_TYPE, {})
+
+    def get_number_vote_counts(self):
+        """
+        For Number voting. Returns a dict of the number of votes for each number that received votes, in a single query.
+        """
+        return {int(value): count for value, count in self.get_vote_counts().get(NumberVote.TALLY_TYPE, {}).items()}
+
+    def get_select_vote_counts(self):
+        """
+        For Select voting. Returns a dict of the number of votes for each option of each candidate, like
+        ``{candidate: {option: count}}``, in a single query. To know who voted, use ``get_select_votes_by_candidates``.
+        """
+        return self.get_vote_counts().get(SelectVote.TALLY_TYPE, {})
+
+    def get_voters(self, vote_type=None):
+        """
+        Returns the set of usernames of the users who voted on this proposal, in a single query. ``vote_type`` is one
+        of "boolean", "choice", "number" or "select", to only include voters of that type of vote.
+        """
+        querysets = [
+            vote_class.objects.filter(proposal=self).values_list("user__username", flat=True)
+            for vote_class in VOTE_CLASSES
+            if vote_type is None or vote_class.TALLY_TYPE == vote_type
+        ]
+        if not querysets:
+            raise ValueError(f"Unknown vote type {vote_type}")
+        return set(querysets[0].union(*querysets[1:]))
+
     def save(self, *args, **kwargs):
         """
         Saves the proposal. Note: Only meant for internal use.
@@ -657,14 +846,26 @@ class Proposal(models.Model):
             self.data = DataStore.objects.create()
         super(Proposal, self).save(*args, **kwargs)
 
+    def _complete_evaluation(self, status):
+        """
+        Moves the proposal from PROPOSED to ``status``. It's a conditional UPDATE, so if two workers evaluate the
+        proposal at once, only one of them completes it. Returns False if the proposal was already completed.
+
+        :meta private:
+        """
+        if not Proposal.objects.filter(pk=self.pk, status=Proposal.PROPOSED).update(status=status):
+            return False
+        self.status = status
+        return True
+
     def _pass_evaluation(self):
         """
-        Sets the proposal to PASSED.
+        Sets the proposal to PASSED. Returns False if it was already completed.
 
         :meta private:
         """
-        self.status = Proposal.PASSED
-        self.save()
+        if not self._complete_evaluation(Proposal.PASSED):
+            return False
         action = self.action
         actstream_action.send(action, verb='was passed', community_id=action.community.id, action_codename=action.action_type)
         if self.governance_process:
@@ -672,15 +873,16 @@ class Proposal(models.Model):
                 self.governance_process.proxy.close()
             except NotImplementedError:
                 pass
+        return True
 
     def _fail_evaluation(self):
         """
-        Sets the proposal to FAILED.
+        Sets the proposal to FAILED. Returns False if it was already completed.
 
         :meta private:
         """
-        self.status = Proposal.FAILED
-        self.save()
+        if not self._complete_evaluation(Proposal.FAILED):
+            return False
         action = self.action
         actstream_action.send(action, verb='was failed', community_id=action.community.id, action_codename=action.action_type)
         if self.governance_process:
@@ -688,6 +890,158 @@ class Proposal(models.Model):
                 self.governance_process.proxy.close()
             except NotImplementedError:
                 pass
+        return True
+
+class EvaluationShard(models.Model):
+    """
+    A group of communities whose pending proposals are evaluated together by one celery task
+    (see ``evaluate_pending_proposals``). A shard holds a lease while it's being evaluated, so it
+    can't be dispatched again by a later beat tick until the running task finishes or the lease expires.
+
+    :meta private:
+    """
+
+    shard_key = models.CharField(max_length=64, unique=True)
+    lease_token = models.CharField(max_length=36, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_result = models.JSONField(default=dict, blank=True)
+    """Summary of the last finished evaluation of this shard"""
+
+    def __str__(self):
+        return f"EvaluationShard {self.shard_key}"
+
+    @classmethod
+    def acquire_lease(cls, shard_key, lease_seconds):
+        """
+        Take the lease for the shard, unless another task holds an unexpired lease on it.
+        Returns the lease token, or None if the lease is held. The check-and-set is a single
+        conditional UPDATE, so two dispatchers can never both acquire the same shard.
+        """
+        try:
+            cls.objects.get_or_create(shard_key=shard_key)
+        except IntegrityError:
+            # created concurrently by another dispatcher
+            pass
+        now = datetime.now(timezone.utc)
+        token = str(uuid.uuid4())
+        acquired = (
+            cls.objects.filter(shard_key=shard_key)
+            .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+            .update(lease_token=token, lease_expires_at=now + timedelta(seconds=lease_seconds), dispatched_at=now)
+        )
+        return token if acquired else None
+
+    @classmethod
+    def start(cls, shard_key, token, lease_seconds=None):
+        """
+        Mark the shard as started, and extend its lease for ``lease_seconds`` from now, since the task may have
+        waited in the queue for most of the lease. Returns False if the lease is no longer held with this token.
+        """
+        return cls.renew_lease(shard_key, token, lease_seconds, started_at=datetime.now(timezone.utc))
+
+    @classmethod
+    def renew_lease(cls, shard_key, token, lease_seconds=None, **updates):
+        """
+        Extend the lease for ``lease_seconds`` (by default PROPOSAL_SHARD_LEASE_SECONDS) from now, if it's still
+        held with this token and hasn't expired. Returns False if it wasn't, and the shard must not be evaluated
+        any further, since it may have been dispatched again.
+        """
+        now = datetime.now(timezone.utc)
+        lease_seconds = settings.PROPOSAL_SHARD_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        return bool(
+            cls.objects.filter(shard_key=shard_key, lease_token=token, lease_expires_at__gte=now).update(
+                lease_expires_at=now + timedelta(seconds=lease_seconds), **updates
+            )
+        )
+
+    @classmethod
+    def release_lease(cls, shard_key, token, result=None):
+        """
+        Release the lease, if it's still held with this token, and record the result.
+        """
+        updates = {"lease_token": "", "lease_expires_at": None}
+        if result is not None:
+            updates.update(finished_at=datetime.now(timezone.utc), last_result=result)
+        return bool(cls.objects.filter(shard_key=shard_key, lease_token=token).update(**updates))
+
+
+class PolicyStepStats(models.Model):
+    """
+    The cost of running one step of a policy during one hour: how many times it ran, totals of its wall time,
+    CPU time, database queries and platform API calls, and histograms of its wall time and query count
+    (see ``policyengine/step_stats.py``).
+
+    :meta private:
+    """
+
+    community = models.ForeignKey(Community, models.CASCADE)
+    policy = models.ForeignKey("Policy", models.CASCADE)
+    step = models.CharField(max_length=30)
+    hour = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    wall_time = models.FloatField(default=0)
+    cpu_time = models.FloatField(default=0)
+    queries = models.PositiveIntegerField(default=0)
+    api_calls = models.PositiveIntegerField(default=0)
+    max_wall_time = models.FloatField(default=0)
+    wall_time_histogram = models.JSONField(default=list, blank=True)
+    queries_histogram = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        unique_together = ("policy", "step", "hour")
+
+    def __str__(self):
+        return f"PolicyStepStats {self.policy_id} {self.step} {self.hour}"
+
+    def add(self, other):
+        """Add the counts of another set of stats (or an in-memory aggregate) to these stats"""
+        self.count += other.count
+        self.errors += other.errors
+        self.wall_time += other.wall_time
+        self.cpu_time += other.cpu_time
+        self.queries += other.queries
+        self.api_calls += other.api_calls
+        self.max_wall_time = max(self.max_wall_time, other.max_wall_time)
+        self.wall_time_histogram = step_stats.merge_histograms(self.wall_time_histogram, other.wall_time_histogram)
+        self.queries_histogram = step_stats.merge_histograms(self.queries_histogram, other.queries_histogram)
+
+
+class EvaluationTrace(models.Model):
+    """
+    An explain trace of one evaluation of an action: the candidate policies, each policy step that ran with
+    its result and cost, and the decision (see ``policyengine/explain.py``).
+
+    :meta private:
+    """
+
+    action = models.ForeignKey("BaseAction", models.CASCADE, related_name="evaluation_traces")
+    created_at = models.DateTimeField(auto_now_add=True)
+    duration = models.FloatField(default=0)
+    """Duration of the evaluation, in milliseconds"""
+    entries = models.JSONField(default=list, blank=True)
+    truncated = models.BooleanField(default=False)
+    """True if entries were dropped because the trace reached EVALUATION_EXPLAIN_MAX_ENTRIES"""
+
+    class Meta:
+        ordering = ["-created_at", "-pk"]
+
+    def __str__(self):
+        return f"EvaluationTrace {self.action_id} ({self.pk})"
+
+    @classmethod
+    def record(cls, action, entries, truncated, duration):
+        """Save a trace for the action, keeping only its latest EVALUATION_EXPLAIN_TRACES_PER_ACTION traces"""
+        trace = cls.objects.create(action=action, entries=entries, truncated=truncated, duration=duration)
+        keep = settings.EVALUATION_EXPLAIN_TRACES_PER_ACTION
+        stale_pks = list(cls.objects.filter(action=action).values_list("pk", flat=True)[keep:])
+        if stale_pks:
+            cls.objects.filter(pk__in=stale_pks).delete()
+        return trace
+
 
 class BaseAction(PolymorphicModel):
     """Base Action"""
@@ -768,6 +1122,7 @@ class GovernableAction(BaseAction, PolymorphicModel):
     community_origin = models.BooleanField(default=False)
     """True if the action originated on an external platform. False if the action originated in PolicyKit, either from a Policy or being proposed in the PolicyKit web interface."""
 
+    @tracing.traced("GovernableAction.save")
     def save(self, *args, **kwargs):
         """
         Saves the governable action. If new, evaluates against current policies.
@@ -1075,6 +1430,12 @@ class Policy(models.Model):
     modified_at = models.DateTimeField(auto_now=True)
     """Datetime object representing the last time the policy was modified."""
 
+    budget_violations = models.PositiveIntegerField(default=0)
+    """Number of consecutive times that a step of this policy exceeded its budget."""
+
+    is_degraded = models.BooleanField(default=False)
+    """True if the policy kept exceeding its time budget. Degraded policies are checked less often, until they're edited."""
+
     policy_template = models.OneToOneField(
         'PolicyTemplate',
         on_delete=models.SET_NULL,
@@ -1105,6 +1466,30 @@ class Policy(models.Model):
 
     def save(self, *args, **kwargs):
         super(Policy, self).save(*args, **kwargs)
+        # Drop compiled code for the old version of this policy
+        compiled_code_cache.invalidate_policy(self.pk)
+        # Wake-up times declared by the old version of the policy may no longer apply
+        Proposal.objects.filter(policy=self, status=Proposal.PROPOSED, next_evaluation_at__isnull=False).update(
+            next_evaluation_at=None
+        )
+
+    def record_budget_violation(self):
+        """Count a step that exceeded its budget, and mark the policy degraded if it keeps happening"""
+        if not self.pk:
+            return
+        # update() rather than save(), so the policy's modified_at and cached code are unaffected
+        Policy.objects.filter(pk=self.pk).update(budget_violations=F("budget_violations") + 1)
+        self.refresh_from_db(fields=["budget_violations"])
+        if not self.is_degraded and self.budget_violations >= settings.POLICY_BUDGET_VIOLATIONS_BEFORE_DEGRADED:
+            Policy.objects.filter(pk=self.pk).update(is_degraded=True)
+            self.is_degraded = True
+            logger.warning(f"{self} exceeded its step budget {self.budget_violations} times in a row, marking it degraded")
+
+    def record_budget_success(self):
+        """Reset the count of consecutive budget violations after a step completes within its budget"""
+        if self.pk and self.budget_violations:
+            Policy.objects.filter(pk=self.pk).update(budget_violations=0)
+            self.budget_violations = 0
 
     def update_variables(self, variable_data = {}):
         """Update related variables based on dict"""
@@ -1154,9 +1539,42 @@ class UserVote(models.Model):
     vote_time = models.DateTimeField(auto_now_add=True)
     """Datetime object representing when the vote was cast."""
 
+    TALLY_TYPE = None
+    """The key of this type of vote in the proposal's ``VoteTally``"""
+
+    TALLY_FIELDS = ()
+    """The fields that the vote is counted by in the proposal's ``VoteTally``"""
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        vote = super().from_db(db, field_names, values)
+        # remember what the vote was counted as, to move it in the tally if it changes
+        vote._tally_state = vote.get_tally_state()
+        return vote
+
+    @classmethod
+    def tally_key_for(cls, *values):
+        """
+        The path in the tally that a vote with these ``TALLY_FIELDS`` values is counted at, or None if it isn't counted.
+
+        :meta private:
+        """
+        if not values or any(value is None for value in values):
+            return None
+        return tuple(str(value) for value in values)
+
+    def get_tally_state(self):
+        """:meta private:"""
+        return (self.proposal_id, self.tally_key_for(*(getattr(self, field) for field in self.TALLY_FIELDS)))
+
+    def save(self, *args, **kwargs):
+        # the post_save receiver updates the proposal's VoteTally, in the same transaction as the vote
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def get_time_elapsed(self):
         """
         Returns a datetime object representing the time elapsed since the vote was cast.
@@ -1165,6 +1583,13 @@ class UserVote(models.Model):
 
 class SelectVote(UserVote):
     """ where a user assigns a option to a candidate"""
+
+    TALLY_TYPE = "select"
+    TALLY_FIELDS = ("candidate", "option")
+
+    class Meta:
+        unique_together = ("proposal", "user", "candidate")
+
     candidate = models.CharField(max_length=100)
     """The candidate that the user voted for."""
 
@@ -1188,6 +1613,18 @@ class BooleanVote(UserVote):
     )
     """The value of the vote. Either True ('Yes') or False ('No')."""
 
+    TALLY_TYPE = "boolean"
+    TALLY_FIELDS = ("boolean_value",)
+
+    class Meta:
+        unique_together = ("proposal", "user")
+
+    @classmethod
+    def tally_key_for(cls, boolean_value):
+        if boolean_value is None:
+            return None
+        return ("yes",) if boolean_value else ("no",)
+
     def __str__(self):
         return str(self.user) + ' : ' + str(self.boolean_value)
 
@@ -1197,6 +1634,12 @@ class ChoiceVote(UserVote):
     value = models.CharField(max_length=100)
     """The value of the vote."""
 
+    TALLY_TYPE = "choice"
+    TALLY_FIELDS = ("value",)
+
+    class Meta:
+        unique_together = ("proposal", "user")
+
     def __str__(self):
         return str(self.user) + ' : ' + str(self.value)
 
@@ -1206,9 +1649,142 @@ class NumberVote(UserVote):
     number_value = models.IntegerField(null=True)
     """The value of the vote. Must be an integer."""
 
+    TALLY_TYPE = "number"
+    TALLY_FIELDS = ("number_value",)
+
     def __str__(self):
         return str(self.user) + ' : ' + str(self.number_value)
 
+VOTE_CLASSES = (BooleanVote, ChoiceVote, NumberVote, SelectVote)
+
+
+class VoteTally(models.Model):
+    """
+    The number of votes cast on a proposal, by vote type and value, updated in the same transaction as each vote
+    that is cast, changed or removed (see ``vote_changed_receiver``). Policies read it with
+    ``Proposal.get_vote_counts`` and related methods, so that checking a vote costs the same however many users voted.
+
+    Votes written with ``bulk_create`` or ``QuerySet.update`` don't send signals, so call ``rebuild`` after them.
+
+    :meta private:
+    """
+
+    proposal = models.OneToOneField(Proposal, models.CASCADE, related_name="vote_tally")
+    counts = models.JSONField(default=dict, blank=True)
+    """``{vote type: {value: count}}``, or ``{vote type: {candidate: {option: count}}}`` for select votes"""
+
+    def __str__(self):
+        return f"VoteTally {self.proposal_id}: {self.counts}"
+
+    @staticmethod
+    def _add(counts, key, delta):
+        *parents, last = key
+        path = [counts]
+        for part in parents:
+            path.append(path[-1].setdefault(part, {}))
+        count = path[-1].get(last, 0) + delta
+        if count > 0:
+            path[-1][last] = count
+        else:
+            path[-1].pop(last, None)
+        # drop the candidates that have no votes left
+        for part, parent in reversed(list(zip(parents, path))):
+            if not parent[part]:
+                del parent[part]
+
+    @classmethod
+    def _apply(cls, proposal_id, tally_type, changes):
+        """Add each ``(key, delta)`` of ``changes`` to the proposal's tally"""
+        changes = [(key, delta) for key, delta in changes if key]
+        if proposal_id is None or not changes:
+            return
+        with transaction.atomic():
+            tallies = cls.objects.select_for_update().filter(proposal_id=proposal_id)
+            if any(delta > 0 for _, delta in changes):
+                tally, _ = tallies.get_or_create(proposal_id=proposal_id)
+            else:
+                # the tally may already be gone if the proposal is being deleted
+                tally = tallies.first()
+                if tally is None:
+                    return
+            counts = tally.counts.setdefault(tally_type, {})
+            for key, delta in changes:
+                cls._add(counts, key, delta)
+            if not counts:
+                del tally.counts[tally_type]
+            tally.save(update_fields=["counts"])
+
+    @classmethod
+    def votes_saved(cls, votes, created):
+        """
+        Count votes that were cast, or move votes that were changed. The signal receiver calls this for each vote;
+        call it after ``bulk_create`` or ``bulk_update`` of votes that were loaded from the database.
+        """
+        changes = {}
+        rebuild = set()
+        for vote in votes:
+            state = vote.get_tally_state()
+            previous = getattr(vote, "_tally_state", None)
+            if created:
+                changes.setdefault((state[0], vote.TALLY_TYPE), []).append((state[1], 1))
+            elif previous is None:
+                # we don't know what the vote was counted as before
+                rebuild.add(vote.proposal_id)
+            elif previous != state:
+                changes.setdefault((previous[0], vote.TALLY_TYPE), []).append((previous[1], -1))
+                changes.setdefault((state[0], vote.TALLY_TYPE), []).append((state[1], 1))
+            vote._tally_state = state
+        for (proposal_id, tally_type), proposal_changes in changes.items():
+            cls._apply(proposal_id, tally_type, proposal_changes)
+        for proposal_id in rebuild:
+            cls.rebuild(proposal_id)
+
+    @classmethod
+    def vote_deleted(cls, vote):
+        """Uncount a vote that was removed"""
+        proposal_id, key = getattr(vote, "_tally_state", None) or vote.get_tally_state()
+        cls._apply(proposal_id, vote.TALLY_TYPE, [(key, -1)])
+
+    @classmethod
+    def rebuild(cls, proposal_id):
+        """Count all the votes of the proposal again"""
+        counts = {}
+        for vote_class in VOTE_CLASSES:
+            rows = (
+                vote_class.objects.filter(proposal_id=proposal_id)
+                .order_by()
+                .values_list(*vote_class.TALLY_FIELDS)
+                .annotate(count=Count("pk"))
+            )
+            for *values, count in rows:
+                key = vote_class.tally_key_for(*values)
+                if key is not None:
+                    cls._add(counts.setdefault(vote_class.TALLY_TYPE, {}), key, count)
+            if not counts.get(vote_class.TALLY_TYPE, True):
+                del counts[vote_class.TALLY_TYPE]
+        tally, _ = cls.objects.update_or_create(proposal_id=proposal_id, defaults={"counts": counts})
+        return tally
+
+
+class VoteOutcomeSnapshot(models.Model):
+    """
+    The votes of the last outcome synced from a governance process, and their fingerprint, so that unchanged
+    outcomes are skipped and changed ones only sync the votes that changed (see ``policyengine/vote_sync.py``).
+
+    :meta private:
+    """
+
+    process = models.OneToOneField(GovernanceProcess, models.CASCADE, related_name="+")
+    fingerprint = models.CharField(max_length=64)
+    vote_type = models.CharField(max_length=30)
+    """The name of the vote class"""
+    votes = models.JSONField(default=dict, blank=True)
+    """Maps the JSON list ``[platform user id, *key]`` to the value of each vote, like the argument of ``sync_outcome``"""
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"VoteOutcomeSnapshot {self.process_id}"
+
 class GovernableActionForm(ModelForm):
     class Meta:
         model = GovernableAction
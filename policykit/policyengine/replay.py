@@ -0,0 +1,309 @@
+"""
+Capture and replay of the platform traffic that drives the engine, to compare engine changes on real workloads.
+
+Capture: if REPLAY_CAPTURE_PATH is set, each ``platform_event_created`` payload, each governance process started
+by a policy, and each ``governance_process_updated`` outcome is appended to that file as a line of JSON (gzipped
+if the path ends in ``.gz``). Several processes can append to the same file, or to files that are merged when
+replayed.
+
+Replay: ``python manage.py replay_events <capture files>`` sends the captured events and outcomes again, in order,
+through the same signal receivers, with Metagov replaced by the stand-ins in ``fakes.py`` so that nothing reaches
+the platforms. Proposals made dirty by a record are evaluated right away, instead of after the debounce delay.
+Everything runs in a transaction that is rolled back, so it can run against a copy of production data without
+changing it. It reports the throughput, the p50/p99 latency from a record to the decisions it leads to, and the
+final state of the proposals that were created.
+
+Governance processes started during the replay get new ids. Outcomes are matched to them by the order in which
+processes were started: the n-th captured process corresponds to the n-th process started by the replay.
+"""
+import gzip
+import json
+import logging
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+EVENT = "event"
+PROCESS = "process"
+OUTCOME = "outcome"
+
+# stop evaluating dirty proposals after this many rounds, in case policies keep making each other dirty
+MAX_DIRTY_ROUNDS = 10
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def is_replaying():
+    return getattr(_local, "replaying", False)
+
+
+# Capture
+
+
+def _write(record):
+    path = settings.REPLAY_CAPTURE_PATH
+    if not path or is_replaying():
+        return
+    line = json.dumps({**record, "at": time.time()}, default=str, separators=(",", ":"))
+    try:
+        with _write_lock, _open(path, "a") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"Failed to capture {record['type']} to {path}: {repr(e)} {e}")
+
+
+def capture_platform_event(sender, instance, event_type, data, initiator):
+    _write(
+        {
+            "type": EVENT,
+            "sender": sender._meta.label,
+            "community": instance.community.slug,
+            "community_platform_id": instance.community_platform_id,
+            "event_type": event_type,
+            "data": data,
+            "initiator": initiator,
+        }
+    )
+
+
+def capture_process_started(process):
+    if not settings.REPLAY_CAPTURE_PATH:
+        return
+    _write(
+        {
+            "type": PROCESS,
+            "process": process.pk,
+            "name": f"{process.plugin.name}.{process.name}",
+            "community": process.plugin.community.slug,
+        }
+    )
+
+
+def capture_process_update(sender, instance, status, outcome, errors):
+    _write(
+        {
+            "type": OUTCOME,
+            "sender": sender._meta.label,
+            "process": instance.pk,
+            "community": instance.plugin.community.slug,
+            "status": status,
+            "outcome": outcome,
+            "errors": errors,
+        }
+    )
+
+
+# Replay
+
+
+def read_records(paths):
+    """Read the records of one or more capture files, merged in the order they were captured"""
+    records = []
+    for path in paths:
+        with _open(path, "r") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping malformed line {line_number} of {path}")
+    records.sort(key=lambda record: record.get("at", 0))
+    return records
+
+
+def percentile(values, q):
+    """Nearest-rank q-percentile of the values, or None if there are none"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class Replayer:
+    """
+    Replays captured records. Pass ``community`` to only replay the records of the Metagov community with that
+    slug, and ``into`` to send them to the plugins of another community instead, for example a copy with
+    different policies. With ``sweep``, pending proposals created by the replay are evaluated once more at
+    the end, like on a beat tick.
+    """
+
+    def __init__(self, community=None, into=None, sweep=False):
+        self.community = community
+        self.into = into
+        self.sweep = sweep
+        self.counts = Counter()
+        self.latencies = []
+        # captured process id -> index in the order processes were started
+        self._process_order = {}
+        # proposals with a greater pk were created by the replay
+        self._last_proposal_pk = 0
+
+    def run(self, records):
+        from policyengine.fakes import fake_metagov
+        from policyengine.models import Proposal
+
+        with fake_metagov() as fake, transaction.atomic():
+            _local.replaying = True
+            try:
+                self._last_proposal_pk = Proposal.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+                started = time.perf_counter()
+                for record in records:
+                    self._replay_record(record, fake)
+                if self.sweep:
+                    self._sweep()
+                duration = time.perf_counter() - started
+                return self._report(records, fake, duration)
+            finally:
+                _local.replaying = False
+                transaction.set_rollback(True)
+
+    def _replay_record(self, record, fake):
+        kind = record.get("type")
+        if self.community and record.get("community") != self.community:
+            self.counts["skipped"] += 1
+            return
+        if kind == PROCESS:
+            self._process_order[record["process"]] = len(self._process_order)
+            return
+
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                if kind == EVENT:
+                    replayed = self._replay_event(record)
+                elif kind == OUTCOME:
+                    replayed = self._replay_outcome(record, fake)
+                else:
+                    replayed = False
+                if replayed:
+                    self._evaluate_dirty_proposals()
+        except Exception as e:
+            logger.error(f"Error replaying {kind} record: {repr(e)} {e}")
+            self.counts["errors"] += 1
+            return
+        if not replayed:
+            self.counts["skipped"] += 1
+            return
+        self.latencies.append(time.perf_counter() - started)
+        self.counts[kind] += 1
+
+    def _replay_event(self, record):
+        from django.apps import apps
+        from metagov.core.signals import platform_event_created
+
+        try:
+            sender = apps.get_model(record["sender"])
+        except LookupError:
+            return False
+        plugins = sender.objects.filter(community__slug=self.into or record["community"])
+        if not self.into and record.get("community_platform_id"):
+            plugins = plugins.filter(community_platform_id=record["community_platform_id"])
+        plugin = plugins.first()
+        if plugin is None:
+            return False
+
+        platform_event_created.send(
+            sender=sender,
+            instance=plugin,
+            event_type=record["event_type"],
+            data=record["data"],
+            initiator=record["initiator"],
+        )
+        return True
+
+    def _replay_outcome(self, record, fake):
+        from django.apps import apps
+        from metagov.core.signals import governance_process_updated
+
+        index = self._process_order.get(record["process"])
+        if index is None or index >= len(fake.processes):
+            # the process was started before the capture, or the replay didn't start it
+            return False
+        try:
+            sender = apps.get_model(record["sender"])
+        except LookupError:
+            return False
+
+        # update the row directly, so that only the receivers below see the change
+        sender.objects.filter(pk=fake.processes[index].pk).update(
+            status=record["status"], outcome=record["outcome"], errors=record["errors"]
+        )
+        process = sender.objects.get(pk=fake.processes[index].pk)
+        governance_process_updated.send(
+            sender=sender,
+            instance=process,
+            status=record["status"],
+            outcome=record["outcome"],
+            errors=record["errors"],
+        )
+        return True
+
+    def _evaluate_dirty_proposals(self):
+        from policyengine.models import Proposal
+        from policyengine.tasks import evaluate_pending_proposal
+
+        for _ in range(MAX_DIRTY_ROUNDS):
+            dirty = list(
+                Proposal.objects.filter(
+                    pk__gt=self._last_proposal_pk, status=Proposal.PROPOSED, dirty_since__isnull=False
+                ).order_by("pk")
+            )
+            if not dirty:
+                return
+            for proposal in dirty:
+                evaluate_pending_proposal(proposal)
+                self.counts["evaluations"] += 1
+
+    def _sweep(self):
+        from policyengine.models import Proposal
+        from policyengine.tasks import evaluate_pending_proposal
+
+        for proposal in Proposal.objects.filter(pk__gt=self._last_proposal_pk, status=Proposal.PROPOSED).order_by("pk"):
+            evaluate_pending_proposal(proposal)
+            self.counts["evaluations"] += 1
+
+    def _report(self, records, fake, duration):
+        from policyengine.models import Proposal
+
+        proposals = Proposal.objects.filter(pk__gt=self._last_proposal_pk).select_related("policy").order_by("pk")
+        final_states = [
+            {"policy": proposal.policy.name if proposal.policy else None, "status": proposal.status}
+            for proposal in proposals
+        ]
+        replayed = self.counts[EVENT] + self.counts[OUTCOME]
+        p50, p99 = percentile(self.latencies, 0.5), percentile(self.latencies, 0.99)
+        return {
+            "records": len(records),
+            "events": self.counts[EVENT],
+            "outcomes": self.counts[OUTCOME],
+            "skipped": self.counts["skipped"],
+            "errors": self.counts["errors"],
+            "evaluations": self.counts["evaluations"],
+            "platform_calls": len(fake.calls),
+            "duration": round(duration, 6),
+            "throughput": round(replayed / duration, 3) if duration else None,
+            "latency_p50_ms": round(p50 * 1000, 3) if p50 is not None else None,
+            "latency_p99_ms": round(p99 * 1000, 3) if p99 is not None else None,
+            "proposal_states": dict(Counter(state["status"] for state in final_states)),
+            "proposals": final_states,
+        }
+
+
+def replay(paths, community=None, into=None, sweep=False):
+    """Replay the capture files, and return the report"""
+    return Replayer(community=community, into=into, sweep=sweep).run(read_records(paths))
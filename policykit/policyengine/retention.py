@@ -0,0 +1,134 @@
+"""
+Retention of log tables, run by the ``prune_logs`` beat task every LOG_RETENTION_INTERVAL seconds.
+
+Expired rows are deleted in batches of LOG_RETENTION_BATCH_SIZE, oldest first, each batch in its own short
+transaction, so pruning never holds locks on many rows at once and is spread over several statements instead of one
+long one. A run stops after LOG_RETENTION_TIME_BUDGET seconds; whatever is left is deleted on the next run.
+
+``LogAPICall`` rows are only needed to recognize the platform events that echo PolicyKit's own calls, a few seconds
+to a few minutes after the call (see ``api_call_keys``). They are kept for LOG_API_CALL_RETENTION_SECONDS, or for the
+time set for their call type in LOG_API_CALL_RETENTION_BY_CALL_TYPE.
+
+``EvaluationLog`` rows are kept for EVALUATION_LOG_RETENTION_DAYS, and each community keeps at most its quota of
+most recent logs (EVALUATION_LOG_QUOTA, or the community's entry in EVALUATION_LOG_QUOTA_BY_COMMUNITY), so that
+a chatty community can't evict the logs of the others. A community's logs past its quota are found by reading its
+index up to the quota, rather than sorting the whole table.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from policyengine import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def delete_in_batches(queryset, order_by, deadline, batch_size=None):
+    """
+    Delete the rows of ``queryset`` in order of the ``order_by`` fields, ``batch_size`` rows per transaction, until
+    there are none left or ``time.monotonic()`` passes ``deadline``. Returns the number of rows deleted, not counting
+    the rows deleted along with them.
+    """
+    model = queryset.model
+    batch_size = batch_size or settings.LOG_RETENTION_BATCH_SIZE
+    deleted = 0
+    while time.monotonic() < deadline:
+        with transaction.atomic():
+            pks = list(queryset.order_by(*order_by).values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                break
+            _, counts = model.objects.filter(pk__in=pks).delete()
+        deleted += counts.get(model._meta.label, 0)
+        if len(pks) < batch_size:
+            break
+    return deleted
+
+
+def estimated_row_count(model):
+    """Number of rows in the model's table. Estimated on postgres, where counting a large table is slow."""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    return model.objects.count()
+
+
+def prune_log_api_calls(deadline):
+    """Delete the LogAPICalls that are past their retention time. Returns the number of rows deleted."""
+    from policyengine.models import LogAPICall
+
+    now = datetime.now(timezone.utc)
+    by_call_type = settings.LOG_API_CALL_RETENTION_BY_CALL_TYPE
+    querysets = [
+        LogAPICall.objects.filter(call_type=call_type, proposal_time__lt=now - timedelta(seconds=seconds))
+        for call_type, seconds in by_call_type.items()
+    ]
+    querysets.append(
+        LogAPICall.objects.filter(
+            proposal_time__lt=now - timedelta(seconds=settings.LOG_API_CALL_RETENTION_SECONDS)
+        ).exclude(call_type__in=list(by_call_type))
+    )
+
+    deleted = 0
+    for queryset in querysets:
+        deleted += delete_in_batches(queryset, ["proposal_time", "pk"], deadline)
+    metrics.log_rows_pruned.inc(deleted, table="log_api_call")
+    return deleted
+
+
+def evaluation_log_quota(community_id):
+    """Maximum number of EvaluationLogs kept for the community, or 0 if there is no maximum"""
+    return settings.EVALUATION_LOG_QUOTA_BY_COMMUNITY.get(str(community_id), settings.EVALUATION_LOG_QUOTA)
+
+
+def prune_evaluation_logs(deadline):
+    """
+    Delete the EvaluationLogs that are older than the retention time or past their community's quota.
+    Returns the number of rows deleted.
+    """
+    from django_db_logger.models import EvaluationLog
+    from policyengine.models import Community
+
+    order_by = ["create_datetime", "pk"]
+    deleted = 0
+    if settings.EVALUATION_LOG_RETENTION_DAYS:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.EVALUATION_LOG_RETENTION_DAYS)
+        deleted += delete_in_batches(EvaluationLog.objects.filter(create_datetime__lt=cutoff), order_by, deadline)
+
+    # logs of deleted communities have no community, and share a quota
+    for community_id in [None, *Community.objects.order_by("pk").values_list("pk", flat=True)]:
+        if time.monotonic() >= deadline:
+            break
+        quota = evaluation_log_quota(community_id)
+        if not quota:
+            continue
+        logs = EvaluationLog.objects.filter(community_id=community_id)
+        # the most recent log past the quota
+        last_expired = list(logs.order_by("-create_datetime", "-pk").values_list("create_datetime", "pk")[quota:quota + 1])
+        if not last_expired:
+            continue
+        create_datetime, pk = last_expired[0]
+        expired = logs.filter(Q(create_datetime__lt=create_datetime) | Q(create_datetime=create_datetime, pk__lte=pk))
+        deleted += delete_in_batches(expired, order_by, deadline)
+
+    metrics.log_rows_pruned.inc(deleted, table="evaluation_log")
+    return deleted
+
+
+def prune_logs():
+    """Apply the retention of all log tables. Returns the number of rows deleted from each."""
+    deadline = time.monotonic() + settings.LOG_RETENTION_TIME_BUDGET
+    pruned = {
+        "log_api_call": prune_log_api_calls(deadline),
+        "evaluation_log": prune_evaluation_logs(deadline),
+    }
+    if time.monotonic() >= deadline:
+        logger.warning("Log retention ran out of time, the remaining expired rows will be deleted on the next run")
+    logger.info(f"Pruned logs: {pruned}")
+    return pruned
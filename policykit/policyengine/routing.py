@@ -0,0 +1,168 @@
+"""
+Routing table for finding the policies that may govern an action.
+
+For each community, the ids of its active policies are indexed by (kind, action_type codename), plus the "base"
+policies of each kind that don't specify any action_types. The table is built with two queries and kept in process
+memory, so routing an action doesn't need to search the community's policies.
+
+Tables are versioned by ``Community.policy_routing_version``, which signals bump when a Policy is saved or deleted,
+or its action_types change, only for the communities of the changed policies. ``get_candidate_policies`` reads the current version in the same query that loads the
+candidate policies, and rebuilds the table if it's out of date, so a change made by any process is seen by all
+the others as soon as it's committed.
+"""
+import logging
+import threading
+
+from django.db.models import F, Subquery
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingTable:
+    def __init__(self, community_id, version, routes, base_routes):
+        self.community_id = community_id
+        # the community's policy_routing_version when the table was built
+        self.version = version
+        # (kind, codename) -> [policy ids], ordered by -modified_at
+        self.routes = routes
+        # kind -> [ids of policies with no action_types], ordered by -modified_at
+        self.base_routes = base_routes
+        # (kind, codename) -> merged list of matching and base policy ids, filled in lazily
+        self._merged = {}
+        self._order = {}
+
+    @classmethod
+    def build(cls, community_id, version):
+        from policyengine.models import Policy
+
+        # ordered by -modified_at, like Community.get_policies
+        policies = list(
+            Policy.objects.filter(community_id=community_id, is_active=True)
+            .order_by("-modified_at", "-pk")
+            .values_list("pk", "kind")
+        )
+        codenames = {}
+        for policy_id, codename in Policy.action_types.through.objects.filter(
+            policy__community_id=community_id, policy__is_active=True
+        ).values_list("policy_id", "actiontype__codename"):
+            codenames.setdefault(policy_id, []).append(codename)
+
+        routes = {}
+        base_routes = {}
+        for policy_id, kind in policies:
+            if policy_id in codenames:
+                for codename in codenames[policy_id]:
+                    routes.setdefault((kind, codename), []).append(policy_id)
+            else:
+                base_routes.setdefault(kind, []).append(policy_id)
+
+        table = cls(community_id, version, routes, base_routes)
+        table._order = {policy_id: index for index, (policy_id, _) in enumerate(policies)}
+        return table
+
+    def policy_ids(self, kind, codename, include_base=True):
+        """
+        Ids of the policies matching the action kind and action_type, including the base policies of the
+        kind if `include_base`, ordered by -modified_at.
+        """
+        if not include_base:
+            return list(self.routes.get((kind, codename), []))
+
+        key = (kind, codename)
+        merged = self._merged.get(key)
+        if merged is None:
+            ids = self.routes.get(key, []) + self.base_routes.get(kind, [])
+            merged = sorted(set(ids), key=self._order.__getitem__)
+            self._merged[key] = merged
+        return list(merged)
+
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def current_version(community_id):
+    from policyengine.models import Community
+
+    return Community.objects.filter(pk=community_id).values_list("policy_routing_version", flat=True).first()
+
+
+def get_routing_table(community_id, version=None):
+    """
+    Returns the routing table for the community, building it if it's missing or out of date. ``version`` is the
+    community's current ``policy_routing_version``, which is read from the database if it's not given.
+    """
+    if version is None:
+        version = current_version(community_id)
+    table = _tables.get(community_id)
+    if table is not None and table.version == version:
+        return table
+
+    table = RoutingTable.build(community_id, version)
+    with _lock:
+        _tables[community_id] = table
+    return table
+
+
+def _load_policies(community_id, policy_ids):
+    """
+    Load the policies with these ids, and the community's current routing version, in one query.
+    Returns ({pk: policy}, version).
+    """
+    from policyengine.models import Community, Policy
+
+    if policy_ids:
+        version = Community.objects.filter(pk=community_id).values("policy_routing_version")
+        policies = Policy.objects.filter(pk__in=policy_ids).annotate(current_routing_version=Subquery(version[:1]))
+        policies = {policy.pk: policy for policy in policies}
+        if policies:
+            return policies, next(iter(policies.values())).current_routing_version
+    return {}, current_version(community_id)
+
+
+def get_candidate_policies(community_id, kind, codename, include_base=True):
+    """
+    The active policies of the community that match the action kind and action_type, including the base policies
+    of the kind if ``include_base``, ordered by -modified_at. One query if the routing table is up to date.
+    """
+    table = _tables.get(community_id)
+    if table is None:
+        table = get_routing_table(community_id)
+    policy_ids = table.policy_ids(kind, codename, include_base)
+    policies, version = _load_policies(community_id, policy_ids)
+    if version != table.version:
+        # policies were changed since the table was built, possibly by another process
+        table = get_routing_table(community_id, version)
+        policy_ids = table.policy_ids(kind, codename, include_base)
+        policies, _ = _load_policies(community_id, policy_ids)
+    # a policy could still change between building the table and loading it
+    return [
+        policies[pk]
+        for pk in policy_ids
+        if pk in policies and policies[pk].is_active and policies[pk].community_id == community_id
+    ]
+
+
+def invalidate_communities(community_ids):
+    """Mark the routing tables of the communities out of date, in all processes once the transaction commits"""
+    from policyengine.models import Community
+
+    community_ids = {community_id for community_id in community_ids if community_id is not None}
+    if not community_ids:
+        return
+    with _lock:
+        for community_id in community_ids:
+            _tables.pop(community_id, None)
+    Community.objects.filter(pk__in=community_ids).update(policy_routing_version=F("policy_routing_version") + 1)
+
+
+def invalidate_community(community_id, community=None):
+    """
+    Mark the community's routing table out of date. Pass the Community instance, if one is loaded, to read its new
+    version, so that saving it later doesn't write back the version from before.
+    """
+    invalidate_communities([community_id])
+    if community is not None:
+        version = current_version(community_id)
+        if version is not None:
+            community.policy_routing_version = version
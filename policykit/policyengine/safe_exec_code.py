@@ -2,6 +2,10 @@ from RestrictedPython import safe_builtins, utility_builtins, compile_restricted
 from RestrictedPython import RestrictingNodeTransformer
 from RestrictedPython.Eval import default_guarded_getitem, default_guarded_getiter
 from RestrictedPython.Guards import safer_getattr, guarded_unpack_sequence, guarded_iter_unpack_sequence
+from types import MappingProxyType
+import ast
+
+from policyengine.watchdog import check_budget
 
 
 # permitted modules
@@ -12,6 +16,9 @@ import json
 import logging
 logger = logging.getLogger(__name__)
 
+# filename of compiled policy code, as it appears in tracebacks
+USER_CODE_FILENAME = "<user_code>"
+
 policykit_builtins = {
     # see: https://restrictedpython.readthedocs.io/en/latest/usage/policy.html#predefined-builtins
     **safe_builtins,
@@ -33,10 +40,33 @@ STATIC_GLOBAL_VARIABLES = {
 
 class OwnRestrictingNodeTransformer(RestrictingNodeTransformer):
     def visit_Import(self, node):
-        raise SyntaxError("Import statements are not allowed.", ("<user_code>", node.lineno, node.col_offset, ""))
+        raise SyntaxError("Import statements are not allowed.", (USER_CODE_FILENAME, node.lineno, node.col_offset, ""))
 
     visit_ImportFrom = visit_Import
 
+    def _check_budget_call(self, node):
+        """A call to ``_check_budget_``, the checkpoint where a step over budget is stopped (see policyengine/watchdog.py)"""
+        check = ast.Call(func=ast.Name(id="_check_budget_", ctx=ast.Load()), args=[], keywords=[])
+        return ast.fix_missing_locations(ast.copy_location(check, node))
+
+    def _check_budget_in_body(self, node):
+        """Call ``_check_budget_`` at the start of every iteration of a loop"""
+        node.body.insert(0, ast.copy_location(ast.Expr(value=self._check_budget_call(node)), node))
+        return node
+
+    def visit_For(self, node):
+        return self._check_budget_in_body(super().visit_For(node))
+
+    def visit_While(self, node):
+        return self._check_budget_in_body(super().visit_While(node))
+
+    def visit_comprehension(self, node):
+        # check on every item of comprehensions and generator expressions. _check_budget_ returns True, so the
+        # condition never filters out an item.
+        node = super().visit_comprehension(node)
+        node.ifs.insert(0, self._check_budget_call(node.iter))
+        return node
+
 
 def _hook_writable(obj):
     """Only allow writing to lists and dicts."""
@@ -67,67 +97,127 @@ def _guarded_import(mname, globals=None, locals=None, fromlist=None, level=None)
 #     except Exception as e:
 #         raise e
 
-def execute_user_code(user_code: str, user_func: str, *args, **kwargs):
+def compile_user_code(user_code: str, user_func: str):
     """
-    Execute user code in restricted env using RestrictedPython
-    Adapted from https://memoryline.github.io/python/django/security/2020/08/01/how-can-i-accept-and-run-users-code-securely.html
+    Compile user code with RestrictedPython, adding a line that calls @user_func with the
+    arguments that are passed to ``execute_compiled_code``.
 
     Args:
         user_code(str) - String containing the unsafe code
         user_func(str) - Function inside user_code to execute and return value
-        *args, **kwargs - arguments passed to the user function
     Return:
-        Return value of the user_func
+        Compiled code object. Raises SyntaxError for code that does not compile.
     """
+    # Add another line to user code that executes @user_func
+    user_code += "\nresult = {0}(*args, **kwargs)".format(user_func)
 
-    def _apply(f, *a, **kw):
-        return f(*a, **kw)
+    return compile_restricted(user_code, filename=USER_CODE_FILENAME, mode="exec", policy=OwnRestrictingNodeTransformer)
 
-    try:
-        # This is the variables we allow user code to see. @result will contain return value.
-        restricted_locals = {
-            "result": None,
-            "args": args,
-            "kwargs": kwargs,
-        }
 
-        restricted_globals = {
-            "__builtins__": {
-                **policykit_builtins,
-                # special case guard to fix strftime bug
-                "__import__": _guarded_import,
-            },
+def _apply(f, *a, **kw):
+    """Guard for calls that use *args or **kwargs"""
+    return f(*a, **kw)
+
+
+def _inplacevar(op, val, expr):
+    """Guard for augmented assignment, permit +="""
+    return val + expr
+
+
+def _hasattr(obj, attr):
+    return hasattr(obj, attr)
+
+
+class SandboxRuntime:
+    """
+    The parts of the restricted execution environment that never change: builtins, permitted modules,
+    guard functions and static global variables. Built once per process. Each execution gets its own
+    shallow copy of the globals, so that code running with ``global`` can't leak state between calls.
+    """
+
+    def __init__(self, builtins=policykit_builtins, static_globals=STATIC_GLOBAL_VARIABLES):
+        # Shared by all calls. User code can't reach it, because names starting with "_" are not allowed.
+        self.builtins = {
+            **builtins,
+            # special case guard to fix strftime bug
+            "__import__": _guarded_import,
+        }
+        self._globals_template = {
+            "__builtins__": self.builtins,
             "_getitem_": default_guarded_getitem,
             "_getiter_": default_guarded_getiter,
             "_unpack_sequence_": guarded_unpack_sequence,
             "_iter_unpack_sequence_": guarded_iter_unpack_sequence,
             "_getattr_": safer_getattr,
-            "_inplacevar_": lambda op, val, expr: val + expr,  # permit +=
+            "_inplacevar_": _inplacevar,
             "_write_": _hook_writable,
+            # see policyengine/watchdog.py
+            "_check_budget_": check_budget,
             # to access args and kwargs
             "_apply_": _apply,
-            "hasattr": lambda obj, attr: hasattr(obj, attr),
-            **STATIC_GLOBAL_VARIABLES,
+            "hasattr": _hasattr,
+            **static_globals,
         }
 
-        # Add another line to user code that executes @user_func
-        user_code += "\nresult = {0}(*args, **kwargs)".format(user_func)
+    @property
+    def globals_template(self):
+        """Read-only view of the globals that every execution starts with"""
+        return MappingProxyType(self._globals_template)
 
-        # Compile the user code
-        byte_code = compile_restricted(
-            user_code, filename="<user_code>", mode="exec", policy=OwnRestrictingNodeTransformer
-        )
+    def new_globals(self):
+        """Per-call globals, a single dict copy of the template"""
+        return self._globals_template.copy()
+
+    def execute(self, byte_code, args, kwargs):
+        # This is the variables we allow user code to see. @result will contain return value.
+        restricted_locals = {
+            "result": None,
+            "args": args,
+            "kwargs": kwargs,
+        }
 
         # Run it
-        exec(byte_code, restricted_globals, restricted_locals)
+        exec(byte_code, self.new_globals(), restricted_locals)
 
         # User code has modified result inside restricted_locals. Return it.
         return restricted_locals["result"]
 
+
+sandbox_runtime = SandboxRuntime()
+
+
+def execute_compiled_code(byte_code, *args, **kwargs):
+    """
+    Run code returned by ``compile_user_code`` in the restricted env.
+
+    Args:
+        byte_code - Code object returned by compile_user_code
+        *args, **kwargs - arguments passed to the user function
+    Return:
+        Return value of the user function
+    """
+    try:
+        return sandbox_runtime.execute(byte_code, args, kwargs)
     except SyntaxError as e:
         # Code that does not compile
         raise
     except Exception as e:
         # The code did something that is not allowed
         logging.debug(f"User code failed with exception: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def execute_user_code(user_code: str, user_func: str, *args, **kwargs):
+    """
+    Execute user code in restricted env using RestrictedPython
+    Adapted from https://memoryline.github.io/python/django/security/2020/08/01/how-can-i-accept-and-run-users-code-securely.html
+
+    Args:
+        user_code(str) - String containing the unsafe code
+        user_func(str) - Function inside user_code to execute and return value
+        *args, **kwargs - arguments passed to the user function
+    Return:
+        Return value of the user_func
+    """
+    byte_code = compile_user_code(user_code, user_func)
+    return execute_compiled_code(byte_code, *args, **kwargs)
@@ -99,3 +99,35 @@ class LogsSerializer(serializers.Serializer):
         from django_db_logger.models import EvaluationLog
         logs = EvaluationLog.objects.filter(community=community).order_by('-create_datetime')
         return LogEntrySerializer(logs, many=True).data
+
+class EvaluationTraceSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+    duration = serializers.FloatField()
+    truncated = serializers.BooleanField()
+    entries = serializers.JSONField()
+
+class PolicyStepStatsSerializer(serializers.Serializer):
+    policy_id = serializers.IntegerField()
+    policy = serializers.CharField()
+    step = serializers.CharField()
+    count = serializers.IntegerField()
+    errors = serializers.IntegerField()
+    total_wall_time = serializers.FloatField()
+    mean_wall_time = serializers.FloatField()
+    p50_wall_time = serializers.FloatField(allow_null=True)
+    p95_wall_time = serializers.FloatField(allow_null=True)
+    max_wall_time = serializers.FloatField()
+    mean_cpu_time = serializers.FloatField()
+    mean_queries = serializers.FloatField()
+    p95_queries = serializers.IntegerField(allow_null=True)
+    api_calls = serializers.IntegerField()
+
+class PolicyStatsSerializer(serializers.Serializer):
+    policy_stats = serializers.SerializerMethodField()
+
+    def get_policy_stats(self, community):
+        from datetime import datetime, timedelta, timezone
+        from policyengine import step_stats
+        since = datetime.now(timezone.utc) - timedelta(hours=self.context.get("hours", 24))
+        return PolicyStepStatsSerializer(step_stats.summarize(community, since), many=True).data
@@ -0,0 +1,253 @@
+"""
+Cost of running policy steps, per (community, policy, step).
+
+``exec_code_block`` measures each step it runs with ``measure_step``: wall time, CPU time, database queries and
+platform API calls. Measurements are aggregated in process memory into hourly buckets, and flushed at most every
+POLICY_STEP_STATS_FLUSH_SECONDS into ``PolicyStepStats`` rows, one per (policy, step, hour), with histograms
+of wall time and query counts. Buckets older than POLICY_STEP_STATS_RETENTION_DAYS are pruned.
+
+Stats are never flushed while a step runs, so that flushing isn't part of the caller's transaction or of its
+measurements. The shard task flushes them when it's done, and ``flush_if_due`` is called after each celery task
+and request (see ``handlers.py``).
+
+The stats are served by the ``api/policy_stats`` endpoint, so that admins can find the policies that
+dominate evaluation time.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets. Each histogram has one more bucket, for values above the last bound.
+WALL_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+def empty_histogram(bounds):
+    return [0] * (len(bounds) + 1)
+
+
+def add_to_histogram(histogram, bounds, value):
+    histogram[bisect.bisect_left(bounds, value)] += 1
+
+
+def merge_histograms(histogram, other):
+    if not histogram:
+        return list(other)
+    return [a + b for a, b in zip(histogram, other)]
+
+
+def histogram_quantile(histogram, bounds, q):
+    """
+    Estimate the q-quantile from a histogram, as the upper bound of the bucket it falls in.
+    Returns None if the histogram is empty, or if the quantile falls above the last bound.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank and count:
+            return bounds[index] if index < len(bounds) else None
+    return None
+
+
+class StepMeasurement:
+    """The cost of one run of a policy step"""
+
+    def __init__(self):
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.queries = 0
+        self.api_calls = 0
+        self.failed = False
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class _Aggregate:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.queries = 0
+        self.api_calls = 0
+        self.max_wall_time = 0.0
+        self.wall_time_histogram = empty_histogram(WALL_TIME_BUCKETS)
+        self.queries_histogram = empty_histogram(QUERY_COUNT_BUCKETS)
+
+    def add(self, measurement):
+        self.count += 1
+        self.errors += int(measurement.failed)
+        self.wall_time += measurement.wall_time
+        self.cpu_time += measurement.cpu_time
+        self.queries += measurement.queries
+        self.api_calls += measurement.api_calls
+        self.max_wall_time = max(self.max_wall_time, measurement.wall_time)
+        add_to_histogram(self.wall_time_histogram, WALL_TIME_BUCKETS, measurement.wall_time)
+        add_to_histogram(self.queries_histogram, QUERY_COUNT_BUCKETS, measurement.queries)
+
+
+_local = threading.local()
+_lock = threading.Lock()
+# (community_id, policy_id, step, hour) -> _Aggregate
+_buffer = {}
+_last_flush = time.monotonic()
+_last_prune = None
+
+
+@contextmanager
+def measure_step(policy, step_name):
+    """
+    Measure the body as one run of the policy step, and add it to the stats. Nested steps are measured
+    separately, and also count towards the outer step.
+    """
+    if not settings.POLICY_STEP_STATS_ENABLED or not policy.pk:
+        yield None
+        return
+
+    measurement = StepMeasurement()
+    outer = getattr(_local, "measurement", None)
+    _local.measurement = measurement
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        with connection.execute_wrapper(measurement._count_query):
+            yield measurement
+    except BaseException:
+        measurement.failed = True
+        raise
+    finally:
+        measurement.wall_time = time.perf_counter() - wall_start
+        measurement.cpu_time = time.thread_time() - cpu_start
+        _local.measurement = outer
+        if outer is not None:
+            outer.api_calls += measurement.api_calls
+        record(policy.community_id, policy.pk, step_name, measurement)
+
+
+def count_api_call():
+    """Count a platform API call made by the policy step that is running in this thread, if any"""
+    measurement = getattr(_local, "measurement", None)
+    if measurement is not None:
+        measurement.api_calls += 1
+
+
+def record(community_id, policy_id, step_name, measurement):
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    key = (community_id, policy_id, step_name, hour)
+    with _lock:
+        aggregate = _buffer.get(key)
+        if aggregate is None:
+            aggregate = _buffer[key] = _Aggregate()
+        aggregate.add(measurement)
+
+
+def flush_if_due():
+    """Write the buffered stats to the database, if they haven't been for POLICY_STEP_STATS_FLUSH_SECONDS"""
+    with _lock:
+        due = bool(_buffer) and time.monotonic() - _last_flush >= settings.POLICY_STEP_STATS_FLUSH_SECONDS
+    if due:
+        flush()
+
+
+def flush():
+    """Write the buffered stats to the database"""
+    from policyengine.models import Policy, PolicyStepStats
+
+    global _buffer, _last_flush
+    with _lock:
+        pending, _buffer = _buffer, {}
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+
+    # skip the stats of policies deleted in the meantime
+    existing_policy_ids = set(
+        Policy.objects.filter(pk__in={key[1] for key in pending}).values_list("pk", flat=True)
+    )
+    for (community_id, policy_id, step_name, hour), aggregate in pending.items():
+        if policy_id not in existing_policy_ids:
+            continue
+        try:
+            with transaction.atomic():
+                stats, _ = PolicyStepStats.objects.select_for_update().get_or_create(
+                    policy_id=policy_id, step=step_name, hour=hour, defaults={"community_id": community_id}
+                )
+                stats.add(aggregate)
+                stats.save()
+        except DatabaseError as e:
+            logger.warning(f"Failed to save stats for step {step_name} of policy {policy_id}: {repr(e)} {e}")
+
+
+def reset():
+    """Drop the buffered stats without saving them"""
+    with _lock:
+        _buffer.clear()
+
+
+def prune():
+    """Delete stats older than POLICY_STEP_STATS_RETENTION_DAYS. Runs at most once an hour per process."""
+    from policyengine.models import PolicyStepStats
+
+    global _last_prune
+    if _last_prune is not None and time.monotonic() - _last_prune < 3600:
+        return
+    _last_prune = time.monotonic()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.POLICY_STEP_STATS_RETENTION_DAYS)
+    PolicyStepStats.objects.filter(hour__lt=cutoff).delete()
+
+
+def summarize(community, since):
+    """
+    Stats of the community's policy steps since the given time, one dict per (policy, step),
+    ordered by total wall time with the most expensive first.
+    """
+    from policyengine.models import PolicyStepStats
+
+    totals = {}
+    for stats in PolicyStepStats.objects.filter(community=community, hour__gte=since).select_related("policy"):
+        key = (stats.policy_id, stats.step)
+        if key not in totals:
+            totals[key] = {
+                "policy": stats.policy,
+                "aggregate": PolicyStepStats(policy=stats.policy, step=stats.step),
+            }
+        totals[key]["aggregate"].add(stats)
+
+    summaries = []
+    for (policy_id, step_name), total in totals.items():
+        aggregate = total["aggregate"]
+        count = aggregate.count or 1
+        summaries.append(
+            {
+                "policy_id": policy_id,
+                "policy": total["policy"].name,
+                "step": step_name,
+                "count": aggregate.count,
+                "errors": aggregate.errors,
+                "total_wall_time": round(aggregate.wall_time, 6),
+                "mean_wall_time": round(aggregate.wall_time / count, 6),
+                "p50_wall_time": histogram_quantile(aggregate.wall_time_histogram, WALL_TIME_BUCKETS, 0.5),
+                "p95_wall_time": histogram_quantile(aggregate.wall_time_histogram, WALL_TIME_BUCKETS, 0.95),
+                "max_wall_time": round(aggregate.max_wall_time, 6),
+                "mean_cpu_time": round(aggregate.cpu_time / count, 6),
+                "mean_queries": round(aggregate.queries / count, 2),
+                "p95_queries": histogram_quantile(aggregate.queries_histogram, QUERY_COUNT_BUCKETS, 0.95),
+                "api_calls": aggregate.api_calls,
+            }
+        )
+    summaries.sort(key=lambda summary: summary["total_wall_time"], reverse=True)
+    return summaries
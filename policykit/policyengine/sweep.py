@@ -0,0 +1,151 @@
+"""
+Loading pending proposals for re-evaluation.
+
+Proposals are loaded in fixed-size chunks ordered by primary key (keyset pagination), so memory stays flat
+regardless of how many proposals are pending. Everything the engine touches for each proposal (policy, the
+polymorphic action and its initiator, the governance process and the community's platforms) is loaded in bulk
+per chunk, so the number of queries grows with the number of chunks rather than the number of proposals.
+"""
+import logging
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Max, Q
+
+from policyengine import dirty_queue
+
+logger = logging.getLogger(__name__)
+
+
+def sweepable_proposals():
+    """
+    Pending proposals that the periodic sweep should re-evaluate. Proposals with a scheduled evaluation
+    (see ``dirty_queue``) are left to it, and proposals that declared a later wake-up time with
+    ``Proposal.check_again_at`` are skipped until then.
+    """
+    from policyengine.models import Proposal
+
+    now = datetime.now(timezone.utc)
+    return (
+        Proposal.objects.filter(status=Proposal.PROPOSED)
+        .filter(dirty_queue.not_freshly_dirty())
+        .filter(Q(next_evaluation_at__isnull=True) | Q(next_evaluation_at__lte=now) | Q(dirty_since__isnull=False))
+    )
+
+
+def iter_pending_proposal_chunks(queryset=None, chunk_size=None):
+    """
+    Yield lists of pending Proposals, ordered by pk, with related objects prefetched, along with the
+    CommunityPlatforms of their communities as returned by ``prefetch_proposal_relations``.
+    Proposals created after the sweep started are not included.
+    """
+    if queryset is None:
+        queryset = sweepable_proposals()
+    chunk_size = chunk_size or settings.PENDING_PROPOSAL_CHUNK_SIZE
+
+    max_pk = queryset.aggregate(max_pk=Max("pk"))["max_pk"]
+    if max_pk is None:
+        return
+
+    last_pk = 0
+    while True:
+        chunk = list(
+            queryset.filter(pk__gt=last_pk, pk__lte=max_pk)
+            .select_related("policy__community", "governance_process", "data")
+            .order_by("pk")[:chunk_size]
+        )
+        if not chunk:
+            return
+        platforms_by_community = prefetch_proposal_relations(chunk)
+        yield chunk, platforms_by_community
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def shard_key_for_community(community_id, shard_count=None):
+    """
+    Returns the key of the evaluation shard that the community belongs to. If PROPOSAL_EVALUATION_SHARD_COUNT is
+    set, communities are hashed into that many shards; otherwise each community gets its own shard.
+    """
+    if shard_count is None:
+        shard_count = settings.PROPOSAL_EVALUATION_SHARD_COUNT
+    if shard_count:
+        return f"hash-{community_id % shard_count}"
+    return f"community-{community_id}"
+
+
+def pending_proposal_shards(shard_count=None):
+    """
+    Returns a dict mapping shard key to the list of Community pks in that shard that have pending proposals.
+    """
+    community_ids = (
+        sweepable_proposals()
+        .order_by()
+        .values_list("action__community__community_id", flat=True)
+        .distinct()
+    )
+    shards = {}
+    for community_id in sorted(community_ids):
+        shards.setdefault(shard_key_for_community(community_id, shard_count), []).append(community_id)
+    return shards
+
+
+def prefetch_proposal_relations(proposals):
+    """
+    Load the actions (resolved to their real subclasses), action initiators and CommunityPlatforms for the
+    given proposals in bulk, and attach them to the proposals. Returns a dict mapping Community pk to a list
+    of that community's CommunityPlatforms, ordered by pk.
+    """
+    from policyengine.models import (
+        BaseAction,
+        Community,
+        CommunityPlatform,
+        CommunityUser,
+        ExecutedActionTriggerAction,
+        GovernableAction,
+    )
+
+    # Resolve actions polymorphically: one query for the base table, plus one per action subclass
+    actions = BaseAction.objects.in_bulk({p.action_id for p in proposals})
+
+    # ExecutedActionTriggerActions wrap the GovernableAction that was executed
+    triggers = [a for a in actions.values() if isinstance(a, ExecutedActionTriggerAction)]
+    wrapped_action_ids = {t.action_id for t in triggers}
+    wrapped_actions = GovernableAction.objects.in_bulk(wrapped_action_ids) if wrapped_action_ids else {}
+
+    all_actions = list(actions.values()) + list(wrapped_actions.values())
+    initiator_ids = {a.initiator_id for a in all_actions if a.initiator_id}
+    initiators = CommunityUser.objects.in_bulk(initiator_ids) if initiator_ids else {}
+
+    # Load every platform of every community involved, because they're all made available to policy code
+    platform_ids = {a.community_id for a in all_actions}
+    platforms = list(
+        CommunityPlatform.objects.filter(
+            community_id__in=CommunityPlatform.objects.filter(pk__in=platform_ids).values("community_id")
+        ).order_by("pk")
+    )
+
+    communities = {p.policy.community_id: p.policy.community for p in proposals if p.policy and p.policy.community}
+    missing_community_ids = {c.community_id for c in platforms} - set(communities.keys())
+    if missing_community_ids:
+        communities.update(Community.objects.in_bulk(missing_community_ids))
+
+    platforms_by_pk = {}
+    platforms_by_community = {}
+    for platform in platforms:
+        platform.community = communities[platform.community_id]
+        platforms_by_pk[platform.pk] = platform
+        platforms_by_community.setdefault(platform.community_id, []).append(platform)
+
+    for action in all_actions:
+        action.community = platforms_by_pk[action.community_id]
+        if action.initiator_id:
+            action.initiator = initiators[action.initiator_id]
+    for trigger in triggers:
+        trigger.action = wrapped_actions[trigger.action_id]
+
+    for proposal in proposals:
+        proposal.action = actions[proposal.action_id]
+
+    return platforms_by_community
@@ -1,6 +1,7 @@
 from __future__ import absolute_import, unicode_literals
 
 import logging
+import time
 
 from celery import shared_task
 
@@ -10,51 +11,163 @@ logger = logging.getLogger(__name__)
 @shared_task
 def evaluate_pending_proposals():
     """
-    Iterates through all pending Proposals and re-evaluates them.
+    Dispatches the re-evaluation of all pending Proposals. Communities with pending proposals are split into
+    shards (see ``sweep.pending_proposal_shards``), and each shard is evaluated by a separate
+    ``evaluate_proposal_shard`` task. A shard that is still being evaluated from a previous tick holds a lease,
+    and is not dispatched again until that lease is released or expires.
     """
     # import PK modules inside the task so we get code updates.
-    from policyengine import engine
-    from policyengine.models import Proposal, ExecutedActionTriggerAction, GovernableAction
-
-
-    pending_proposals = Proposal.objects.filter(status=Proposal.PROPOSED)
-    #logger.debug("Running evaluate_pending_proposals:" + str(len(pending_proposals)))
+    from django.conf import settings
+    from policyengine import metrics, step_stats
+    from policyengine.models import EvaluationShard
+    from policyengine.sweep import pending_proposal_shards
 
-    for proposal in pending_proposals:
-        try:
-            community_name = proposal.action.community.community_name
-        except Exception as e:
-            logger.error(f"Error getting community name for proposal {proposal}, deleting proposal: {repr(e)} {e}")
-            proposal.delete()
+    started = time.monotonic()
+    metrics.record_beat_tick()
+    for shard_key, community_ids in pending_proposal_shards().items():
+        token = EvaluationShard.acquire_lease(shard_key, settings.PROPOSAL_SHARD_LEASE_SECONDS)
+        if not token:
+            logger.debug(f"Shard {shard_key} is still being evaluated, not dispatching it again")
             continue
-        logger.debug(f"{community_name} - Evaluating proposal '{proposal}'")
         try:
-            engine.evaluate_proposal(proposal)
-        except (engine.PolicyDoesNotExist, engine.PolicyIsNotActive, engine.PolicyDoesNotPassFilter) as e:
-            logger.warn(f"{community_name} - ERROR - {type(e).__name__} deleting proposal: {proposal}")
-            new_proposal = engine.delete_and_rerun(proposal)
-            logger.debug(f"{community_name} - New proposal: {new_proposal}")
+            evaluate_proposal_shard.delay(shard_key, community_ids, token)
         except Exception as e:
-            logger.error(f"{community_name} - Error running proposal {proposal}: {repr(e)} {e}")
-            
-            
-        # If the engine just PASSED a GovernableAction, generate a new Trigger for the newly executed action.
-        # This lets us use GovernableActions as triggers for trigger policies.
-        if proposal.status == Proposal.PASSED and isinstance(proposal.action, GovernableAction):
-            ExecutedActionTriggerAction.from_action(proposal.action).evaluate()
+            logger.error(f"Failed to dispatch shard {shard_key}: {repr(e)} {e}")
+            EvaluationShard.release_lease(shard_key, token)
+
+    step_stats.prune()
+    metrics.beat_tick_seconds.observe(time.monotonic() - started)
+
+
+@shared_task
+def prune_logs():
+    """Deletes expired logs, see ``retention.prune_logs``"""
+    from policyengine import retention
+
+    retention.prune_logs()
+
+
+@shared_task
+def evaluate_proposal_shard(shard_key, community_ids, token):
+    """
+    Re-evaluates the pending Proposals of the given communities, as dispatched by ``evaluate_pending_proposals``.
+    Proposals are loaded in chunks of PENDING_PROPOSAL_CHUNK_SIZE, with related objects prefetched.
+    Stops starting new evaluations once PROPOSAL_SHARD_TIME_BUDGET seconds have passed; the remaining
+    proposals are picked up on the next tick.
 
-    clean_up_logs()
-    # logger.debug("finished task")
+    The shard's lease is extended when the task starts and renewed as it goes, so that most of
+    PROPOSAL_SHARD_LEASE_SECONDS is left on it when each evaluation starts. If the lease can't be renewed,
+    the task stops, since the shard may have been dispatched again.
+    """
+    from django.conf import settings
+    from policyengine import engine, metrics, step_stats
+    from policyengine.code_cache import compiled_code_cache
+    from policyengine.models import EvaluationShard
+    from policyengine.sweep import iter_pending_proposal_chunks, sweepable_proposals
+
+    lease_seconds = settings.PROPOSAL_SHARD_LEASE_SECONDS
+    if not EvaluationShard.start(shard_key, token, lease_seconds):
+        logger.warn(f"Lease for shard {shard_key} expired before the shard was evaluated, skipping it")
+        return
+
+    started = renewed = time.monotonic()
+    deadline = started + settings.PROPOSAL_SHARD_TIME_BUDGET
+    result = {"communities": community_ids, "evaluated": 0, "errors": 0, "out_of_time": False, "lease_lost": False}
+    try:
+        pending_proposals = sweepable_proposals().filter(action__community__community_id__in=community_ids)
+        # one context factory per community, with the platforms loaded along with the first chunk it appears in
+        context_factories = {}
+        for chunk, platforms_by_community in iter_pending_proposal_chunks(pending_proposals):
+            for proposal in chunk:
+                if time.monotonic() > deadline:
+                    result["out_of_time"] = True
+                    break
+                # renew when a tenth of the lease has passed, so that the lease doesn't need a query per proposal
+                if time.monotonic() - renewed > lease_seconds / 10:
+                    if not EvaluationShard.renew_lease(shard_key, token, lease_seconds):
+                        result["lease_lost"] = True
+                        break
+                    renewed = time.monotonic()
+                community = proposal.action.community.community
+                if community.pk not in context_factories:
+                    context_factories[community.pk] = engine.EvaluationContextFactory(
+                        community, platforms_by_community.get(community.pk)
+                    )
+                if evaluate_pending_proposal(proposal, context_factories[community.pk]):
+                    result["evaluated"] += 1
+                else:
+                    result["errors"] += 1
+            if result["out_of_time"] or result["lease_lost"]:
+                break
+    finally:
+        result["duration"] = round(time.monotonic() - started, 3)
+        EvaluationShard.release_lease(shard_key, token, result)
+        step_stats.flush()
+        metrics.shard_seconds.observe(result["duration"])
+
+    if result["lease_lost"]:
+        logger.warn(f"Lease for shard {shard_key} expired while the shard was evaluated, stopping: {result}")
+    elif result["out_of_time"]:
+        logger.warn(f"Shard {shard_key} ran out of time, remaining proposals will be evaluated on the next tick: {result}")
+    else:
+        logger.debug(f"Evaluated shard {shard_key}: {result}")
+    logger.debug(f"Compiled policy code cache: {compiled_code_cache.stats()}")
 
 
-def clean_up_logs():
-    from django_db_logger.models import EvaluationLog
-    from policykit.settings import DB_MAX_LOGS_TO_KEEP
+@shared_task
+def evaluate_dirty_proposal(proposal_id):
+    """
+    Re-evaluates a pending Proposal right after its votes, data or governance process changed.
+    Scheduled by ``dirty_queue.mark_proposal_dirty``.
+    """
+    from policyengine import engine
+    from policyengine.models import Proposal
+    from policyengine.sweep import prefetch_proposal_relations
 
-    expired_logs = EvaluationLog.objects.filter(
-        pk__in=EvaluationLog.objects.all().order_by("-create_datetime").values_list("pk")[DB_MAX_LOGS_TO_KEEP:]
+    proposal = (
+        Proposal.objects.filter(pk=proposal_id, status=Proposal.PROPOSED)
+        .select_related("policy__community", "governance_process", "data")
+        .first()
     )
+    if not proposal:
+        return
+    platforms_by_community = prefetch_proposal_relations([proposal])
+    community = proposal.action.community.community
+    context_factory = engine.EvaluationContextFactory(community, platforms_by_community.get(community.pk))
+    evaluate_pending_proposal(proposal, context_factory)
+
+
+def evaluate_pending_proposal(proposal, context_factory=None):
+    """
+    Re-evaluates a single pending Proposal. Returns False if evaluating it raised an unexpected error.
+    """
+    from policyengine import dirty_queue, engine
+    from policyengine.models import Proposal, ExecutedActionTriggerAction, GovernableAction
+
+    try:
+        community_name = proposal.action.community.community_name
+    except Exception as e:
+        logger.error(f"Error getting community name for proposal {proposal}, deleting proposal: {repr(e)} {e}")
+        proposal.delete()
+        return False
+    if not dirty_queue.claim_dirty_proposal(proposal):
+        logger.debug(f"{community_name} - Proposal '{proposal}' was completed or claimed by another evaluation")
+        return True
+    logger.debug(f"{community_name} - Evaluating proposal '{proposal}'")
+    succeeded = True
+    try:
+        engine.evaluate_proposal(proposal, context_factory=context_factory)
+    except (engine.PolicyDoesNotExist, engine.PolicyIsNotActive, engine.PolicyDoesNotPassFilter) as e:
+        logger.warn(f"{community_name} - ERROR - {type(e).__name__} deleting proposal: {proposal}")
+        new_proposal = engine.delete_and_rerun(proposal)
+        logger.debug(f"{community_name} - New proposal: {new_proposal}")
+    except Exception as e:
+        logger.error(f"{community_name} - Error running proposal {proposal}: {repr(e)} {e}")
+        succeeded = False
+
+    # If the engine just PASSED a GovernableAction, generate a new Trigger for the newly executed action.
+    # This lets us use GovernableActions as triggers for trigger policies.
+    if proposal.status == Proposal.PASSED and isinstance(proposal.action, GovernableAction):
+        ExecutedActionTriggerAction.from_action(proposal.action).evaluate()
+    return succeeded
 
-    if expired_logs.exists():
-        # logger.debug(f"Deleting {expired_logs.count()} EvaluationLogs")
-        expired_logs.delete()
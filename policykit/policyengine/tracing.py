@@ -0,0 +1,242 @@
+"""
+Lightweight tracing of action ingestion, policy evaluation and platform calls, without a vendor SDK.
+
+Code is traced with the ``span`` context manager or the ``traced`` decorator. The current span is kept in a
+context variable, so nested spans become its children, and the trace id is passed on to celery tasks in a
+message header. Finished spans are handed to the exporters listed in TRACING_EXPORTERS:
+
+- "jsonl" appends each span as a line of JSON to TRACING_JSONL_PATH, which works offline.
+- "logging" logs each span to the "policyengine.tracing" logger.
+- Any other entry is the dotted path of an exporter class, which is instantiated without arguments and
+  must implement ``export(span)``.
+
+Only a fraction TRACING_SAMPLE_RATE of traces is recorded. The decision is made when a trace starts and
+applies to all its spans, including the ones in celery tasks. Tracing is off if there are no exporters.
+"""
+import contextvars
+import functools
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CELERY_HEADER = "policykit_trace"
+
+_current_span = contextvars.ContextVar("policykit_current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, sampled=True, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.error = None
+        self.start_time = time.time()
+        self.duration = None
+        self._started = time.perf_counter()
+        self._token = None
+
+    def set_attribute(self, key, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def end(self):
+        self.duration = time.perf_counter() - self._started
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        if self.sampled:
+            _export(self)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def _new_trace_id():
+    return uuid.uuid4().hex
+
+
+def is_enabled():
+    return bool(settings.TRACING_EXPORTERS)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    Start a span and make it the current span. ``parent`` is the parent span, or a (trace_id, span_id, sampled)
+    tuple for a span in another process; it defaults to the current span. Returns None if tracing is off.
+    The span must be ended with ``span.end()``, in the same context.
+    """
+    if not is_enabled():
+        return None
+    if parent is None:
+        parent = _current_span.get()
+    if isinstance(parent, Span):
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+    elif parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = _new_trace_id(), None, random.random() < settings.TRACING_SAMPLE_RATE
+    span = Span(name, trace_id, parent_id=parent_id, sampled=sampled, attributes=attributes if sampled else None)
+    span._token = _current_span.set(span)
+    return span
+
+
+@contextmanager
+def span(name, **attributes):
+    """Trace the body as a span. Yields the span, or None if tracing is off."""
+    current = start_span(name, **attributes)
+    if current is None:
+        yield None
+        return
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end()
+
+
+def traced(name=None):
+    """Decorator that traces each call of the function as a span"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Exporters
+
+
+class JsonLinesExporter:
+    """Appends each span to a file, as a line of JSON"""
+
+    def __init__(self, path=None):
+        self.path = path or settings.TRACING_JSONL_PATH
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class LoggingExporter:
+    """Logs each span to the "policyengine.tracing" logger"""
+
+    def export(self, span):
+        logger.info(f"span {span.name} {span.duration * 1000:.1f}ms", extra={"span": span.to_dict()})
+
+
+EXPORTER_ALIASES = {
+    "jsonl": JsonLinesExporter,
+    "logging": LoggingExporter,
+}
+
+_exporters = None
+_exporters_config = None
+_exporters_lock = threading.Lock()
+
+
+def get_exporters():
+    global _exporters, _exporters_config
+    config = tuple(settings.TRACING_EXPORTERS)
+    if _exporters is None or _exporters_config != config:
+        with _exporters_lock:
+            exporters = []
+            for entry in config:
+                try:
+                    exporter_class = EXPORTER_ALIASES.get(entry) or import_string(entry)
+                    exporters.append(exporter_class())
+                except Exception as e:
+                    logger.error(f"Failed to set up tracing exporter {entry}: {repr(e)} {e}")
+            _exporters, _exporters_config = exporters, config
+    return _exporters
+
+
+def _export(span):
+    for exporter in get_exporters():
+        try:
+            exporter.export(span)
+        except Exception as e:
+            logger.warning(f"Tracing exporter {type(exporter).__name__} failed: {repr(e)} {e}")
+
+
+# Celery propagation
+
+
+def _format_header(span):
+    return f"{span.trace_id}:{span.span_id}:{int(span.sampled)}"
+
+
+def _parse_header(value):
+    try:
+        trace_id, span_id, sampled = value.split(":")
+        return trace_id, span_id, sampled == "1"
+    except (AttributeError, ValueError):
+        return None
+
+
+def connect_celery_signals():
+    from celery import signals
+
+    @signals.before_task_publish.connect(weak=False)
+    def add_trace_header(headers=None, **kwargs):
+        current = _current_span.get()
+        if current is not None and headers is not None:
+            headers[CELERY_HEADER] = _format_header(current)
+
+    @signals.task_prerun.connect(weak=False)
+    def start_task_span(task_id=None, task=None, **kwargs):
+        if not is_enabled() or task is None or _current_span.get() is not None:
+            # tasks run eagerly are already part of the current trace
+            return
+        header = getattr(task.request, CELERY_HEADER, None) or (getattr(task.request, "headers", None) or {}).get(
+            CELERY_HEADER
+        )
+        parent = _parse_header(header)
+        task_span = start_span(f"celery.task {task.name}", parent=parent, task_id=task_id)
+        task.request.policykit_span = task_span
+
+    @signals.task_postrun.connect(weak=False)
+    def end_task_span(task=None, state=None, **kwargs):
+        task_span = getattr(task.request, "policykit_span", None) if task is not None else None
+        if task_span is not None:
+            task.request.policykit_span = None
+            task_span.set_attribute("state", state)
+            task_span.end()
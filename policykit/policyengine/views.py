@@ -31,6 +31,23 @@ DASHBOARD_MAX_ACTIONS = 20
 DASHBOARD_BASE = "policyadmin/dashboard/dashboard_base.html"
 DASHBOARD_BASE_AJAX = "policyadmin/dashboard/dashboard_base_ajax.html"
 
+def metrics(request):
+    """
+    Engine metrics in the Prometheus text format. Requires the METRICS_TOKEN as a bearer token,
+    or a logged in superuser if no token is configured.
+    """
+    from hmac import compare_digest
+    from policyengine import metrics as engine_metrics
+
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not compare_digest(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+            return HttpResponse(status=401)
+    elif not request.user.is_superuser:
+        return HttpResponse(status=403)
+
+    return HttpResponse(engine_metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 def homepage(request):
     """PolicyKit splash page"""
     return render(request, 'home.html', {})
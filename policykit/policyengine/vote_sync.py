@@ -0,0 +1,180 @@
+"""
+Syncing the votes of a Metagov governance process into PolicyKit votes.
+
+Each update of a vote process carries the whole outcome, so the integrations' ``governance_process_updated``
+receivers pass it here instead of writing votes one by one. The users are looked up in one query (new users are
+created), the proposal's existing votes are loaded in one query, and the difference is written with one
+``bulk_create`` and one ``bulk_update``. An update costs the same number of queries however many users voted.
+
+Metagov sends the outcome again on every poll and reaction, usually unchanged. The votes of the last outcome synced
+from each governance process are kept in a ``VoteOutcomeSnapshot`` with a fingerprint (a hash of the votes, by
+platform user). An outcome with the same fingerprint is dropped after one query, and a changed one only syncs the
+votes that differ from the snapshot, so that only the users who voted since are looked up and written.
+
+Votes are only added or changed, like before: a vote that's no longer in the outcome is kept. Because bulk writes
+don't send signals, the proposal's ``VoteTally``, the vote metrics and the dirty queue are updated here.
+"""
+import hashlib
+import json
+import logging
+
+from django.db import transaction
+
+from policyengine import dirty_queue, metrics
+
+logger = logging.getLogger(__name__)
+
+
+def get_or_create_users(user_class, community, user_ids, to_username=None, defaults=None):
+    """
+    Returns ``{user id: user}`` for the platform user ids, creating the users that don't exist yet. That's a
+    single query when they all exist.
+
+    ``to_username`` maps a platform user id to the username of its ``CommunityUser`` (by default they're the
+    same), and ``defaults`` maps a username to the other fields of a new user.
+    """
+    to_username = to_username or (lambda user_id: user_id)
+    usernames = {user_id: to_username(user_id) for user_id in user_ids}
+    users = {
+        user.username: user
+        for user in user_class.objects.filter(community=community, username__in=set(usernames.values()))
+    }
+    for username in set(usernames.values()) - users.keys():
+        users[username], _ = user_class.objects.get_or_create(
+            username=username, community=community, defaults=defaults(username) if defaults else None
+        )
+    return {user_id: users[username] for user_id, username in usernames.items()}
+
+
+def _lock(proposal):
+    """Lock the proposal, so that concurrent updates of the same process don't insert the same vote twice"""
+    from policyengine.models import Proposal
+
+    list(Proposal.objects.select_for_update().filter(pk=proposal.pk).values_list("pk", flat=True))
+
+
+def fingerprint(vote_class, votes):
+    """A hash of the votes, as passed to ``sync_outcome``"""
+    normalized = json.dumps([vote_class.__name__, sorted(votes.items())], separators=(",", ":"), default=str)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def sync_outcome(proposal, vote_class, votes, get_users):
+    """
+    Sync the votes of a process outcome, with ``votes`` mapping ``(platform user id, *key)`` to the value of each
+    vote (see ``sync_votes``). Only the votes that changed since the last outcome synced from the proposal's
+    governance process are written. Returns the number of votes created and updated.
+    """
+    from policyengine.models import VoteOutcomeSnapshot
+
+    process_id = proposal.governance_process_id
+    if process_id is None:
+        users = get_users(list({user_id for user_id, *_ in votes}))
+        return sync_votes(proposal, vote_class, {(users[user_id], *key): value for (user_id, *key), value in votes.items()})
+
+    # JSON object keys are strings
+    snapshot_votes = {json.dumps(key, default=str): value for key, value in votes.items()}
+    outcome_fingerprint = fingerprint(vote_class, snapshot_votes)
+    snapshots = VoteOutcomeSnapshot.objects.filter(process_id=process_id)
+    if snapshots.filter(fingerprint=outcome_fingerprint).exists():
+        logger.debug(f"Ignoring unchanged outcome of process {process_id}")
+        return 0, 0
+
+    with transaction.atomic():
+        _lock(proposal)
+        previous = snapshots.filter(vote_type=vote_class.__name__).values_list("votes", flat=True).first() or {}
+        changed = {
+            key: votes[key]
+            for key, snapshot_key in zip(votes, snapshot_votes)
+            if snapshot_key not in previous or previous[snapshot_key] != votes[key]
+        }
+        users = get_users(list({user_id for user_id, *_ in changed}))
+        result = sync_votes(
+            proposal, vote_class, {(users[user_id], *key): value for (user_id, *key), value in changed.items()}
+        )
+        VoteOutcomeSnapshot.objects.update_or_create(
+            process_id=process_id,
+            defaults={"fingerprint": outcome_fingerprint, "vote_type": vote_class.__name__, "votes": snapshot_votes},
+        )
+    return result
+
+
+def sync_votes(proposal, vote_class, values):
+    """
+    Make the proposal's votes of ``vote_class`` match ``values``, which maps ``(user, *key)`` to the value of each
+    vote. The key and value are the vote class's ``TALLY_FIELDS``: ``(user,) -> boolean_value`` for a
+    BooleanVote, ``(user,) -> value`` for a ChoiceVote and ``(user, candidate) -> option`` for a SelectVote.
+    Returns the number of votes created and updated.
+    """
+    from policyengine.models import VoteTally
+
+    if not values:
+        return 0, 0
+    *key_fields, value_field = vote_class.TALLY_FIELDS
+    with transaction.atomic():
+        _lock(proposal)
+        existing = {
+            (vote.user_id, *(getattr(vote, field) for field in key_fields)): vote
+            for vote in vote_class.objects.filter(proposal=proposal, user__in={user for user, *_ in values})
+        }
+
+        created, updated = [], []
+        for (user, *key), value in values.items():
+            vote = existing.get((user.pk, *key))
+            if vote is None:
+                logger.debug(f"Counting {vote_class.__name__} {key} {value} by {user} for proposal {proposal}")
+                created.append(
+                    vote_class(proposal=proposal, user=user, **dict(zip(key_fields, key)), **{value_field: value})
+                )
+            elif getattr(vote, value_field) != value:
+                logger.debug(f"Counting {vote_class.__name__} {key} {value} by {user} for proposal {proposal} (vote changed)")
+                setattr(vote, value_field, value)
+                updated.append(vote)
+
+        if created:
+            vote_class.objects.bulk_create(created)
+            VoteTally.votes_saved(created, created=True)
+        if updated:
+            vote_class.objects.bulk_update(updated, [value_field])
+            VoteTally.votes_saved(updated, created=False)
+
+    if created:
+        metrics.votes.inc(len(created), vote_type=vote_class.__name__, event="created")
+    if updated:
+        metrics.votes.inc(len(updated), vote_type=vote_class.__name__, event="updated")
+    if created or updated:
+        dirty_queue.mark_proposal_dirty(proposal.pk)
+    return len(created), len(updated)
+
+
+def sync_option_votes(proposal, votes, get_users, boolean=None):
+    """
+    Sync the votes of a process whose outcome lists the users that picked each option, like
+    ``{"yes": {"users": [...]}, "no": {"users": [...]}}``. ``get_users`` maps a list of platform user ids to
+    ``{user id: user}``, for example with ``get_or_create_users``.
+
+    The votes are BooleanVotes if ``boolean`` is True, ChoiceVotes if it's False, and by default BooleanVotes if
+    the options are exactly "yes" and "no".
+    """
+    from policyengine.models import BooleanVote, ChoiceVote
+
+    if boolean is None:
+        boolean = set(votes.keys()) == {"yes", "no"}
+    values = {}
+    for option, result in votes.items():
+        for user_id in result["users"]:
+            values[(user_id,)] = option == "yes" if boolean else option
+    return sync_outcome(proposal, BooleanVote if boolean else ChoiceVote, values, get_users)
+
+
+def sync_select_votes(proposal, votes, get_users):
+    """
+    Sync the votes of a process whose outcome maps each user to the option they picked for each candidate, like
+    ``{user id: {candidate: option}}``. See ``sync_option_votes`` for ``get_users``.
+    """
+    from policyengine.models import SelectVote
+
+    values = {
+        (user_id, candidate): option for user_id, user_votes in votes.items() for candidate, option in user_votes.items()
+    }
+    return sync_outcome(proposal, SelectVote, values, get_users)
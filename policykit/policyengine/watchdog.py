@@ -0,0 +1,149 @@
+"""
+Time budgets for policy code.
+
+``exec_code_block`` runs every policy step inside ``enforce``. Code compiled by ``compile_user_code`` calls
+``check_budget`` at the start of every iteration of a loop, comprehension or generator expression, which raises
+``BudgetInterrupt`` if the step went over its budget. The exception is only ever raised at these checkpoints in
+policy code, never in the middle of a database query, a transaction or platform code that holds a lock.
+
+A step that goes over budget without reaching a checkpoint, for example in one long platform call, isn't
+interrupted: its side effects have already happened, so its result is kept, and the violation is only recorded.
+
+The optional instruction budget counts the bytecode instructions of policy code executed, with a trace function.
+It's exact and deterministic, but makes policy code several times slower, so it's off by default.
+"""
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WALL_TIME = "wall time"
+CPU_TIME = "CPU time"
+INSTRUCTIONS = "instruction"
+
+# the budget of the step running in each thread
+_current = threading.local()
+
+
+class BudgetInterrupt(BaseException):
+    """
+    Raised inside a policy step that went over its budget. It derives from BaseException, so that policy code
+    catching Exception doesn't swallow it.
+    """
+
+    pass
+
+
+class StepBudget:
+    """
+    The budget for one run of a policy step. After the run, ``exceeded`` says which budget was exceeded, if any.
+    """
+
+    def __init__(self, step_name, wall_time=None, cpu_time=None, instructions=None):
+        self.step_name = step_name
+        self.wall_time = settings.POLICY_STEP_WALL_TIME_BUDGET if wall_time is None else wall_time
+        self.cpu_time = settings.POLICY_STEP_CPU_TIME_BUDGET if cpu_time is None else cpu_time
+        self.instructions = settings.POLICY_STEP_INSTRUCTION_BUDGET if instructions is None else instructions
+        self.exceeded = None
+        self._wall_deadline = None
+        self._cpu_deadline = None
+
+    @property
+    def is_limited(self):
+        return bool(self.wall_time or self.cpu_time or self.instructions)
+
+    def describe(self):
+        limits = {WALL_TIME: f"{self.wall_time}s", CPU_TIME: f"{self.cpu_time}s", INSTRUCTIONS: f"{self.instructions} bytecode instructions"}
+        return f"{self.exceeded} budget of {limits.get(self.exceeded)}"
+
+    def _start(self):
+        if self.wall_time:
+            self._wall_deadline = time.monotonic() + self.wall_time
+        if self.cpu_time:
+            self._cpu_deadline = time.thread_time() + self.cpu_time
+
+    def _check_time(self):
+        if self._wall_deadline is not None and time.monotonic() > self._wall_deadline:
+            self.exceeded = WALL_TIME
+        elif self._cpu_deadline is not None and time.thread_time() > self._cpu_deadline:
+            self.exceeded = CPU_TIME
+
+    def check(self):
+        """Raise BudgetInterrupt if the step is over budget. Must be called by the thread running the step."""
+        if self.exceeded is None:
+            self._check_time()
+            if self.exceeded is None:
+                return
+            logger.debug(f"Interrupting policy step '{self.step_name}': exceeded {self.exceeded} budget")
+        raise BudgetInterrupt()
+
+
+def check_budget():
+    """
+    Checkpoint called by policy code at the start of every loop iteration. Returns True, so that it can be used as
+    the condition of a comprehension.
+    """
+    budget = getattr(_current, "budget", None)
+    if budget is not None:
+        budget.check()
+    return True
+
+
+@contextmanager
+def enforce(budget):
+    """
+    Run the body under the budget. If it goes over budget, ``budget.exceeded`` is set, and BudgetInterrupt is raised
+    at the next checkpoint in the body's policy code, if there is one. Nested steps in the same thread run under the
+    outermost budget.
+    """
+    if not budget.is_limited or getattr(_current, "budget", None) is not None:
+        yield budget
+        return
+
+    budget._start()
+    previous_trace = None
+    if budget.instructions:
+        previous_trace = sys.gettrace()
+        sys.settrace(_instruction_tracer(budget))
+    _current.budget = budget
+    try:
+        yield budget
+    finally:
+        if budget.instructions:
+            sys.settrace(previous_trace)
+        _current.budget = None
+        if budget.exceeded is None:
+            # record a step that finished over budget without reaching a checkpoint
+            budget._check_time()
+
+
+def _instruction_tracer(budget):
+    from policyengine.safe_exec_code import USER_CODE_FILENAME
+
+    executed = 0
+
+    def trace_opcodes(frame, event, arg):
+        nonlocal executed
+        if event == "opcode":
+            executed += 1
+            if executed > budget.instructions:
+                # stop counting, the step is interrupted at its next checkpoint
+                budget.exceeded = INSTRUCTIONS
+                frame.f_trace_opcodes = False
+                return None
+        return trace_opcodes
+
+    def trace_calls(frame, event, arg):
+        # only count instructions of policy code, not of the platform functions that it calls
+        if budget.exceeded is None and frame.f_code.co_filename == USER_CODE_FILENAME:
+            # count bytecode instructions rather than lines, so that loops on a single line are counted too
+            frame.f_trace_opcodes = True
+            return trace_opcodes
+        return None
+
+    return trace_calls
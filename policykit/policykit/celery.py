@@ -3,6 +3,7 @@ from __future__ import absolute_import, unicode_literals
 from django.conf import settings
 
 
+import logging
 import os
 
 from celery import Celery, signals
@@ -55,6 +56,10 @@ app.autodiscover_tasks()
 # Don't store task results in the database
 app.conf.task_ignore_result = True
 
+# Carry trace ids from the code that dispatches a task into the task (see policyengine/tracing.py)
+from policyengine.tracing import connect_celery_signals
+connect_celery_signals()
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
@@ -73,5 +78,29 @@ def init_sentry(**kwargs):
             )],
         )
 
+@signals.worker_init.connect
+def warm_policy_code_cache(**kwargs):
+    """
+    Compile all active policies before the worker pool starts, so forked workers inherit the compiled
+    code and evaluations don't need to compile anything on the hot path.
+    """
+    from django.conf import settings
+    if not settings.POLICY_CODE_CACHE_WARM_START:
+        return
+
+    import django
+    from django.db import connections
+    django.setup()
+
+    from policyengine.code_cache import warm_cache
+    try:
+        warm_cache()
+    except Exception as e:
+        # Never prevent the worker from starting
+        logging.getLogger(__name__).error(f"Failed to warm compiled policy code cache: {repr(e)}")
+    finally:
+        # Don't share database connections with forked worker processes
+        connections.close_all()
+
 if __name__ == '__main__':
     app.start()
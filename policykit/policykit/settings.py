@@ -263,8 +263,91 @@ DEFAULT_LOG_LEVEL = "DEBUG"
 TESTING = sys.argv[1:2] == ["test"]
 LOG_LEVEL = DEFAULT_LOG_LEVEL_FOR_TESTS if TESTING else DEFAULT_LOG_LEVEL
 
-# Maximum number of log records to keep
-DB_MAX_LOGS_TO_KEEP = 5000
+# Compiled policy code cache (see policyengine/code_cache.py).
+# Set POLICY_CODE_CACHE_DIR to share compiled code between processes on the same host.
+POLICY_CODE_CACHE_SIZE = env.int("POLICY_CODE_CACHE_SIZE", default=1024)
+POLICY_CODE_CACHE_DIR = env("POLICY_CODE_CACHE_DIR", default=None)
+# Compile all active policies when a celery worker boots
+POLICY_CODE_CACHE_WARM_START = env.bool("POLICY_CODE_CACHE_WARM_START", default=True)
+
+# Number of pending proposals loaded at a time when re-evaluating them (see policyengine/sweep.py)
+PENDING_PROPOSAL_CHUNK_SIZE = env.int("PENDING_PROPOSAL_CHUNK_SIZE", default=200)
+# Pending proposals are evaluated in separate celery tasks per shard. By default each community is its own shard;
+# set PROPOSAL_EVALUATION_SHARD_COUNT to hash communities into a fixed number of shards instead.
+PROPOSAL_EVALUATION_SHARD_COUNT = env.int("PROPOSAL_EVALUATION_SHARD_COUNT", default=0)
+# Seconds a shard task may spend starting new evaluations. Whatever is left is evaluated on the next tick.
+PROPOSAL_SHARD_TIME_BUDGET = env.int("PROPOSAL_SHARD_TIME_BUDGET", default=45)
+# A shard is not dispatched again while its lease is held. The running task renews it, so it only expires if a
+# worker dies mid-shard or a single evaluation takes longer than this.
+PROPOSAL_SHARD_LEASE_SECONDS = env.int("PROPOSAL_SHARD_LEASE_SECONDS", default=300)
+# Proposals are re-evaluated this many seconds after a vote, data or governance process change, so that
+# a burst of changes results in a single evaluation (see policyengine/dirty_queue.py)
+DIRTY_PROPOSAL_DEBOUNCE_SECONDS = env.int("DIRTY_PROPOSAL_DEBOUNCE_SECONDS", default=2)
+# The periodic sweep skips proposals with a scheduled evaluation, unless it's been pending for this long
+DIRTY_PROPOSAL_STALE_SECONDS = env.int("DIRTY_PROPOSAL_STALE_SECONDS", default=120)
+# Number of threads used to run the Filter step of candidate policies concurrently when an action comes in.
+# 1 runs them one at a time. Mostly useful when filters make slow platform API calls. Inside a transaction, like
+# a webhook request under ATOMIC_REQUESTS, filters always run one at a time: the threads use their own database
+# connections, which can't see the transaction's uncommitted rows.
+POLICY_FILTER_CONCURRENCY = env.int("POLICY_FILTER_CONCURRENCY", default=1)
+# Budgets for running a single policy step (see policyengine/watchdog.py). 0 disables a budget. Budgets are checked
+# on each iteration of loops and comprehensions in policy code; a step over budget is stopped there and fails with a
+# PolicyStepBudgetExceeded error in the evaluation logs. The time budgets are off by default.
+POLICY_STEP_WALL_TIME_BUDGET = env.float("POLICY_STEP_WALL_TIME_BUDGET", default=0)
+POLICY_STEP_CPU_TIME_BUDGET = env.float("POLICY_STEP_CPU_TIME_BUDGET", default=0)
+# Maximum number of bytecode instructions of policy code run per step. Exact, but slows policy code down, so off by default.
+POLICY_STEP_INSTRUCTION_BUDGET = env.int("POLICY_STEP_INSTRUCTION_BUDGET", default=0)
+# A policy that exceeds its budget this many times in a row is marked degraded. Proposals governed by a
+# degraded policy are checked at most every POLICY_DEGRADED_CHECK_INTERVAL seconds, until the policy is edited.
+POLICY_BUDGET_VIOLATIONS_BEFORE_DEGRADED = env.int("POLICY_BUDGET_VIOLATIONS_BEFORE_DEGRADED", default=3)
+POLICY_DEGRADED_CHECK_INTERVAL = env.int("POLICY_DEGRADED_CHECK_INTERVAL", default=900)
+# Record the wall time, CPU time, queries and API calls of each policy step, in hourly histograms per policy
+# (see policyengine/step_stats.py). Stats are buffered in memory and written after celery tasks and requests, at most
+# every POLICY_STEP_STATS_FLUSH_SECONDS.
+POLICY_STEP_STATS_ENABLED = env.bool("POLICY_STEP_STATS_ENABLED", default=True)
+POLICY_STEP_STATS_FLUSH_SECONDS = env.int("POLICY_STEP_STATS_FLUSH_SECONDS", default=30)
+POLICY_STEP_STATS_RETENTION_DAYS = env.int("POLICY_STEP_STATS_RETENTION_DAYS", default=7)
+# Engine metrics served at /metrics (see policyengine/metrics.py). Scrapers authenticate with METRICS_TOKEN as a
+# bearer token; without a token only superusers can view them. With several processes, point
+# METRICS_MULTIPROCESS_DIR at a directory shared by all of them so that their metrics are added up, and the lag of
+# beat ticks is measured across celery processes.
+METRICS_TOKEN = env.str("METRICS_TOKEN", default="")
+METRICS_MULTIPROCESS_DIR = env.str("METRICS_MULTIPROCESS_DIR", default="")
+METRICS_WRITE_INTERVAL = env.int("METRICS_WRITE_INTERVAL", default=5)
+METRICS_COLLECT_CACHE_SECONDS = env.int("METRICS_COLLECT_CACHE_SECONDS", default=30)
+# Tracing of action ingestion, evaluation and platform calls (see policyengine/tracing.py). Off unless exporters
+# are set: "jsonl" writes spans to TRACING_JSONL_PATH, "logging" logs them, or give the dotted path of a class.
+TRACING_EXPORTERS = env.list("TRACING_EXPORTERS", default=[])
+TRACING_JSONL_PATH = env.str("TRACING_JSONL_PATH", default=os.path.join(BASE_DIR, "traces.jsonl"))
+# Fraction of traces that are recorded
+TRACING_SAMPLE_RATE = env.float("TRACING_SAMPLE_RATE", default=0.1)
+# Append incoming platform events and governance process outcomes to this file, to replay them later with
+# the replay_events command (see policyengine/replay.py). Gzipped if the path ends in .gz. Off if empty.
+REPLAY_CAPTURE_PATH = env.str("REPLAY_CAPTURE_PATH", default="")
+# Explain traces of action evaluations, served at api/evaluation_trace/<action id> (see policyengine/explain.py).
+# Recorded for all communities if EVALUATION_EXPLAIN is set, or only for the ids in EVALUATION_EXPLAIN_COMMUNITIES.
+EVALUATION_EXPLAIN = env.bool("EVALUATION_EXPLAIN", default=False)
+EVALUATION_EXPLAIN_COMMUNITIES = env.list("EVALUATION_EXPLAIN_COMMUNITIES", cast=int, default=[])
+EVALUATION_EXPLAIN_MAX_ENTRIES = env.int("EVALUATION_EXPLAIN_MAX_ENTRIES", default=200)
+EVALUATION_EXPLAIN_TRACES_PER_ACTION = env.int("EVALUATION_EXPLAIN_TRACES_PER_ACTION", default=10)
+# The match keys of API calls made by this process are also kept in memory for this many seconds, so that the
+# events echoing them are recognized without a query (see policyengine/api_call_keys.py). Off if 0.
+LOG_API_CALL_RECENT_KEYS_TTL = env.int("LOG_API_CALL_RECENT_KEYS_TTL", default=120)
+LOG_API_CALL_RECENT_KEYS_MAX = env.int("LOG_API_CALL_RECENT_KEYS_MAX", default=10000)
+# Retention of log tables (see policyengine/retention.py). Expired rows are deleted every LOG_RETENTION_INTERVAL
+# seconds, LOG_RETENTION_BATCH_SIZE rows per transaction, for at most LOG_RETENTION_TIME_BUDGET seconds per run.
+LOG_RETENTION_INTERVAL = env.float("LOG_RETENTION_INTERVAL", default=300)
+LOG_RETENTION_BATCH_SIZE = env.int("LOG_RETENTION_BATCH_SIZE", default=1000)
+LOG_RETENTION_TIME_BUDGET = env.int("LOG_RETENTION_TIME_BUDGET", default=30)
+# Seconds LogAPICalls are kept, by default and by call type, e.g. "chat.postMessage=600;api/submit=3600".
+# Must be longer than the window in which platform events are matched with calls (up to 2 minutes for Reddit).
+LOG_API_CALL_RETENTION_SECONDS = env.int("LOG_API_CALL_RETENTION_SECONDS", default=3600)
+LOG_API_CALL_RETENTION_BY_CALL_TYPE = env.dict("LOG_API_CALL_RETENTION_BY_CALL_TYPE", cast={"value": int}, default={})
+# Days evaluation logs are kept, and maximum number of logs kept per community, by default and by community id,
+# e.g. "12=20000;15=1000". 0 keeps logs regardless of their age or number.
+EVALUATION_LOG_RETENTION_DAYS = env.int("EVALUATION_LOG_RETENTION_DAYS", default=30)
+EVALUATION_LOG_QUOTA = env.int("EVALUATION_LOG_QUOTA", default=5000)
+EVALUATION_LOG_QUOTA_BY_COMMUNITY = env.dict("EVALUATION_LOG_QUOTA_BY_COMMUNITY", cast={"value": int}, default={})
 
 LOGGING = {
     'version': 1,
@@ -302,12 +385,20 @@ CELERY_CACHE_BACKEND = 'django-cache'
 
 CELERY_BEAT_FREQUENCY = 60.0
 
+# Run tasks synchronously in tests, so dispatched shards are evaluated without a broker
+CELERY_TASK_ALWAYS_EAGER = TESTING
+
 CELERY_BEAT_SCHEDULE = {
     # Evaluate pending policy evaluations every minute
     "evaluate-pending-proposals-beat": {
         "task": "policyengine.tasks.evaluate_pending_proposals",
         "schedule": CELERY_BEAT_FREQUENCY,
     },
+    # Delete expired logs
+    "prune-logs-beat": {
+        "task": "policyengine.tasks.prune_logs",
+        "schedule": LOG_RETENTION_INTERVAL,
+    },
     # # Poll reddit for updates
     # "reddit-listener-beat": {
     #     "task": "integrations.reddit.tasks.reddit_listener_actions",
@@ -79,6 +79,7 @@ urlpatterns = [
     path('<slug:integration>/disable_integration', policyviews.disable_integration),
 
     url(r'^$', policyviews.homepage),
+    path('metrics', policyviews.metrics),
     url('^activity/', include('actstream.urls')),
     # webhook receivers
     path('api/hooks/<slug:plugin_name>', handle_incoming_webhook),
@@ -94,6 +95,8 @@ urlpatterns = [
     path('api/dashboard', policyapiviews.dashboard),
     path('api/community_doc', policyapiviews.community_doc),
     path('api/logs', policyapiviews.logs),
+    path('api/evaluation_trace/<int:action_id>', policyapiviews.evaluation_trace),
+    path('api/policy_stats', policyapiviews.policy_stats),
     path('api/settings', policyapiviews.settings),
 ]
 
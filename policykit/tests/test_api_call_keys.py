@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from policyengine import api_call_keys
+from policyengine.models import LogAPICall, LogAPICallKey
+
+import tests.utils as TestUtils
+
+
+class LogAPICallKeyTests(TestCase):
+    def setUp(self):
+        api_call_keys.clear()
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+
+    def tearDown(self):
+        api_call_keys.clear()
+
+    def test_matches_recent_calls(self):
+        LogAPICall.log_call(self.slack_community, "chat.postMessage", {"channel": "ABC", "text": "hello"})
+        self.assertTrue(LogAPICall.was_recently_made(self.slack_community, "chat.postMessage", "text", "hello", 2))
+        self.assertFalse(LogAPICall.was_recently_made(self.slack_community, "chat.postMessage", "text", "bye", 2))
+        self.assertFalse(LogAPICall.was_recently_made(self.slack_community, "pins.add", "text", "hello", 2))
+        self.assertFalse(LogAPICall.was_recently_made(self.slack_community, "chat.postMessage", "channel", "hello", 2))
+
+    def test_generic_calls_match_by_method_name(self):
+        LogAPICall.log_call(self.slack_community, "slack.method", {"method_name": "pins.add", "channel": "ABC"})
+        self.assertTrue(LogAPICall.was_recently_made(self.slack_community, "pins.add", "channel", "ABC", 2))
+        self.assertFalse(LogAPICall.was_recently_made(self.slack_community, "pins.remove", "channel", "ABC", 2))
+
+    def test_recent_calls_are_matched_without_queries(self):
+        LogAPICall.log_call(self.slack_community, "chat.postMessage", {"text": "hello"})
+        with self.assertNumQueries(0):
+            self.assertTrue(LogAPICall.was_recently_made(self.slack_community, "chat.postMessage", "text", "hello", 2))
+
+    @override_settings(LOG_API_CALL_RECENT_KEYS_TTL=0)
+    def test_matches_calls_made_by_other_processes(self):
+        log = LogAPICall.log_call(self.slack_community, "chat.postMessage", {"text": "hello"})
+        with self.assertNumQueries(1):
+            self.assertTrue(LogAPICall.was_recently_made(self.slack_community, "chat.postMessage", "text", "hello", 2))
+
+        # outside the window
+        LogAPICallKey.objects.filter(log=log).update(created_at=log.proposal_time - timedelta(seconds=10))
+        self.assertFalse(LogAPICall.was_recently_made(self.slack_community, "chat.postMessage", "text", "hello", 2))
+
+        # only calls made for the same community match
+        other_community, _ = TestUtils.create_slack_community_and_user(team_id="other", username="other")
+        LogAPICall.log_call(other_community, "chat.postMessage", {"text": "hello"})
+        self.assertFalse(LogAPICall.was_recently_made(self.slack_community, "chat.postMessage", "text", "hello", 2))
@@ -1,8 +1,11 @@
+from django.test import override_settings
 from rest_framework.test import APITestCase
 
 import tests.utils as TestUtils
 
-from policyengine.models import CommunityRole, Policy, CommunityDoc
+from integrations.slack.models import SlackPinMessage
+from policyengine import step_stats
+from policyengine.models import CommunityRole, Policy, CommunityDoc, PolicyStepStats, EvaluationTrace
 
 class MembersAPITestCase(APITestCase):
 
@@ -306,3 +309,86 @@ class DashboardAPITestCase(APITestCase):
 
 
 
+
+
+class PolicyStatsAPITestCase(APITestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED,
+            kind=Policy.PLATFORM,
+            community=self.slack_community.community,
+        )
+        step_stats.reset()
+
+    def test_get_policy_stats(self):
+        for _ in range(3):
+            SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        step_stats.flush()
+
+        self.client.force_login(user=self.user, backend="integrations.slack.auth_backends.SlackBackend")
+        response = self.client.get('/api/policy_stats')
+        self.assertEqual(response.status_code, 200)
+
+        stats = {s['step']: s for s in response.data['policy_stats'] if s['policy_id'] == self.policy.pk}
+        self.assertEqual(set(stats.keys()), {Policy.FILTER, 'initialize', Policy.CHECK, Policy.NOTIFY})
+        self.assertEqual(stats[Policy.CHECK]['count'], 3)
+        self.assertEqual(stats[Policy.CHECK]['errors'], 0)
+        self.assertIsNotNone(stats[Policy.CHECK]['p95_wall_time'])
+
+        # stats are aggregated into one row per policy step and hour
+        self.assertEqual(PolicyStepStats.objects.filter(policy=self.policy, step=Policy.CHECK).count(), 1)
+
+    @override_settings(POLICY_STEP_STATS_FLUSH_SECONDS=0)
+    def test_policy_stats_are_flushed_after_evaluation(self):
+        SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        # not while the steps run, in the evaluation's transaction
+        self.assertFalse(PolicyStepStats.objects.filter(policy=self.policy).exists())
+        step_stats.flush_if_due()
+        self.assertTrue(PolicyStepStats.objects.filter(policy=self.policy, step=Policy.CHECK).exists())
+
+
+class EvaluationTraceAPITestCase(APITestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED,
+            kind=Policy.PLATFORM,
+            community=self.slack_community.community,
+        )
+
+    def test_no_trace_when_explain_is_off(self):
+        action = SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        self.assertFalse(EvaluationTrace.objects.filter(action=action).exists())
+
+    @override_settings(EVALUATION_EXPLAIN=True)
+    def test_get_evaluation_trace(self):
+        action = SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+
+        self.client.force_login(user=self.user, backend="integrations.slack.auth_backends.SlackBackend")
+        response = self.client.get(f'/api/evaluation_trace/{action.pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['traces']), 1)
+
+        entries = response.data['traces'][0]['entries']
+        self.assertEqual(entries[0]['event'], 'candidates')
+        self.assertIn(self.policy.pk, [p['id'] for p in entries[0]['policies']])
+
+        steps = [e for e in entries if e['event'] == 'step']
+        self.assertEqual({e['step'] for e in steps}, {Policy.FILTER, 'initialize', Policy.CHECK, Policy.NOTIFY})
+        self.assertEqual(steps[0]['step'], Policy.FILTER)
+        self.assertEqual(steps[0]['result'], 'True')
+        self.assertTrue(all('queries' in e and 'duration_ms' in e for e in steps))
+
+        self.assertEqual(entries[-1]['event'], 'decision')
+        self.assertEqual(entries[-1]['policy'], self.policy.pk)
+        self.assertEqual(entries[-1]['status'], 'proposed')
+
+    @override_settings(EVALUATION_EXPLAIN=True)
+    def test_evaluation_trace_of_other_community(self):
+        action = SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        _, other_user = TestUtils.create_slack_community_and_user(team_id="other", username="other")
+
+        self.client.force_login(user=other_user, backend="integrations.slack.auth_backends.SlackBackend")
+        response = self.client.get(f'/api/evaluation_trace/{action.pk}')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,96 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from integrations.slack.models import SlackPinMessage
+from policyengine import data_session
+from policyengine.engine import PolicyCodeError, evaluate_proposal
+from policyengine.models import DataStore, Policy, Proposal
+
+import tests.utils as TestUtils
+
+
+class DataStoreSessionTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED,
+            kind=Policy.PLATFORM,
+            community=self.slack_community.community,
+        )
+
+    def evaluate(self, check):
+        self.policy.check = check
+        self.policy.save()
+        action = SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        return Proposal.objects.filter(action=action).first()
+
+    def data_store_updates(self, queries):
+        return [q for q in queries.captured_queries if q["sql"].startswith("UPDATE") and "policyengine_datastore" in q["sql"]]
+
+    def test_writes_are_flushed_once(self):
+        check = """
+for i in range(10):
+    proposal.data.set(f"key{i}", i)
+proposal.data.set("total", sum(proposal.data.get(f"key{i}") for i in range(10)))
+proposal.data.remove("key0")
+return PROPOSED
+"""
+        with CaptureQueriesContext(connection) as queries:
+            proposal = self.evaluate(check)
+        self.assertEqual(len(self.data_store_updates(queries)), 1)
+
+        data = DataStore.objects.get(pk=proposal.data_id)
+        self.assertEqual(data.get("total"), 45)
+        self.assertEqual(data.get("key9"), 9)
+        self.assertIsNone(data.get("key0"))
+
+    def test_writes_are_discarded_on_error(self):
+        proposal = self.evaluate("proposal.data.set('count', 1)\nreturn PROPOSED")
+        self.assertEqual(proposal.data.get("count"), 1)
+
+        proposal.policy.check = "proposal.data.set('count', 2)\nraise Exception('oops')"
+        proposal.policy.save()
+        with self.assertRaises(PolicyCodeError):
+            evaluate_proposal(proposal)
+        self.assertEqual(DataStore.objects.get(pk=proposal.data_id).get("count"), 1)
+
+    def test_flush_keeps_concurrent_changes(self):
+        data_store = DataStore.objects.create()
+        with data_session.session():
+            data_store.set("mine", [1])
+            # written by someone else while the session is open
+            DataStore.objects.filter(pk=data_store.pk).update(data_store={"theirs": True})
+            self.assertEqual(data_store.get("mine"), [1])
+        data_store.refresh_from_db()
+        self.assertEqual(data_store.get("mine"), [1])
+        self.assertTrue(data_store.get("theirs"))
+
+    def test_reads_return_copies(self):
+        data_store = DataStore.objects.create()
+        data_store.set("list", [1, 2])
+        data_store.get("list").append(3)
+        self.assertEqual(data_store.get("list"), [1, 2])
+
+    def test_key_level_writes(self):
+        data_store = DataStore.objects.create()
+        stale = DataStore.objects.get(pk=data_store.pk)
+        data_store.set("a", 1)
+        # a write through an instance that didn't see "a" keeps it
+        stale.set("b", 2)
+        stale.remove("missing")
+        self.assertEqual(DataStore.objects.get(pk=data_store.pk).data_store, {"a": 1, "b": 2})
+
+    def test_increment(self):
+        data_store = DataStore.objects.create()
+        other = DataStore.objects.get(pk=data_store.pk)
+        self.assertEqual(data_store.increment("votes"), 1)
+        self.assertEqual(other.increment("votes", 2), 3)
+        data_store.refresh_from_db()
+        with data_session.session():
+            data_store.increment("votes")
+            # an increment by someone else while the session is open is kept
+            data_session.apply_changes(data_store.pk, {"votes": (data_session.INCREMENT, 10)})
+            self.assertEqual(data_store.get("votes"), 4)
+        self.assertEqual(data_store.get("votes"), 14)
+        with self.assertRaises(TypeError):
+            data_store.increment("votes", "1")
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+from django.test import TestCase
+from integrations.slack.models import SlackPinMessage
+from policyengine import dirty_queue, engine
+from policyengine.models import BooleanVote, Policy, Proposal
+from policyengine.sweep import sweepable_proposals
+
+import tests.utils as TestUtils
+
+
+class DirtyProposalQueueTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.community = self.slack_community.community
+        self.policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED,
+            kind=Policy.PLATFORM,
+            community=self.community,
+        )
+        self.policy.check = """
+if proposal.get_yes_votes().count() >= 2:
+    return PASSED
+proposal.data.set("checked", True)
+return PROPOSED
+"""
+        self.policy.save()
+        action = SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        self.proposal = Proposal.objects.get(action=action)
+        self.assertEqual(self.proposal.status, Proposal.PROPOSED)
+        # the policy's own DataStore writes don't make the proposal dirty
+        self.assertIsNone(self.proposal.dirty_since)
+
+    def test_burst_of_votes_schedules_one_evaluation(self):
+        user2 = TestUtils.create_user_in_slack_community(self.slack_community, "user2")
+        with self.captureOnCommitCallbacks() as callbacks:
+            BooleanVote.objects.create(proposal=self.proposal, user=self.user, boolean_value=True)
+            BooleanVote.objects.create(proposal=self.proposal, user=user2, boolean_value=True)
+        self.assertEqual(len(callbacks), 1)
+
+        self.proposal.refresh_from_db()
+        self.assertIsNotNone(self.proposal.dirty_since)
+        # left to the scheduled evaluation by the sweep
+        self.assertFalse(sweepable_proposals().filter(pk=self.proposal.pk).exists())
+
+        # tasks are eager under tests, so this evaluates the proposal
+        callbacks[0]()
+        self.proposal.refresh_from_db()
+        self.assertEqual(self.proposal.status, Proposal.PASSED)
+        self.assertIsNone(self.proposal.dirty_since)
+
+    def test_data_store_change_marks_dirty(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.proposal.data.set("foo", "bar")
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        self.proposal.refresh_from_db()
+        self.assertEqual(self.proposal.status, Proposal.PROPOSED)
+        # evaluating wrote to the DataStore, but that didn't schedule another evaluation
+        self.assertIsNone(self.proposal.dirty_since)
+        self.assertTrue(self.proposal.data.get("checked"))
+
+    def test_stale_dirty_proposals_are_swept(self):
+        stale = datetime.now(timezone.utc) - timedelta(hours=1)
+        Proposal.objects.filter(pk=self.proposal.pk).update(dirty_since=stale)
+        self.assertTrue(sweepable_proposals().filter(pk=self.proposal.pk).exists())
+
+    def test_sweep_leaves_proposals_marked_dirty_after_loading_them(self):
+        swept = Proposal.objects.get(pk=self.proposal.pk)
+        with self.captureOnCommitCallbacks():
+            BooleanVote.objects.create(proposal=self.proposal, user=self.user, boolean_value=True)
+        self.assertFalse(dirty_queue.claim_dirty_proposal(swept))
+        # the scheduled evaluation claims it
+        self.assertTrue(dirty_queue.claim_dirty_proposal(Proposal.objects.get(pk=self.proposal.pk)))
+
+    def test_concurrent_evaluations_complete_the_proposal_once(self):
+        self.policy.check = "return PASSED"
+        self.policy.success = 'proposal.data.set("passes", (proposal.data.get("passes") or 0) + 1)'
+        self.policy.save()
+        # two workers loaded the proposal while it was pending
+        first = Proposal.objects.get(pk=self.proposal.pk)
+        second = Proposal.objects.get(pk=self.proposal.pk)
+
+        engine.evaluate_proposal(first)
+        engine.evaluate_proposal(second)
+        self.assertEqual(first.status, Proposal.PASSED)
+        self.assertEqual(second.status, Proposal.PROPOSED)
+        proposal = Proposal.objects.get(pk=self.proposal.pk)
+        self.assertEqual(proposal.status, Proposal.PASSED)
+        self.assertEqual(proposal.data.get("passes"), 1)
@@ -1,7 +1,10 @@
+from unittest import mock
+
 from constitution.models import PolicykitAddCommunityDoc, PolicykitAddRole
 from django.contrib.auth.models import Permission
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from integrations.slack.models import SlackPinMessage, SlackUser
+from policyengine import engine
 from policyengine.models import ActionType, CommunityRole, Policy, PolicyVariable, Proposal
 
 import tests.utils as TestUtils
@@ -225,6 +228,43 @@ class EvaluationTests(TestCase):
             action, expected_policy=first_policy, expected_did_execute=False, expected_status=Proposal.PASSED
         )
 
+    @override_settings(POLICY_FILTER_CONCURRENCY=4)
+    def test_concurrent_filters(self):
+        """Filters running concurrently still choose the first matching policy"""
+        policies = []
+        for filter_code in ["return True", "return True", "return False", "return False"]:
+            policies.append(
+                Policy.objects.create(
+                    **{**TestUtils.ALL_ACTIONS_PASS, "filter": filter_code},
+                    kind=Policy.PLATFORM,
+                    community=self.community,
+                )
+            )
+        action = self.new_slackpinmessage(community_origin=True)
+        eligible_policies = engine.get_eligible_policies(action)
+        self.assertEqual(eligible_policies, list(reversed(policies)))
+
+        proposal = engine.create_prefiltered_proposals(action, eligible_policies)
+        self.assertEqual(proposal.policy, policies[1])
+        self.assertIsNotNone(proposal.pk)
+        self.assertIsNotNone(action.pk)
+
+        proposals = engine.create_prefiltered_proposals(action, eligible_policies, allow_multiple=True)
+        self.assertEqual([p.policy for p in proposals], [policies[1], policies[0]])
+
+    @override_settings(POLICY_FILTER_CONCURRENCY=4)
+    def test_filters_run_serially_in_transactions(self):
+        """Filters don't run in pool threads inside a transaction, where they couldn't see its uncommitted rows"""
+        for _ in range(2):
+            Policy.objects.create(**TestUtils.ALL_ACTIONS_PASS, kind=Policy.PLATFORM, community=self.community)
+        action = self.new_slackpinmessage(community_origin=True)
+        eligible_policies = engine.get_eligible_policies(action)
+
+        # tests run in a transaction
+        with mock.patch.object(engine, "_get_filter_executor", side_effect=AssertionError):
+            proposals = engine.create_prefiltered_proposals(action, eligible_policies, allow_multiple=True)
+        self.assertEqual(len(proposals), 2)
+
     def test_policy_variable_evaluation(self):
         """Policy variables are evaluated correctly"""
         policy = Policy.objects.create(
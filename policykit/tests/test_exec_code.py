@@ -1,6 +1,14 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from integrations.slack.models import SlackPinMessage
-from policyengine.engine import EvaluationContext, PolicyCodeError, exec_code_block
+from policyengine.code_cache import compiled_code_cache
+from policyengine.engine import (
+    EvaluationContext,
+    EvaluationContextFactory,
+    PolicyCodeError,
+    PolicyStepBudgetExceeded,
+    context_argument_names,
+    exec_code_block,
+)
 from policyengine.models import Policy, Proposal
 from django_db_logger.models import EvaluationLog
 import tests.utils as TestUtils
@@ -90,6 +98,23 @@ def test(inst):
             execute_user_code(example, "test", MyClass())
         self.assertTrue("Restricted" in str(cm.exception))
 
+    def test_execute_globals_isolated(self):
+        """Test that globals written by one execution are not visible to the next one"""
+        example = """
+def test():
+    global leaked
+    leaked = 1
+    return leaked
+"""
+        self.assertEqual(execute_user_code(example, "test"), 1)
+
+        example = """
+def test():
+    return leaked
+"""
+        with self.assertRaises(NameError):
+            execute_user_code(example, "test")
+
 
 class ExecPolicyCodeTests(TestCase):
     """
@@ -156,3 +181,89 @@ class ExecPolicyCodeTests(TestCase):
         self.assertEqual(EvaluationLog.objects.filter(proposal=self.proposal, msg__contains="hello").count(), 1)
         exec_code_block("logger.error('world')", ctx)
         self.assertEqual(EvaluationLog.objects.filter(proposal=self.proposal, msg__contains="world").count(), 1)
+
+    def test_compiled_code_cache(self):
+        """Test that policy code is only compiled once, until the policy is changed"""
+        ctx = EvaluationContext(self.proposal)
+        compiled_code_cache.clear()
+
+        self.assertEqual(exec_code_block(self.policy.check, ctx, Policy.CHECK), "proposed")
+        self.assertEqual(exec_code_block(self.policy.check, ctx, Policy.CHECK), "proposed")
+        self.assertEqual(compiled_code_cache.stats()["misses"], 1)
+        self.assertEqual(compiled_code_cache.stats()["hits"], 1)
+
+        # changing the policy should not run the old compiled code
+        self.policy.check = "return PASSED"
+        self.policy.save()
+        self.assertEqual(exec_code_block(self.policy.check, ctx, Policy.CHECK), "passed")
+        self.assertEqual(compiled_code_cache.stats()["misses"], 2)
+
+        # syntax errors are not cached
+        with self.assertRaises(PolicyCodeError):
+            exec_code_block("import os", ctx, Policy.CHECK)
+        with self.assertRaises(PolicyCodeError):
+            exec_code_block("import os", ctx, Policy.CHECK)
+
+    @override_settings(
+        POLICY_STEP_WALL_TIME_BUDGET=0.2,
+        POLICY_STEP_CPU_TIME_BUDGET=0,
+        POLICY_STEP_INSTRUCTION_BUDGET=0,
+        POLICY_BUDGET_VIOLATIONS_BEFORE_DEGRADED=2,
+    )
+    def test_step_budget(self):
+        """Test that policy steps are stopped when they exceed their budget, and the policy marked degraded"""
+        ctx = EvaluationContext(self.proposal)
+
+        with self.assertRaises(PolicyStepBudgetExceeded) as cm:
+            exec_code_block("while True:\n  pass", ctx, Policy.CHECK)
+        self.assertIn("wall time budget", str(cm.exception))
+        # policy code can't catch the interrupt
+        with self.assertRaises(PolicyStepBudgetExceeded):
+            exec_code_block("while True:\n  try:\n    while True: pass\n  except:\n    pass", ctx, Policy.CHECK)
+        # comprehensions and generator expressions are checked on every item
+        with self.assertRaises(PolicyStepBudgetExceeded):
+            exec_code_block("return tuple(x for x in itertools.count() if x < 0)", ctx, Policy.CHECK)
+        self.policy.refresh_from_db()
+        self.assertEqual(self.policy.budget_violations, 3)
+        self.assertTrue(self.policy.is_degraded)
+
+        # steps within budget still work, and reset the count of violations
+        self.assertEqual(exec_code_block("return PASSED", ctx, Policy.CHECK), "passed")
+        self.policy.refresh_from_db()
+        self.assertEqual(self.policy.budget_violations, 0)
+
+        # a step that goes over budget without reaching a checkpoint keeps its result, but counts as a violation
+        with override_settings(POLICY_STEP_WALL_TIME_BUDGET=0.01):
+            self.assertEqual(exec_code_block("return len(sorted(range(5000000)))", ctx, Policy.CHECK), 5000000)
+        self.policy.refresh_from_db()
+        self.assertEqual(self.policy.budget_violations, 1)
+
+        with override_settings(POLICY_STEP_WALL_TIME_BUDGET=0, POLICY_STEP_INSTRUCTION_BUDGET=1000):
+            with self.assertRaises(PolicyStepBudgetExceeded) as cm:
+                exec_code_block("while True: pass", ctx, Policy.CHECK)
+            self.assertIn("instruction budget", str(cm.exception))
+            self.assertEqual(exec_code_block("return len(range(10))", ctx, Policy.CHECK), 10)
+
+    def test_context_argument_names(self):
+        """Test that the argument names used to warm the cache match the EvaluationContext"""
+        ctx = EvaluationContext(self.proposal)
+        self.assertEqual(tuple(ctx.__dict__.keys()), context_argument_names(["constitution", "slack"]))
+
+    def test_context_factory(self):
+        """Test that contexts created by one factory share the platform load but not the platform objects"""
+        factory = EvaluationContextFactory(self.slack_community.community)
+        other_proposal = Proposal.objects.create(action=self.action, policy=self.policy)
+
+        with self.assertNumQueries(0):
+            ctx1 = EvaluationContext(self.proposal, is_first_evaluation=True, factory=factory)
+            ctx2 = EvaluationContext(other_proposal, is_first_evaluation=True, factory=factory)
+
+        self.assertEqual(ctx1.slack, self.slack_community)
+        self.assertIsNot(ctx1.slack, ctx2.slack)
+        self.assertIsNot(ctx1.slack.community, ctx2.slack.community)
+        self.assertEqual(tuple(ctx1.__dict__.keys()), context_argument_names(["constitution", "slack"]))
+
+        # changes made during one evaluation don't leak into the next
+        ctx1.slack.team_id = "changed"
+        self.assertEqual(ctx2.slack.team_id, "ABC")
+        self.assertEqual(EvaluationContext(self.proposal, is_first_evaluation=True, factory=factory).slack.team_id, "ABC")
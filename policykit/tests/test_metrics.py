@@ -0,0 +1,46 @@
+import tempfile
+import time
+
+from django.test import TestCase, override_settings
+from integrations.slack.models import SlackPinMessage
+from policyengine import metrics
+from policyengine.models import Policy
+
+import tests.utils as TestUtils
+
+
+@override_settings(METRICS_TOKEN="secret", METRICS_MULTIPROCESS_DIR="")
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.community = self.slack_community.community
+        Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        metrics._collected.clear()
+
+    def test_metrics_require_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 401)
+
+    def test_metrics(self):
+        before = metrics._all_values()[metrics.proposal_evaluations.name].get(("proposed",), 0)
+        SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        after = metrics._all_values()[metrics.proposal_evaluations.name].get(("proposed",), 0)
+        self.assertEqual(after, before + 1)
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        self.assertIn("# TYPE policykit_proposal_evaluations_total counter", lines)
+        self.assertIn(f'policykit_pending_proposals{{community="{self.community.pk}"}} 1', lines)
+        self.assertTrue(any(line.startswith('policykit_policy_step_seconds_count{step="check"}') for line in lines))
+
+    def test_beat_tick_lag(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            METRICS_MULTIPROCESS_DIR=directory, CELERY_BEAT_FREQUENCY=60
+        ):
+            # the previous tick ran in another process, 90 seconds ago
+            metrics._swap_last_beat_tick(time.time() - 90)
+            metrics.record_beat_tick()
+            lag = metrics._all_values()[metrics.beat_tick_lag_seconds.name][()][0]
+            self.assertAlmostEqual(lag, 30, delta=5)
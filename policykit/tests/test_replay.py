@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from metagov.core.signals import platform_event_created
+from policyengine import replay
+from policyengine.metagov_app import metagov
+from policyengine.models import ActionType, Policy, Proposal, WebhookTriggerAction
+
+import tests.utils as TestUtils
+
+
+class ReplayTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.community = self.slack_community.community
+        self.metagov_community = metagov.get_community(self.community.metagov_slug)
+        self.plugin = self.metagov_community.enable_plugin("randomness", {"default_low": 2, "default_high": 200})
+
+        policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PASS,
+            kind=Policy.TRIGGER,
+            community=self.community,
+        )
+        policy.filter = "return action.event_type == 'randomness.ping'"
+        policy.check = "return PASSED if action.event_data['n'] % 2 == 0 else FAILED"
+        policy.success = "metagov.perform_action('randomness.random-int', low=1, high=2)"
+        policy.save()
+        policy.action_types.add(ActionType.objects.create(codename="WebhookTriggerAction"))
+
+        fd, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def send_event(self, n):
+        platform_event_created.send(
+            sender=type(self.plugin),
+            instance=self.plugin,
+            event_type="ping",
+            data={"n": n},
+            initiator={"user_id": "alice", "provider": "randomness"},
+        )
+
+    def test_capture_and_replay(self):
+        with override_settings(REPLAY_CAPTURE_PATH=self.path):
+            for n in range(4):
+                self.send_event(n)
+        self.assertEqual(WebhookTriggerAction.objects.count(), 4)
+
+        records = replay.read_records([self.path])
+        self.assertEqual([record["type"] for record in records], [replay.EVENT] * 4)
+
+        report = replay.replay([self.path])
+        self.assertEqual(report["events"], 4)
+        self.assertEqual(report["errors"], 0)
+        self.assertEqual(report["proposal_states"], {Proposal.PASSED: 2, Proposal.FAILED: 2})
+        self.assertEqual([p["status"] for p in report["proposals"]], ["passed", "failed", "passed", "failed"])
+        self.assertIsNotNone(report["latency_p99_ms"])
+        # platform calls went to the fake Metagov
+        self.assertEqual(report["platform_calls"], 2)
+
+        # the replay was rolled back, and wasn't captured again
+        self.assertEqual(WebhookTriggerAction.objects.count(), 4)
+        self.assertEqual(len(replay.read_records([self.path])), 4)
+
+    def test_replay_other_community(self):
+        with override_settings(REPLAY_CAPTURE_PATH=self.path):
+            self.send_event(0)
+
+        report = replay.replay([self.path], community="not-a-community")
+        self.assertEqual(report["events"], 0)
+        self.assertEqual(report["skipped"], 1)
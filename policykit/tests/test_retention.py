@@ -0,0 +1,107 @@
+import importlib.util
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import policykit.settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django_db_logger.models import EvaluationLog
+from policyengine import retention
+from policyengine.models import Community, LogAPICall, LogAPICallKey
+
+import tests.utils as TestUtils
+
+
+class LogAPICallRetentionTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+
+    def log_call(self, call, age):
+        log = LogAPICall.log_call(self.slack_community, call, {"text": "hello"})
+        LogAPICall.objects.filter(pk=log.pk).update(proposal_time=datetime.now(timezone.utc) - timedelta(seconds=age))
+        return log
+
+    @override_settings(LOG_API_CALL_RETENTION_SECONDS=600, LOG_API_CALL_RETENTION_BY_CALL_TYPE={"pins.add": 60})
+    def test_prunes_expired_calls(self):
+        expired = [self.log_call("chat.postMessage", 700), self.log_call("pins.add", 120)]
+        kept = [self.log_call("chat.postMessage", 120), self.log_call("pins.add", 30)]
+
+        self.assertEqual(retention.prune_logs()["log_api_call"], 2)
+        self.assertEqual(set(LogAPICall.objects.values_list("pk", flat=True)), {log.pk for log in kept})
+        self.assertFalse(LogAPICallKey.objects.filter(log_id__in=[log.pk for log in expired]).exists())
+
+    @override_settings(LOG_API_CALL_RETENTION_SECONDS=600)
+    def test_deletes_in_batches(self):
+        for _ in range(5):
+            self.log_call("chat.postMessage", 700)
+        queryset = LogAPICall.objects.all()
+        deleted = retention.delete_in_batches(queryset, ["proposal_time", "pk"], time.monotonic() + 60, batch_size=2)
+        self.assertEqual(deleted, 5)
+
+        self.log_call("chat.postMessage", 700)
+        # out of time
+        self.assertEqual(retention.delete_in_batches(queryset, ["pk"], time.monotonic() - 1), 0)
+        self.assertEqual(retention.estimated_row_count(LogAPICall), 1)
+
+
+class EvaluationLogRetentionTests(TestCase):
+    def setUp(self):
+        self.slack_community, _ = TestUtils.create_slack_community_and_user()
+        self.community = self.slack_community.community
+        self.other_community = Community.objects.create()
+
+    def create_logs(self, community, count, age_days=0):
+        # distinct times, oldest first
+        now = datetime.now(timezone.utc) - timedelta(days=age_days)
+        pks = []
+        for number in range(count):
+            log = EvaluationLog.objects.create(community=community, logger_name="db", msg=f"log {number}")
+            EvaluationLog.objects.filter(pk=log.pk).update(create_datetime=now - timedelta(seconds=count - number))
+            pks.append(log.pk)
+        return pks
+
+    def prune(self):
+        return retention.prune_evaluation_logs(time.monotonic() + 60)
+
+    @override_settings(EVALUATION_LOG_QUOTA=3, EVALUATION_LOG_RETENTION_DAYS=0)
+    def test_quota_per_community(self):
+        chatty = self.create_logs(self.community, 10)
+        quiet = self.create_logs(self.other_community, 2)
+
+        self.assertEqual(self.prune(), 7)
+        self.assertEqual(set(EvaluationLog.objects.filter(community=self.community).values_list("pk", flat=True)), set(chatty[-3:]))
+        # the chatty community doesn't evict the logs of the others
+        self.assertEqual(EvaluationLog.objects.filter(community=self.other_community).count(), len(quiet))
+        self.assertEqual(self.prune(), 0)
+
+        with override_settings(EVALUATION_LOG_QUOTA_BY_COMMUNITY={str(self.community.pk): 1}):
+            self.assertEqual(self.prune(), 2)
+        self.assertEqual(list(EvaluationLog.objects.filter(community=self.community).values_list("pk", flat=True)), chatty[-1:])
+
+    @override_settings(EVALUATION_LOG_QUOTA=0, EVALUATION_LOG_RETENTION_DAYS=30)
+    def test_expiry(self):
+        self.create_logs(self.community, 3, age_days=31)
+        self.create_logs(None, 2, age_days=31)
+        recent = self.create_logs(self.community, 2)
+
+        self.assertEqual(self.prune(), 5)
+        self.assertEqual(list(EvaluationLog.objects.order_by("pk").values_list("pk", flat=True)), recent)
+
+
+class RetentionSettingsTests(SimpleTestCase):
+    def load_settings(self, **environ):
+        """Import a fresh copy of the settings module with the given environment variables set"""
+        spec = importlib.util.spec_from_file_location("retention_test_settings", policykit.settings.__file__)
+        module = importlib.util.module_from_spec(spec)
+        with mock.patch.dict(os.environ, environ):
+            spec.loader.exec_module(module)
+        return module
+
+    def test_retention_by_call_type(self):
+        module = self.load_settings(LOG_API_CALL_RETENTION_BY_CALL_TYPE="chat.postMessage=600;api/submit=3600")
+        self.assertEqual(module.LOG_API_CALL_RETENTION_BY_CALL_TYPE, {"chat.postMessage": 600, "api/submit": 3600})
+
+    def test_quota_by_community(self):
+        module = self.load_settings(EVALUATION_LOG_QUOTA_BY_COMMUNITY="12=20000;15=1000")
+        self.assertEqual(module.EVALUATION_LOG_QUOTA_BY_COMMUNITY, {"12": 20000, "15": 1000})
@@ -0,0 +1,91 @@
+from django.test import TestCase
+from integrations.slack.models import SlackPinMessage, SlackPostMessage
+from policyengine import engine, routing
+from policyengine.models import ActionType, Community, Policy
+
+import tests.utils as TestUtils
+
+
+class PolicyRoutingTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.community = self.slack_community.community
+        self.base_policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PASS, kind=Policy.PLATFORM, community=self.community
+        )
+        self.pin_policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PASS, kind=Policy.PLATFORM, community=self.community
+        )
+        self.pin_policy.action_types.add(ActionType.objects.get_or_create(codename="slackpinmessage")[0])
+
+    def routing_versions(self):
+        return dict(Community.objects.values_list("pk", "policy_routing_version"))
+
+    def test_eligible_policies(self):
+        pin = SlackPinMessage(initiator=self.user, community=self.slack_community)
+        post = SlackPostMessage(initiator=self.user, community=self.slack_community)
+        # most recently modified first
+        self.assertEqual(engine.get_eligible_policies(pin), [self.pin_policy, self.base_policy])
+        self.assertEqual(engine.get_eligible_policies(post), [self.base_policy])
+
+    def test_routing_table_is_cached(self):
+        pin = SlackPinMessage(initiator=self.user, community=self.slack_community)
+        engine.get_eligible_policies(pin)
+        # the policies and the routing version are loaded with one query
+        with self.assertNumQueries(1):
+            policies = engine.get_eligible_policies(pin)
+        self.assertEqual(policies, [self.pin_policy, self.base_policy])
+
+    def test_changes_from_other_processes_are_seen(self):
+        post = SlackPostMessage(initiator=self.user, community=self.slack_community)
+        table = routing.get_routing_table(self.community.pk)
+        self.assertEqual(engine.get_eligible_policies(post), [self.base_policy])
+
+        self.pin_policy.action_types.add(ActionType.objects.get_or_create(codename="slackpostmessage")[0])
+        # another process still has the table from before the change
+        routing._tables[self.community.pk] = table
+        self.assertEqual(engine.get_eligible_policies(post), [self.pin_policy, self.base_policy])
+
+        # the community loaded with a policy gets the new version, so saving it doesn't revert the version
+        policy = Policy.objects.select_related("community").get(pk=self.pin_policy.pk)
+        version = policy.community.policy_routing_version
+        policy.save()
+        policy.community.save()
+        self.community.refresh_from_db()
+        self.assertEqual(self.community.policy_routing_version, version + 1)
+
+    def test_only_affected_communities_are_invalidated(self):
+        other_community = Community.objects.create()
+        action_type = ActionType.objects.get_or_create(codename="slackpostmessage")[0]
+        before = self.routing_versions()
+
+        action_type.policy_set.add(self.pin_policy)
+        after = self.routing_versions()
+        self.assertEqual(after[self.community.pk], before[self.community.pk] + 1)
+        self.assertEqual(after[other_community.pk], before[other_community.pk])
+
+        action_type.policy_set.clear()
+        self.assertEqual(self.routing_versions()[self.community.pk], after[self.community.pk] + 1)
+
+        action_type.policy_set.add(self.pin_policy)
+        after = self.routing_versions()
+        action_type.delete()
+        self.assertEqual(self.routing_versions()[self.community.pk], after[self.community.pk] + 1)
+        self.assertEqual(self.routing_versions()[other_community.pk], before[other_community.pk])
+
+    def test_routing_table_is_invalidated(self):
+        table = routing.get_routing_table(self.community.pk)
+        self.assertEqual(table.policy_ids(Policy.PLATFORM, "slackpostmessage"), [self.base_policy.pk])
+
+        self.pin_policy.action_types.add(ActionType.objects.get_or_create(codename="slackpostmessage")[0])
+        table = routing.get_routing_table(self.community.pk)
+        self.assertEqual(table.policy_ids(Policy.PLATFORM, "slackpostmessage"), [self.pin_policy.pk, self.base_policy.pk])
+
+        self.pin_policy.is_active = False
+        self.pin_policy.save()
+        table = routing.get_routing_table(self.community.pk)
+        self.assertEqual(table.policy_ids(Policy.PLATFORM, "slackpostmessage"), [self.base_policy.pk])
+
+        self.base_policy.delete()
+        table = routing.get_routing_table(self.community.pk)
+        self.assertEqual(table.policy_ids(Policy.PLATFORM, "slackpostmessage"), [])
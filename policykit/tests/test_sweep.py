@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from integrations.slack.models import SlackPinMessage, SlackUser
+from policyengine.models import EvaluationShard, Policy, Proposal
+from policyengine.sweep import (
+    iter_pending_proposal_chunks,
+    pending_proposal_shards,
+    shard_key_for_community,
+    sweepable_proposals,
+)
+from policyengine.tasks import evaluate_pending_proposals, evaluate_proposal_shard
+
+import tests.utils as TestUtils
+
+
+class PendingProposalSweepTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.community = self.slack_community.community
+        self.policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED,
+            kind=Policy.PLATFORM,
+            community=self.community,
+        )
+
+    def create_pending_proposals(self, count):
+        for _ in range(count):
+            SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+
+    def load_and_touch(self, chunk_size):
+        """Load all pending proposals and access everything the engine reads. Returns the number of queries."""
+        with CaptureQueriesContext(connection) as queries:
+            proposals = []
+            for chunk, platforms_by_community in iter_pending_proposal_chunks(chunk_size=chunk_size):
+                for proposal in chunk:
+                    self.assertIn(proposal.action.community, platforms_by_community[self.community.pk])
+                    proposal.policy.community
+                    proposal.action.community.community_name
+                    proposal.action.community.community
+                    proposal.action.initiator.username
+                    proposal.governance_process
+                    proposal.data
+                    proposals.append(proposal)
+        return proposals, len(queries)
+
+    def test_chunks_in_pk_order(self):
+        self.create_pending_proposals(5)
+        chunks = [[p.pk for p in chunk] for chunk, _ in iter_pending_proposal_chunks(chunk_size=2)]
+        self.assertEqual([len(c) for c in chunks], [2, 2, 1])
+        all_pks = [pk for c in chunks for pk in c]
+        self.assertEqual(all_pks, sorted(all_pks))
+        pending = Proposal.objects.filter(status=Proposal.PROPOSED).order_by("pk")
+        self.assertEqual(all_pks, list(pending.values_list("pk", flat=True)))
+
+    def test_related_objects_are_resolved(self):
+        self.create_pending_proposals(1)
+        proposals, _ = self.load_and_touch(chunk_size=10)
+        proposal = proposals[0]
+        self.assertIsInstance(proposal.action, SlackPinMessage)
+        self.assertIsInstance(proposal.action.initiator, SlackUser)
+        self.assertEqual(proposal.action.community, self.slack_community)
+        self.assertEqual(proposal.action.community.community, self.community)
+
+    def test_query_count_does_not_grow_with_proposals(self):
+        self.create_pending_proposals(2)
+        _, few_queries = self.load_and_touch(chunk_size=100)
+
+        self.create_pending_proposals(20)
+        proposals, many_queries = self.load_and_touch(chunk_size=100)
+        self.assertEqual(len(proposals), 22)
+        self.assertEqual(few_queries, many_queries)
+        # aggregate, proposals, actions (base + subclass), initiators (base + subclass), platforms (base + subclasses)
+        self.assertLessEqual(many_queries, 10)
+
+    def test_evaluate_pending_proposals(self):
+        self.create_pending_proposals(3)
+        self.policy.check = "return PASSED"
+        self.policy.save()
+        evaluate_pending_proposals()
+        self.assertEqual(Proposal.objects.filter(policy=self.policy, status=Proposal.PASSED).count(), 3)
+        self.assertFalse(Proposal.objects.filter(status=Proposal.PROPOSED).exists())
+
+    def test_shard_keys(self):
+        self.assertEqual(shard_key_for_community(7, shard_count=0), "community-7")
+        self.assertEqual(shard_key_for_community(7, shard_count=4), "hash-3")
+
+        self.create_pending_proposals(2)
+        self.assertEqual(pending_proposal_shards(shard_count=0), {f"community-{self.community.pk}": [self.community.pk]})
+
+    def test_shard_lease(self):
+        token = EvaluationShard.acquire_lease("community-1", lease_seconds=60)
+        self.assertIsNotNone(token)
+        # can't dispatch a shard that is still running
+        self.assertIsNone(EvaluationShard.acquire_lease("community-1", lease_seconds=60))
+        self.assertTrue(EvaluationShard.start("community-1", token))
+
+        # starting and renewing extend the lease from now, as long as it's held with the token
+        EvaluationShard.objects.filter(shard_key="community-1").update(lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=5))
+        self.assertTrue(EvaluationShard.renew_lease("community-1", token, lease_seconds=60))
+        shard = EvaluationShard.objects.get(shard_key="community-1")
+        self.assertGreater(shard.lease_expires_at, datetime.now(timezone.utc) + timedelta(seconds=30))
+        self.assertFalse(EvaluationShard.renew_lease("community-1", "other token", lease_seconds=60))
+
+        EvaluationShard.release_lease("community-1", token, {"evaluated": 1})
+        shard = EvaluationShard.objects.get(shard_key="community-1")
+        self.assertEqual(shard.last_result, {"evaluated": 1})
+        self.assertIsNotNone(shard.finished_at)
+
+        # expired leases can be taken over, and the old token is no longer valid
+        stale_token = EvaluationShard.acquire_lease("community-1", lease_seconds=-1)
+        new_token = EvaluationShard.acquire_lease("community-1", lease_seconds=60)
+        self.assertIsNotNone(new_token)
+        self.assertFalse(EvaluationShard.start("community-1", stale_token))
+        self.assertFalse(EvaluationShard.renew_lease("community-1", stale_token))
+        self.assertFalse(EvaluationShard.release_lease("community-1", stale_token))
+
+    def test_leased_shard_is_not_dispatched(self):
+        self.create_pending_proposals(2)
+        self.policy.check = "return PASSED"
+        self.policy.save()
+
+        shard_key = shard_key_for_community(self.community.pk)
+        token = EvaluationShard.acquire_lease(shard_key, lease_seconds=60)
+        evaluate_pending_proposals()
+        self.assertEqual(Proposal.objects.filter(status=Proposal.PROPOSED).count(), 2)
+
+        EvaluationShard.release_lease(shard_key, token)
+        evaluate_pending_proposals()
+        self.assertEqual(Proposal.objects.filter(status=Proposal.PROPOSED).count(), 0)
+        self.assertEqual(EvaluationShard.objects.get(shard_key=shard_key).last_result["evaluated"], 2)
+
+    def test_shard_stops_when_lease_is_lost(self):
+        self.create_pending_proposals(2)
+        self.policy.check = "return PASSED"
+        self.policy.save()
+
+        shard_key = shard_key_for_community(self.community.pk)
+        token = EvaluationShard.acquire_lease(shard_key, lease_seconds=60)
+        # the lease taken when the task starts expires right away, so it can't be renewed before the first proposal
+        with override_settings(PROPOSAL_SHARD_LEASE_SECONDS=0):
+            evaluate_proposal_shard(shard_key, [self.community.pk], token)
+        self.assertEqual(Proposal.objects.filter(status=Proposal.PROPOSED).count(), 2)
+        self.assertTrue(EvaluationShard.objects.get(shard_key=shard_key).last_result["lease_lost"])
+
+    def test_wake_up_time(self):
+        self.policy.check = """
+proposal.check_again_after(datetime.timedelta(hours=2))
+proposal.check_again_after(datetime.timedelta(hours=1))
+return PROPOSED
+"""
+        self.policy.save()
+        self.create_pending_proposals(1)
+        proposal = Proposal.objects.get(policy=self.policy)
+
+        # the earliest declared time is used
+        self.assertIsNotNone(proposal.next_evaluation_at)
+        self.assertLess(proposal.next_evaluation_at, datetime.now(timezone.utc) + timedelta(hours=1, minutes=1))
+        self.assertFalse(sweepable_proposals().filter(pk=proposal.pk).exists())
+
+        # due wake-ups are swept
+        Proposal.objects.filter(pk=proposal.pk).update(next_evaluation_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+        self.assertTrue(sweepable_proposals().filter(pk=proposal.pk).exists())
+
+        # editing the policy drops the wake-up time
+        Proposal.objects.filter(pk=proposal.pk).update(next_evaluation_at=datetime.now(timezone.utc) + timedelta(hours=1))
+        self.policy.check = "return PROPOSED"
+        self.policy.save()
+        proposal.refresh_from_db()
+        self.assertIsNone(proposal.next_evaluation_at)
@@ -0,0 +1,45 @@
+from django.test import TestCase, override_settings
+from integrations.slack.models import SlackPinMessage
+from policyengine import tracing
+from policyengine.models import Policy
+
+import tests.utils as TestUtils
+
+
+class CollectingExporter:
+    spans = []
+
+    def export(self, span):
+        CollectingExporter.spans.append(span)
+
+
+@override_settings(TRACING_EXPORTERS=["tests.test_tracing.CollectingExporter"], TRACING_SAMPLE_RATE=1.0)
+class TracingTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.slack_community.community
+        )
+        CollectingExporter.spans = []
+
+    def test_action_evaluation_is_traced(self):
+        SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+
+        spans = {span.name: span for span in CollectingExporter.spans}
+        self.assertTrue({"GovernableAction.save", "evaluate_action", "policy.filter", "policy.check"} <= spans.keys())
+        root = spans["GovernableAction.save"]
+        self.assertIsNone(root.parent_id)
+        self.assertEqual({span.trace_id for span in CollectingExporter.spans}, {root.trace_id})
+        self.assertEqual(spans["evaluate_action"].parent_id, root.span_id)
+        self.assertIsNone(tracing.current_span())
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(ValueError):
+            with tracing.span("failing"):
+                raise ValueError("oops")
+        self.assertEqual(CollectingExporter.spans[0].error, "ValueError: oops")
+
+    @override_settings(TRACING_SAMPLE_RATE=0)
+    def test_sampling(self):
+        SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        self.assertEqual(CollectingExporter.spans, [])
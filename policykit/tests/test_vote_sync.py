@@ -0,0 +1,90 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from integrations.slack.models import SlackPinMessage, SlackUser
+from metagov.core.models import GovernanceProcess
+from policyengine import vote_sync
+from policyengine.metagov_app import metagov
+from policyengine.models import BooleanVote, Policy, Proposal, SelectVote, VoteOutcomeSnapshot
+
+import tests.utils as TestUtils
+
+
+class VoteSyncTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED,
+            kind=Policy.PLATFORM,
+            community=self.slack_community.community,
+        )
+        self.proposal = self.new_proposal()
+
+    def new_proposal(self):
+        action = SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        return Proposal.objects.get(action=action)
+
+    def get_users(self, user_ids):
+        return vote_sync.get_or_create_users(SlackUser, self.slack_community, user_ids)
+
+    def test_boolean_votes(self):
+        votes = {"yes": {"users": ["u1", "u2"]}, "no": {"users": []}}
+        self.assertEqual(vote_sync.sync_option_votes(self.proposal, votes, self.get_users), (2, 0))
+        self.assertEqual(SlackUser.objects.filter(username__in=["u1", "u2"]).count(), 2)
+
+        votes = {"yes": {"users": ["u1"]}, "no": {"users": ["u2", "u3"]}}
+        self.assertEqual(vote_sync.sync_option_votes(self.proposal, votes, self.get_users), (1, 1))
+        # nothing changed
+        self.assertEqual(vote_sync.sync_option_votes(self.proposal, votes, self.get_users), (0, 0))
+
+        self.assertEqual(self.proposal.get_yes_votes().count(), 1)
+        self.assertEqual(self.proposal.get_no_votes().count(), 2)
+        self.assertEqual(self.proposal.get_vote_counts(), {"boolean": {"yes": 1, "no": 2}})
+
+    def test_select_votes(self):
+        votes = {"u1": {"alice": "1", "bob": "2"}, "u2": {"alice": "2"}}
+        self.assertEqual(vote_sync.sync_select_votes(self.proposal, votes, self.get_users), (3, 0))
+        votes["u2"]["alice"] = "1"
+        self.assertEqual(vote_sync.sync_select_votes(self.proposal, votes, self.get_users), (0, 1))
+
+        self.assertEqual(SelectVote.objects.filter(proposal=self.proposal).count(), 3)
+        self.assertEqual(self.proposal.get_select_vote_counts(), {"alice": {"1": 2}, "bob": {"2": 1}})
+
+    def test_queries_dont_grow_with_voters(self):
+        def sync_queries(proposal, user_ids):
+            vote_sync.sync_option_votes(proposal, {"yes": {"users": user_ids}, "no": {"users": []}}, self.get_users)
+            # change every vote
+            with CaptureQueriesContext(connection) as queries:
+                vote_sync.sync_option_votes(proposal, {"yes": {"users": []}, "no": {"users": user_ids}}, self.get_users)
+            return len(queries)
+
+        few = [f"u{number}" for number in range(3)]
+        many = [f"u{number}" for number in range(30)]
+        self.get_users(many)
+        self.assertEqual(sync_queries(self.proposal, few), sync_queries(self.new_proposal(), many))
+        self.assertEqual(BooleanVote.objects.filter(boolean_value=False).count(), len(few) + len(many))
+
+    def test_unchanged_outcomes_are_skipped(self):
+        plugin = metagov.get_community(self.slack_community.community.metagov_slug).enable_plugin(
+            "randomness", {"default_low": 2, "default_high": 200}
+        )
+        self.proposal.governance_process = GovernanceProcess.objects.create(name="vote", plugin=plugin)
+        self.proposal.save()
+
+        votes = {"yes": {"users": ["u1", "u2"]}, "no": {"users": ["u3"]}}
+        self.assertEqual(vote_sync.sync_option_votes(self.proposal, votes, self.get_users), (3, 0))
+        with self.assertNumQueries(1):
+            self.assertEqual(vote_sync.sync_option_votes(self.proposal, votes, self.get_users), (0, 0))
+
+        # only the user whose vote changed is looked up
+        looked_up = []
+
+        def get_users(user_ids):
+            looked_up.extend(user_ids)
+            return self.get_users(user_ids)
+
+        votes = {"yes": {"users": ["u1"]}, "no": {"users": ["u2", "u3"]}}
+        self.assertEqual(vote_sync.sync_option_votes(self.proposal, votes, get_users), (0, 1))
+        self.assertEqual(looked_up, ["u2"])
+        self.assertEqual(self.proposal.get_vote_counts(), {"boolean": {"yes": 1, "no": 2}})
+        self.assertEqual(VoteOutcomeSnapshot.objects.get(process=self.proposal.governance_process).vote_type, "BooleanVote")
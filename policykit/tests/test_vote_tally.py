@@ -0,0 +1,82 @@
+from django.test import TestCase
+from integrations.slack.models import SlackPinMessage
+from policyengine.models import BooleanVote, ChoiceVote, NumberVote, Policy, Proposal, SelectVote, VoteTally
+
+import tests.utils as TestUtils
+
+
+class VoteTallyTests(TestCase):
+    def setUp(self):
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.user2 = TestUtils.create_user_in_slack_community(self.slack_community, "user2")
+        self.user3 = TestUtils.create_user_in_slack_community(self.slack_community, "user3")
+        Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED,
+            kind=Policy.PLATFORM,
+            community=self.slack_community.community,
+        )
+        action = SlackPinMessage.objects.create(initiator=self.user, community=self.slack_community, community_origin=True)
+        self.proposal = Proposal.objects.get(action=action)
+
+    def test_boolean_votes(self):
+        self.assertEqual(self.proposal.get_yes_vote_count(), 0)
+        vote = BooleanVote.objects.create(proposal=self.proposal, user=self.user, boolean_value=True)
+        BooleanVote.objects.create(proposal=self.proposal, user=self.user2, boolean_value=True)
+        BooleanVote.objects.create(proposal=self.proposal, user=self.user3, boolean_value=False)
+        self.assertEqual(self.proposal.get_yes_vote_count(), 2)
+        self.assertEqual(self.proposal.get_no_vote_count(), 1)
+
+        # changing a vote moves it, whether it was loaded or created in this process
+        vote.boolean_value = False
+        vote.save()
+        loaded = BooleanVote.objects.get(user=self.user2)
+        loaded.boolean_value = False
+        loaded.save()
+        self.assertEqual(self.proposal.get_yes_vote_count(), 0)
+        self.assertEqual(self.proposal.get_no_vote_count(), 3)
+
+        BooleanVote.objects.filter(user=self.user3).delete()
+        self.assertEqual(self.proposal.get_vote_counts(), {"boolean": {"no": 2}})
+        self.assertEqual(self.proposal.get_no_vote_count(), self.proposal.get_no_votes().count())
+
+    def test_other_vote_types(self):
+        ChoiceVote.objects.create(proposal=self.proposal, user=self.user, value="red")
+        ChoiceVote.objects.create(proposal=self.proposal, user=self.user2, value="red")
+        NumberVote.objects.create(proposal=self.proposal, user=self.user, number_value=3)
+        SelectVote.objects.create(proposal=self.proposal, user=self.user, candidate="alice", option="1")
+        SelectVote.objects.create(proposal=self.proposal, user=self.user2, candidate="alice", option="1")
+        SelectVote.objects.create(proposal=self.proposal, user=self.user2, candidate="bob", option="2")
+
+        self.assertEqual(self.proposal.get_choice_vote_counts(), {"red": 2})
+        self.assertEqual(self.proposal.get_number_vote_counts(), {3: 1})
+        # the counts kept as votes are cast are the same as counting the votes again
+        counts = self.proposal.get_vote_counts()
+        self.assertEqual(VoteTally.rebuild(self.proposal.pk).counts, counts)
+        self.assertEqual(self.proposal.get_select_vote_counts(), {"alice": {"1": 2}, "bob": {"2": 1}})
+        by_candidates = self.proposal.get_select_votes_by_candidates()
+        self.assertEqual(sorted(by_candidates["alice"]["1"]), sorted([self.user.username, "user2"]))
+        self.assertEqual(by_candidates["bob"], {"2": ["user2"]})
+        self.assertEqual(self.proposal.get_voters(), {self.user.username, "user2"})
+        self.assertEqual(self.proposal.get_voters("number"), {self.user.username})
+
+        SelectVote.objects.filter(candidate="bob").delete()
+        self.assertEqual(self.proposal.get_select_vote_counts(), {"alice": {"1": 2}})
+
+    def test_reading_counts_is_one_query(self):
+        BooleanVote.objects.bulk_create(
+            BooleanVote(proposal=self.proposal, user=user, boolean_value=True)
+            for user in (self.user, self.user2, self.user3)
+        )
+        # bulk_create doesn't send signals, so the tally needs a rebuild
+        self.assertEqual(self.proposal.get_yes_vote_count(), 0)
+        VoteTally.rebuild(self.proposal.pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.proposal.get_yes_vote_count(), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.proposal.get_select_votes_by_candidates()), 0)
+
+    def test_deleting_the_proposal(self):
+        BooleanVote.objects.create(proposal=self.proposal, user=self.user, boolean_value=True)
+        self.proposal.delete()
+        self.assertFalse(VoteTally.objects.exists())